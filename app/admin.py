@@ -121,7 +121,9 @@ class LendingAdmin(admin.ModelAdmin):
                 return qs.filter(seller=request.user)
         return qs
 admin.site.register(Category)
+admin.site.register(ExpenseCategory)
 admin.site.register(Sale)
+admin.site.register(Receipt)
 
 class VideoQollanmaAdmin(admin.ModelAdmin):
     list_display = ('title', 'youtube_link', 'img')  # Ko'rsatmoqchi bo'lgan maydonlar
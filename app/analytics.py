@@ -0,0 +1,236 @@
+"""
+Umumiy analitika so'rovi: metrikalar x o'lchovlar x filtrlar (oq ro'yxat bo'yicha).
+
+Har bir manba (sotuv rollupi, ijara rollupi, chiqimlar) uchun GROUP BY queryset quriladi,
+ular UNION ALL bilan bitta SQL so'roviga birlashtiriladi va natija ustunli JSON ga yig'iladi.
+"""
+from datetime import timedelta
+
+from django.db import models
+from django.db.models import Sum, F, Q, Value, ExpressionWrapper, DecimalField
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .models import CashWithdrawal, SaleDailyRollup, LendingDailyRollup
+from .statistics import parse_local_date, period_range
+
+
+SALES, LENDINGS, EXPENSES = 'sales', 'lendings', 'expenses'
+
+# metrika: (manba, agregat ifoda)
+METRICS = {
+    'revenue': (SALES, Sum('revenue')),
+    'quantity': (SALES, Sum('quantity')),
+    'weight': (SALES, Sum('weight')),
+    'sale_count': (SALES, Sum('sale_count')),
+    'lend_count': (LENDINGS, Sum('lend_count')),
+    'lending_revenue': (LENDINGS, Sum(ExpressionWrapper(
+        F('product__rental_price') * F('paid_percentage') / 100.0, output_field=DecimalField()
+    ))),
+    'expense': (EXPENSES, Sum('amount')),
+}
+
+TIME_DIMENSIONS = ('day', 'week', 'month', 'year')
+
+# o'lchov: {manba: (qiymat maydoni, nom maydoni yoki None)}
+DIMENSIONS = {
+    'seller': {
+        SALES: ('seller_id', 'seller__username'),
+        LENDINGS: ('seller_id', 'seller__username'),
+        EXPENSES: ('seller_id', 'seller__username'),
+    },
+    'category': {
+        SALES: ('product__category_id', 'product__category__name'),
+        LENDINGS: ('product__category_id', 'product__category__name'),
+    },
+    'product': {
+        SALES: ('product_id', 'product__name'),
+        LENDINGS: ('product_id', 'product__name'),
+    },
+    'payment_type': {
+        SALES: ('payment_type', None),
+    },
+}
+
+# filtr: (qiymat turi, {manba: lookup})
+FILTERS = {
+    'seller': (int, {SALES: 'seller_id__in', LENDINGS: 'seller_id__in', EXPENSES: 'seller_id__in'}),
+    'category': (int, {SALES: 'product__category_id__in', LENDINGS: 'product__category_id__in'}),
+    'product': (int, {SALES: 'product_id__in', LENDINGS: 'product_id__in'}),
+    'payment_type': (str, {SALES: 'payment_type__in'}),
+}
+
+MAX_ROWS = 10000
+
+
+def _source_queryset(source, director_id, start, end):
+    if source == SALES:
+        return SaleDailyRollup.objects.filter(director_id=director_id, day__gte=start.date(), day__lt=end.date())
+    if source == LENDINGS:
+        return LendingDailyRollup.objects.filter(director_id=director_id, day__gte=start.date(), day__lt=end.date())
+    return CashWithdrawal.objects.filter(
+        Q(seller_id=director_id) | Q(seller__created_by_id=director_id),
+        created_at__gte=start, created_at__lt=end,
+    )
+
+
+def _time_expression(source, kind):
+    if source == EXPENSES:
+        return Trunc('created_at', kind, output_field=models.DateField(), tzinfo=timezone.get_current_timezone())
+    return Trunc('day', kind, output_field=models.DateField())
+
+
+def _split(value):
+    return [item for item in (value or '').split(',') if item]
+
+
+def parse_query(params):
+    """
+    So'rov parametrlarini tekshiradi: ?metrics=revenue,expense&dimensions=month,seller
+    &start_date=&end_date=&seller=1,2&category=&product=&payment_type=&order=-revenue&limit=
+    Noto'g'ri qiymatlar uchun ValueError.
+    """
+    metrics = _split(params.get('metrics'))
+    if not metrics:
+        raise ValueError("metrics kiritilishi shart")
+    unknown = [metric for metric in metrics if metric not in METRICS]
+    if unknown:
+        raise ValueError(f"Noma'lum metrika: {', '.join(unknown)}. Mavjudlari: {', '.join(METRICS)}")
+
+    dimensions = _split(params.get('dimensions'))
+    unknown = [dim for dim in dimensions if dim not in DIMENSIONS and dim not in TIME_DIMENSIONS]
+    if unknown:
+        raise ValueError(
+            f"Noma'lum o'lchov: {', '.join(unknown)}. Mavjudlari: {', '.join(TIME_DIMENSIONS + tuple(DIMENSIONS))}"
+        )
+    if len([dim for dim in dimensions if dim in TIME_DIMENSIONS]) > 1:
+        raise ValueError("Faqat bitta vaqt o'lchovi (day/week/month/year) tanlanadi")
+    if len(set(dimensions)) != len(dimensions):
+        raise ValueError("O'lchovlar takrorlanmasligi kerak")
+
+    if params.get('start_date') or params.get('end_date'):
+        start = parse_local_date(params.get('start_date'))
+        end = parse_local_date(params.get('end_date')) + timedelta(days=1)
+        if start >= end:
+            raise ValueError("start_date end_date dan katta bo'lmasligi kerak")
+    else:
+        start, end = period_range('month')
+
+    filters = {}
+    for name, (cast, _) in FILTERS.items():
+        values = _split(params.get(name))
+        if values:
+            try:
+                filters[name] = [cast(value) for value in values]
+            except ValueError:
+                raise ValueError(f"{name} filtri noto'g'ri")
+
+    order = params.get('order')
+    if order and order.lstrip('-') not in metrics + dimensions:
+        raise ValueError("order tanlangan metrika yoki o'lchovlardan biri bo'lishi kerak")
+    try:
+        limit = int(params.get('limit', MAX_ROWS))
+    except ValueError:
+        raise ValueError("limit butun son bo'lishi kerak")
+    if not 0 < limit <= MAX_ROWS:
+        raise ValueError(f"limit 1 dan {MAX_ROWS} gacha bo'lishi kerak")
+
+    return {
+        'metrics': metrics, 'dimensions': dimensions, 'start': start, 'end': end,
+        'filters': filters, 'order': order, 'limit': limit,
+    }
+
+
+def compile_query(director_id, query):
+    """
+    Har bir kerakli manba uchun bir xil ustunli GROUP BY queryset va ularning UNION ALL i.
+    Ustunlar: d0, d0_name, d1, ..., m0, m1, ... (manbada bo'lmagan metrika 0).
+    """
+    metrics, dimensions = query['metrics'], query['dimensions']
+    sources = [source for source in (SALES, LENDINGS, EXPENSES) if any(METRICS[m][0] == source for m in metrics)]
+    querysets = []
+    for source in sources:
+        for dim in dimensions:
+            if dim not in TIME_DIMENSIONS and source not in DIMENSIONS[dim]:
+                raise ValueError(f"{', '.join(m for m in metrics if METRICS[m][0] == source)} {dim} bo'yicha guruhlanmaydi")
+        for name in query['filters']:
+            if source not in FILTERS[name][1]:
+                raise ValueError(f"{', '.join(m for m in metrics if METRICS[m][0] == source)} uchun {name} filtri yo'q")
+
+        queryset = _source_queryset(source, director_id, query['start'], query['end'])
+        for name, values in query['filters'].items():
+            queryset = queryset.filter(**{FILTERS[name][1][source]: values})
+
+        columns = {}
+        for index, dim in enumerate(dimensions):
+            if dim in TIME_DIMENSIONS:
+                columns[f'd{index}'] = _time_expression(source, dim)
+                columns[f'd{index}_name'] = Value(None, output_field=models.CharField())
+            else:
+                value_field, name_field = DIMENSIONS[dim][source]
+                columns[f'd{index}'] = F(value_field)
+                columns[f'd{index}_name'] = F(name_field) if name_field else Value(None, output_field=models.CharField())
+        if not columns:
+            # O'lchov yo'q: o'zgarmas ustun bo'yicha bitta jami qator (values() bo'sh bo'lsa har bir qator alohida guruh)
+            columns['total'] = Value(1, output_field=models.IntegerField())
+        queryset = queryset.annotate(**columns).values(*columns)
+
+        totals = {}
+        for index, metric in enumerate(metrics):
+            metric_source, aggregate = METRICS[metric]
+            totals[f'm{index}'] = aggregate if metric_source == source else Value(0, output_field=models.IntegerField())
+        querysets.append(queryset.annotate(**totals).order_by())
+
+    combined = querysets[0]
+    if len(querysets) > 1:
+        combined = combined.union(*querysets[1:], all=True)
+    return combined
+
+
+def run_query(director_id, query):
+    """
+    Natija ustunli ko'rinishda: {"dimensions": [...], "metrics": [...], "columns": {nom: [qiymatlar]}}.
+    seller/category/product uchun <o'lchov>_name ustuni ham qaytariladi.
+    """
+    metrics, dimensions = query['metrics'], query['dimensions']
+    rows = {}
+    for row in compile_query(director_id, query):
+        key = tuple(row[f'd{index}'] for index in range(len(dimensions)))
+        if key not in rows:
+            rows[key] = {
+                'names': [row[f'd{index}_name'] for index in range(len(dimensions))],
+                'totals': [0] * len(metrics),
+            }
+        item = rows[key]
+        for index in range(len(dimensions)):
+            item['names'][index] = item['names'][index] or row[f'd{index}_name']
+        for index in range(len(metrics)):
+            item['totals'][index] += row[f'm{index}'] or 0
+
+    keys = sorted(rows, key=lambda key: tuple((value is None, value if value is not None else 0) for value in key))
+    if query['order']:
+        name = query['order'].lstrip('-')
+        if name in metrics:
+            index = metrics.index(name)
+            sort_key = lambda key: rows[key]['totals'][index]
+        else:
+            index = dimensions.index(name)
+            sort_key = lambda key: (key[index] is None, key[index] if key[index] is not None else 0)
+        keys.sort(key=sort_key, reverse=query['order'].startswith('-'))
+    keys = keys[:query['limit']]
+
+    columns = {}
+    for index, dim in enumerate(dimensions):
+        columns[dim] = [key[index] for key in keys]
+        if dim in DIMENSIONS and DIMENSIONS[dim][SALES][1]:
+            columns[f'{dim}_name'] = [rows[key]['names'][index] for key in keys]
+    for index, metric in enumerate(metrics):
+        columns[metric] = [rows[key]['totals'][index] for key in keys]
+    return {
+        'dimensions': dimensions,
+        'metrics': metrics,
+        'start_date': timezone.localtime(query['start']).date(),
+        'end_date': timezone.localtime(query['end']).date() - timedelta(days=1),
+        'row_count': len(keys),
+        'columns': columns,
+    }
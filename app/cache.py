@@ -0,0 +1,128 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+
+# Statistika javoblari keshi. Kalit: direktor + versiya + endpoint + parametrlar.
+# Direktorga tegishli Sale/Lending/CashWithdrawal/Product yozilganda versiya oshiriladi,
+# eski kalitlar shunchaki ishlatilmay qoladi va TIMEOUT bo'yicha o'chib ketadi.
+GLOBAL_SCOPE = 'global'
+# Ustunli fakt nusxasi versiyasi (app/factstore.py): faqat sotuv/ijara/mahsulot yozilganda oshadi
+FACTS_SCOPE = 'facts'
+
+_counters = {'hits': 0, 'misses': 0, 'bypass': 0}
+_counters_lock = threading.Lock()
+
+
+def statistics_cache():
+    return caches[getattr(settings, 'STATISTICS_CACHE_ALIAS', 'statistics')]
+
+
+def director_id_of(user):
+    # Director uchun o'zi, admin va sellerlar uchun ularni yaratgan direktor
+    return user.created_by_id or user.pk
+
+
+def _version_key(scope):
+    return f"stats:version:{scope}"
+
+
+def get_version(scope):
+    cache = statistics_cache()
+    version = cache.get(_version_key(scope))
+    if version is None:
+        # Versiya kaliti yo'qolgan bo'lsa eski yozuvlar bilan to'qnashmasligi uchun vaqtdan boshlaymiz
+        version = time.time_ns()
+        cache.add(_version_key(scope), version, timeout=None)
+        version = cache.get(_version_key(scope), version)
+    return version
+
+
+def bump_version(*scopes):
+    cache = statistics_cache()
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            cache.set(_version_key(scope), time.time_ns(), timeout=None)
+
+
+def invalidate_director(director_id):
+    """
+    Direktor ma'lumotlari o'zgarganda chaqiriladi. Tranzaksiya commit bo'lgandan
+    keyin versiya oshiriladi, aks holda eski ma'lumot yangi versiya bilan keshlanib qolishi mumkin.
+    """
+    if director_id is None:
+        return
+    transaction.on_commit(lambda: bump_version(director_id, GLOBAL_SCOPE))
+
+
+def invalidate_facts():
+    # Fakt nusxasi sozlangan bo'lsa, commit dan keyin uning versiyasini oshiramiz
+    if getattr(settings, 'FACT_STORE_DIR', None):
+        transaction.on_commit(lambda: bump_version(FACTS_SCOPE))
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def cache_info():
+    with _counters_lock:
+        info = dict(_counters)
+    lookups = info['hits'] + info['misses']
+    info['hit_rate'] = round(info['hits'] / lookups, 4) if lookups else 0
+    return info
+
+
+def is_bypass(request):
+    return (
+        request.GET.get('nocache') in ('1', 'true')
+        or 'no-cache' in request.headers.get('Cache-Control', '')
+    )
+
+
+def cache_key(scope, endpoint, request, kwargs):
+    params = sorted(
+        (key, value) for key, value in request.GET.lists() if key != 'nocache'
+    )
+    raw = repr((request.user.pk, timezone.localdate().isoformat(), params, sorted(kwargs.items())))
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f"stats:{scope}:{get_version(scope)}:{endpoint}:{digest}"
+
+
+def cache_statistics(endpoint, scope=None):
+    """
+    APIView.get uchun dekorator. scope=GLOBAL_SCOPE - direktor bo'yicha filtrlanmagan
+    endpointlar uchun (har qanday direktorning yozuvi keshni yangilaydi).
+    ?nocache=1 yoki "Cache-Control: no-cache" keshni chetlab o'tadi va javobni qayta yozadi.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            cache = statistics_cache()
+            key = cache_key(scope or director_id_of(request.user), endpoint, request, kwargs)
+            bypass = is_bypass(request)
+            if not bypass:
+                data = cache.get(key)
+                if data is not None:
+                    _count('hits')
+                    response = Response(data)
+                    response['X-Statistics-Cache'] = 'HIT'
+                    return response
+            _count('bypass' if bypass else 'misses')
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, getattr(settings, 'STATISTICS_CACHE_TIMEOUT', 300))
+            response['X-Statistics-Cache'] = 'BYPASS' if bypass else 'MISS'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,238 @@
+"""
+Buxgalteriya uchun oqimli (streaming) eksport: CSV va XLSX.
+
+Qatorlar bazadan values_list().iterator(chunk_size=...) bilan bo'laklab o'qiladi va
+darhol javobga yoziladi, shuning uchun xotira oraliq hajmiga bog'liq emas.
+XLSX uchun openpyxl shart emas: zip arxiv oqim sifatida yoziladi (inlineStr katakchalar).
+"""
+import csv
+import re
+import zipfile
+from datetime import datetime, date
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Sale, Lending, CashWithdrawal, SALE_REVENUE
+
+
+CHUNK_SIZE = 2000
+
+EXPORT_TYPES = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+# ledger: (model, sana maydoni, {status parametri: qiymat}, [(sarlavha, maydon)])
+LEDGERS = {
+    'sales': (Sale, 'sale_date', {'completed': 'COMPLETED', 'pending': 'PENDING', 'cancelled': 'CANCELLED'}, [
+        ('ID', 'id'),
+        ('Sana', 'sale_date'),
+        ('Mahsulot', 'product__name'),
+        ('Kategoriya', 'product__category__name'),
+        ('Sotuvchi', 'seller__username'),
+        ('Xaridor', 'buyer'),
+        ('Soni', 'quantity'),
+        ("Og'irligi", 'product_weight'),
+        ('Narxi', 'sale_price'),
+        ('Summa', 'total'),
+        ("To'lov turi", 'payment_type'),
+        ('Holati', 'status'),
+        ('Bekor qilish sababi', 'reason_cancelled'),
+    ]),
+    'lendings': (Lending, 'borrow_date', {'lent': Lending.LENT, 'returned': Lending.RETURNED}, [
+        ('ID', 'id'),
+        ('Berilgan sana', 'borrow_date'),
+        ('Qaytarish sanasi', 'return_date'),
+        ('Qaytarilgan sana', 'actual_return_date'),
+        ('Mahsulot', 'product__name'),
+        ('Kategoriya', 'product__category__name'),
+        ('Sotuvchi', 'seller__username'),
+        ('Ijarachi', 'borrower_name'),
+        ('Telefon', 'phone'),
+        ('Ijara narxi', 'product__rental_price'),
+        ('Foiz', 'percentage'),
+        ('Holati', 'status'),
+    ]),
+    'withdrawals': (CashWithdrawal, 'created_at', {}, [
+        ('ID', 'id'),
+        ('Sana', 'created_at'),
+        ('Xodim', 'seller__username'),
+        ('Summa', 'amount'),
+        ('Kategoriya', 'category__name'),
+        ('Izoh', 'comment'),
+    ]),
+}
+
+
+def ledger_queryset(ledger, director_id, start=None, end=None, status=None):
+    """
+    Direktor ma'lumotlari bo'yicha eksport qatorlari (tuple lar), sana bo'yicha tartiblangan.
+    start/end - aware datetime, [start, end). Noto'g'ri status uchun ValueError.
+    """
+    model, date_field, statuses, columns = LEDGERS[ledger]
+    if model is CashWithdrawal:
+        queryset = model.objects.filter(Q(seller_id=director_id) | Q(seller__created_by_id=director_id))
+    else:
+        queryset = model.objects.filter(product__admin_id=director_id)
+    if model is Sale:
+        queryset = queryset.annotate(total=SALE_REVENUE)
+    if start is not None:
+        queryset = queryset.filter(**{f'{date_field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{date_field}__lt': end})
+    if status:
+        if status not in statuses:
+            raise ValueError(f"status quyidagilardan biri bo'lishi kerak: {', '.join(statuses) or '-'}")
+        queryset = queryset.filter(status=statuses[status])
+    return queryset.order_by(date_field, 'id').values_list(*[field for _, field in columns])
+
+
+def ledger_header(ledger):
+    return [title for title, _ in LEDGERS[ledger][3]]
+
+
+def iter_ledger(ledger, director_id, start=None, end=None, status=None):
+    return ledger_queryset(ledger, director_id, start, end, status).iterator(chunk_size=CHUNK_SIZE)
+
+
+def cell_value(value):
+    # Sanalar mahalliy vaqtda, Decimal son sifatida
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+class _Echo:
+    # csv.writer yozgan satrni bufersiz qaytaradi
+    def write(self, value):
+        return value
+
+
+# Excel/LibreOffice bu belgilar bilan boshlangan katakni formula sifatida bajaradi
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def csv_value(value):
+    # Matn qiymatlari (xaridor, izoh, ...) formula bo'lib ochilmasligi uchun ' bilan boshlanadi
+    if value is None:
+        return ''
+    value = cell_value(value)
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow(header)  # BOM: Excel UTF-8 ni to'g'ri ochishi uchun
+    for row in rows:
+        yield writer.writerow([csv_value(value) for value in row])
+
+
+class _ChunkBuffer:
+    # zipfile yozgan baytlarni yig'adi, generator ularni bo'lak-bo'lak olib ketadi
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+XLSX_STATIC = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{sheet}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if value is None or value == '':
+        return '<c/>'
+    value = cell_value(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_ILLEGAL_XML.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def stream_xlsx(header, rows, sheet='Sheet1'):
+    """
+    Bitta varaqli XLSX ni oqim sifatida yaratadi. Varaq XML i qatorma-qator siqiladi,
+    har CHUNK_SIZE qatordan keyin tayyor baytlar javobga beriladi.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_STATIC.items():
+            archive.writestr(name, content.replace('{sheet}', escape(sheet[:31])))
+        yield buffer.drain()
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet_file:
+            sheet_file.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_row(header)
+            ).encode())
+            for index, row in enumerate(rows, 1):
+                sheet_file.write(_xlsx_row(row).encode())
+                if index % CHUNK_SIZE == 0:
+                    yield buffer.drain()
+            sheet_file.write(b'</sheetData></worksheet>')
+    yield buffer.drain()
+
+
+def stream_table(file_type, header, rows, sheet='Sheet1'):
+    if file_type == 'xlsx':
+        return stream_xlsx(header, rows, sheet)
+    return (line.encode('utf-8') for line in stream_csv(header, rows))
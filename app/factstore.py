@@ -0,0 +1,343 @@
+"""
+Sotuv va ijara faktlarining ustunli (columnar) nusxasi.
+
+Har bir ustun alohida .npy fayl sifatida saqlanadi va np.load(mmap_mode='r') bilan
+ochiladi, shuning uchun bir nechta worker jarayon bitta nusxani page cache orqali
+bo'lishadi. Nusxa segmentlardan iborat: inkremental yangilanish faqat o'zgargan
+qatorlarni yangi segmentga yozadi, segmentlar ko'payib ketsa bittaga siqiladi. Ixtiyoriy: numpy o'rnatilgan (requirements-factstore.txt) va settings.FACT_STORE_DIR
+berilgan bo'lsagina ishlaydi.
+"""
+import json
+import os
+import secrets
+import shutil
+import time as time_module
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+
+from .cache import get_version, FACTS_SCOPE
+from .models import Sale, Lending, FactStoreChange
+
+try:
+    import numpy as np
+except ImportError:  # numpy ixtiyoriy bog'liqlik
+    np = None
+
+
+SALE, LENDING = FactStoreChange.SALE, FactStoreChange.LENDING
+FORMAT = 3  # meta.json tuzilishi; mos kelmasa nusxa noldan quriladi
+PAYMENT_TYPES = [code for code, _ in Sale.PAYMENT_TYPE_CHOICES]
+
+COLUMNS = {
+    'ts': 'int64',  # UTC epoch soniyalar, shu ustun bo'yicha saralangan
+    'kind': 'int8',  # SALE / LENDING
+    'source_id': 'int64',
+    'director_id': 'int64',
+    'seller_id': 'int64',
+    'product_id': 'int64',
+    'category_id': 'int64',  # kategoriyasiz bo'lsa -1
+    'amount': 'float64',  # sotuv summasi yoki ijaraning to'langan qismi
+    'full_amount': 'float64',  # ijara uchun to'liq rental_price
+    'quantity': 'float64',
+    'weight': 'float64',
+    'payment_type': 'int8',  # PAYMENT_TYPES indeksi, ijara uchun -1
+    'cancelled': 'int8',  # bekor qilingan sotuv - 1 (rollup lar kabi odatda hisobga olinmaydi)
+}
+
+
+def epoch(value):
+    return int(value.timestamp())
+
+
+def _sale_rows(sales):
+    rows = sales.values_list(
+        'id', 'sale_date', 'product__admin_id', 'seller_id', 'product_id', 'product__category_id',
+        'sale_price', 'quantity', 'product_weight', 'payment_type', 'status',
+    ).order_by()
+    for pk, sale_date, director_id, seller_id, product_id, category_id, price, quantity, weight, payment_type, status in rows.iterator(chunk_size=5000):
+        amount = float(price)  # sale_price - qator summasi (SALE_REVENUE)
+        yield (
+            epoch(sale_date), SALE, pk, director_id, seller_id, product_id,
+            category_id if category_id is not None else -1,
+            amount, amount, float(quantity or 0), float(weight or 0),
+            PAYMENT_TYPES.index(payment_type) if payment_type in PAYMENT_TYPES else -1,
+            int(status == 'CANCELLED'),
+        )
+
+
+def _lending_rows(lendings):
+    rows = lendings.values_list(
+        'id', 'borrow_date', 'product__admin_id', 'seller_id', 'product_id', 'product__category_id',
+        'product__rental_price', 'percentage', 'status',
+    ).order_by()
+    for pk, borrow_date, director_id, seller_id, product_id, category_id, rental_price, percentage, status in rows.iterator(chunk_size=5000):
+        rental_price = float(rental_price or 0)
+        paid = 100 if status == Lending.RETURNED else int(percentage.rstrip('%') or 0)
+        yield (
+            epoch(borrow_date), LENDING, pk, director_id, seller_id, product_id,
+            category_id if category_id is not None else -1,
+            rental_price * paid / 100, rental_price, 1.0, 0.0, -1, 0,
+        )
+
+
+def _try_lock(lock):
+    """
+    Ochiq fayl ustida kutmasdan eksklyuziv qulf; boshqa jarayon ushlab turgan bo'lsa False.
+    fcntl faqat POSIX da bor, shuning uchun shu yerda import qilinadi (Windows da msvcrt).
+    """
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        try:
+            msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _to_columns(rows):
+    rows = list(rows)
+    return {
+        name: np.array([row[i] for row in rows], dtype=dtype)
+        for i, (name, dtype) in enumerate(COLUMNS.items())
+    }
+
+
+def row_keys(kind, source_id):
+    # (kind, source_id) juftligi bitta int64 kalit sifatida
+    return np.asarray(source_id, dtype='int64') * 2 + np.asarray(kind, dtype='int64')
+
+
+class Segment:
+    """
+    Bitta yangilanishda yozilgan qatorlar (ts bo'yicha saralangan) va removes - shu
+    yangilanishda o'zgargan yoki o'chirilgan kalitlar: oldingi segmentlardagi shu
+    kalitli qatorlar endi hisobga olinmaydi. Yozilgandan keyin o'zgarmaydi.
+    """
+    def __init__(self, directory):
+        self.columns = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+            for name in COLUMNS
+        }
+        self.removes = np.load(os.path.join(directory, 'removes.npy'))
+        self.keys = row_keys(self.columns['kind'], self.columns['source_id'])
+
+
+class FactStore:
+    def __init__(self, path):
+        self.path = path
+        self.meta_path = os.path.join(path, 'meta.json')
+        self.generation = None
+        self.meta = None
+        self.segments = None
+        self.live = None  # har bir segment uchun hisobga olinadigan qatorlar maskasi
+        self._opened = {}
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        return meta if meta.get('format') == FORMAT else None
+
+    def load(self, attempts=3):
+        # Faqat generatsiya o'zgargan bo'lsa qayta ochamiz; segmentlar o'zgarmaydi va qayta ishlatiladi
+        for attempt in range(attempts):
+            meta = self._read_meta()
+            if meta is None:
+                self.generation = self.meta = self.segments = self.live = None
+                self._opened = {}
+                return self
+            if meta['generation'] == self.generation:
+                break
+            if self.meta is not None and meta['segments'] == self.meta['segments']:
+                self.generation = meta['generation']
+                break
+            try:
+                opened = {
+                    name: self._opened.get(name) or Segment(os.path.join(self.path, name))
+                    for name in meta['segments']
+                }
+            except FileNotFoundError:
+                # meta o'qilgandan keyin boshqa jarayon ikki marta yangilab, segmentni o'chirgan
+                if attempt == attempts - 1:
+                    raise
+                continue
+            segments = [opened[name] for name in meta['segments']]
+            live, removed = [], np.empty(0, dtype='int64')
+            for segment in reversed(segments):
+                live.append(~np.isin(segment.keys, removed))
+                removed = np.union1d(removed, segment.removes)
+            self._opened, self.segments, self.live = opened, segments, live[::-1]
+            self.generation = meta['generation']
+            break
+        self.meta = meta
+        return self
+
+    @property
+    def is_ready(self):
+        return self.segments is not None
+
+    @property
+    def row_count(self):
+        return int(sum(live.sum() for live in self.live)) if self.is_ready else 0
+
+    def is_stale(self, max_age, fact_version):
+        # Sotuv/ijara yozilganda facts versiyasi oshadi (app/cache.py invalidate_facts)
+        return (
+            not self.is_ready
+            or self.meta.get('fact_version') != fact_version
+            or time_module.time() - self.meta['refreshed_at'] > max_age
+        )
+
+    def refresh(self, full=False):
+        """
+        O'zgargan qatorlarni (updated_at bo'yicha) o'qiydi va ularni yangi segment sifatida qo'shadi,
+        eski segmentlar qayta yozilmaydi. FACT_STORE_MAX_SEGMENTS ga yetganda tirik qatorlar
+        bitta segmentga siqiladi. Oldingi yangilanishdan FACT_STORE_OVERLAP soniya oldindan
+        boshlab olinadi: updated_at tranzaksiya ichida qo'yiladi va kechroq commit bo'lgan
+        qatorlar tushib qolmaydi. O'chirilgan qatorlar va maydonlari o'zgargan mahsulotlar
+        FactStoreChange jadvalidan olinadi (qoldiq o'zgarishi qatorlarni qayta o'qitmaydi).
+        Boshqa jarayon yangilayotgan bo'lsa kutmasdan qaytadi.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, '.lock'), 'w') as lock:
+            if not _try_lock(lock):
+                return self.load()
+            self.load()
+            started = time_module.time()
+            # So'rovlardan oldin o'qiladi: shundan keyin commit bo'lgan yozuv versiyani oshiradi
+            fact_version = get_version(FACTS_SCOPE)
+            overlap = getattr(settings, 'FACT_STORE_OVERLAP', 300)
+            if full or not self.is_ready:
+                columns = _to_columns(list(_sale_rows(Sale.objects.all())) + list(_lending_rows(Lending.objects.all())))
+                names = [self._write_segment(columns, np.empty(0, dtype='int64'))]
+                # Noldan qurilgan nusxaga eski o'zgarishlar kerak emas
+                FactStoreChange.objects.filter(
+                    created_at__lt=datetime.fromtimestamp(started - overlap, tz=dt_timezone.utc)
+                ).delete()
+            else:
+                since = datetime.fromtimestamp(self.meta['refreshed_at'] - overlap, tz=dt_timezone.utc)
+                changes = defaultdict(list)
+                for kind, source_id in FactStoreChange.objects.filter(created_at__gte=since).values_list('kind', 'source_id'):
+                    changes[kind].append(source_id)
+                changed = Q(updated_at__gte=since) | Q(product_id__in=changes[FactStoreChange.PRODUCT])
+                sales = Sale.objects.filter(changed)
+                lendings = Lending.objects.filter(changed)
+                removes = np.concatenate([
+                    row_keys(SALE, list(sales.values_list('id', flat=True)) + changes[SALE]),
+                    row_keys(LENDING, list(lendings.values_list('id', flat=True)) + changes[LENDING]),
+                ])
+                names = list(self.meta['segments'])
+                if len(removes):
+                    fresh = _to_columns(list(_sale_rows(sales)) + list(_lending_rows(lendings)))
+                    if len(names) >= getattr(settings, 'FACT_STORE_MAX_SEGMENTS', 32):
+                        names = [self._write_segment(self._compact(fresh, removes), np.empty(0, dtype='int64'))]
+                    else:
+                        names.append(self._write_segment(fresh, np.unique(removes)))
+            self._write_meta(names, started, fact_version)
+        return self.load()
+
+    def _compact(self, fresh, removes):
+        # Barcha segmentlarning tirik (removes ga kirmagan) qatorlari va yangi qatorlar
+        parts = []
+        for segment, live in zip(self.segments, self.live):
+            keep = live & ~np.isin(segment.keys, removes)
+            parts.append({name: np.asarray(segment.columns[name])[keep] for name in COLUMNS})
+        parts.append(fresh)
+        return {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+
+    def _write_segment(self, columns, removes):
+        name = f"{int(time_module.time() * 1000)}-{secrets.token_hex(4)}"
+        directory = os.path.join(self.path, name)
+        os.makedirs(directory)
+        order = np.argsort(columns['ts'], kind='stable')
+        for column, values in columns.items():
+            np.save(os.path.join(directory, f'{column}.npy'), values[order])
+        np.save(os.path.join(directory, 'removes.npy'), removes)
+        return name
+
+    def _write_meta(self, segments, refreshed_at, fact_version):
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'format': FORMAT, 'generation': f"{int(refreshed_at * 1000)}-{secrets.token_hex(4)}",
+                'segments': segments, 'refreshed_at': refreshed_at, 'fact_version': fact_version,
+            }, f)
+        previous = self.meta['segments'] if self.meta else []
+        os.replace(tmp_path, self.meta_path)
+        # Oldingi meta dagi segmentlar keyingi yangilanishgacha qoladi: uni o'qib ulgurgan
+        # worker np.load qilayotgan bo'lishi mumkin. Qolganlari o'chiriladi
+        # (ochiq mmap lar inode yopilguncha ishlashda davom etadi)
+        for name in os.listdir(self.path):
+            if name not in segments and name not in previous and os.path.isdir(os.path.join(self.path, name)):
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def _slices(self, director_id, start, end, kinds=None, include_cancelled=False):
+        # Har bir segmentda ts saralangan: oraliqni searchsorted bilan kesib, keyin direktor va tiriklik bo'yicha filtr
+        for segment, live in zip(self.segments, self.live):
+            lo, hi = np.searchsorted(segment.columns['ts'], [epoch(start), epoch(end)], side='left')
+            mask = (np.asarray(segment.columns['director_id'][lo:hi]) == director_id) & live[lo:hi]
+            if kinds is not None:
+                mask &= np.isin(segment.columns['kind'][lo:hi], kinds)
+            if not include_cancelled:
+                mask &= np.asarray(segment.columns['cancelled'][lo:hi]) == 0
+            yield segment.columns, lo, hi, mask
+
+    def bucket_totals(self, director_id, boundaries, values, include_cancelled=False):
+        """
+        boundaries: bucket chegaralari (aware datetime, oxirgisi - end).
+        values: {kind: ustun nomi}. Har bir bucket uchun yig'indilar ro'yxati.
+        include_cancelled - bekor qilingan sotuvlar ham (xom Sale jadvali kabi).
+        """
+        edges = np.array([epoch(boundary) for boundary in boundaries], dtype='int64')
+        totals = np.zeros(len(edges) - 1)
+        slices = self._slices(director_id, boundaries[0], boundaries[-1], list(values), include_cancelled)
+        for columns, lo, hi, mask in slices:
+            ts = np.asarray(columns['ts'][lo:hi])[mask]
+            kind = np.asarray(columns['kind'][lo:hi])[mask]
+            weights = np.zeros(len(ts))
+            for row_kind, column in values.items():
+                selected = kind == row_kind
+                weights[selected] = np.asarray(columns[column][lo:hi])[mask][selected]
+            index = np.searchsorted(edges, ts, side='right') - 1
+            totals += np.bincount(index, weights=weights, minlength=len(edges) - 1)[:len(edges) - 1]
+        return np.round(totals, 4).tolist()  # float yig'indi shovqinini kesamiz (rollup da 4 xona)
+
+
+_store = None
+
+
+def get_fact_store():
+    """
+    Sozlangan va tayyor FactStore ni qaytaradi, aks holda None (SQL yo'li ishlatiladi).
+    Facts versiyasi o'zgargan (sotuv/ijara yozilgan) yoki FACT_STORE_MAX_AGE soniyadan eski
+    bo'lsa o'qishdan oldin inkremental yangilanadi, lekin FACT_STORE_MIN_INTERVAL soniyada
+    ko'pi bilan bir marta. Nusxa versiyaga yetmagan bo'lsa None: eski nusxadan hisoblangan
+    javob yangi versiya bilan keshlanib qolmasligi kerak.
+    """
+    global _store
+    path = getattr(settings, 'FACT_STORE_DIR', None)
+    if np is None or not path:
+        return None
+    if _store is None or _store.path != str(path):
+        _store = FactStore(str(path))
+    fact_version = get_version(FACTS_SCOPE)
+    _store.load()
+    if _store.is_stale(getattr(settings, 'FACT_STORE_MAX_AGE', 60), fact_version):
+        min_interval = getattr(settings, 'FACT_STORE_MIN_INTERVAL', 5)
+        if not _store.is_ready or time_module.time() - _store.meta['refreshed_at'] >= min_interval:
+            _store.refresh()
+    if not _store.is_ready or _store.meta.get('fact_version') != fact_version:
+        return None
+    return _store
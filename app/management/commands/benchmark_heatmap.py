@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from app.models import User
+from app.statistics import sales_heatmap, sales_heatmap_hourly, truncate, local_now
+
+
+class Command(BaseCommand):
+    help = "Heatmap: bitta GROUP BY so'rovini soatma-soat aggregate usuli bilan solishtiradi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--director', type=int, required=True, help="Direktor id si")
+        parser.add_argument('--days', type=int, default=28, help="Oxirgi necha kun (default 28)")
+        parser.add_argument('--repeat', type=int, default=3, help="Har bir usul necha marta ishga tushiriladi")
+
+    def measure(self, func, repeat):
+        best, result, queries = None, None, 0
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                result = func()
+                elapsed = time.perf_counter() - started
+            queries = len(captured)
+            best = elapsed if best is None else min(best, elapsed)
+        return best, queries, result
+
+    def handle(self, *args, **options):
+        try:
+            director = User.objects.get(pk=options['director'], role=User.DIRECTOR)
+        except User.DoesNotExist:
+            raise CommandError("Direktor topilmadi")
+        end = truncate(local_now(), 'day') + timezone.timedelta(days=1)
+        start = end - timezone.timedelta(days=options['days'])
+
+        grouped_time, grouped_queries, grouped = self.measure(lambda: sales_heatmap(director, start, end), options['repeat'])
+        hourly_time, hourly_queries, hourly = self.measure(lambda: sales_heatmap_hourly(director, start, end), options['repeat'])
+
+        self.stdout.write(f"GROUP BY:      {grouped_time * 1000:9.1f} ms, {grouped_queries} so'rov")
+        self.stdout.write(f"Soatma-soat:   {hourly_time * 1000:9.1f} ms, {hourly_queries} so'rov")
+        if grouped_time:
+            self.stdout.write(f"Tezlashish:    {hourly_time / grouped_time:9.1f}x")
+        if (grouped['revenue'], grouped['count']) != (hourly['revenue'], hourly['count']):
+            raise CommandError("Natijalar mos kelmadi")
+        self.stdout.write(self.style.SUCCESS("Natijalar bir xil"))
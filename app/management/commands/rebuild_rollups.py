@@ -0,0 +1,80 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+
+from app.models import (
+    Product, Sale, Lending, SaleDailyRollup, LendingDailyRollup, ProductMonthlyCounter, CategoryMonthlyCounter,
+)
+
+
+ROLLUPS = [
+    (SaleDailyRollup, (Sale,), ('product_id', 'seller_id', 'payment_type', 'day'),
+     ('director_id', 'sale_count', 'quantity', 'weight', 'revenue')),
+    (LendingDailyRollup, (Lending,), ('product_id', 'seller_id', 'day'),
+     ('director_id', 'lend_count', 'returned_count', 'paid_percentage')),
+    (ProductMonthlyCounter, (Sale, Lending), ('product_id', 'month'),
+     ('director_id', 'sale_count', 'quantity', 'weight', 'revenue', 'lend_count')),
+    (CategoryMonthlyCounter, (Product, Sale), ('director_id', 'category_id', 'month'),
+     ('product_count', 'sale_count', 'quantity', 'weight', 'revenue')),
+]
+
+
+def source_rows(sources, director_id=None):
+    # Rollup manbalari querysetlari, director_id berilsa faqat shu direktorniki
+    rows = [source.objects.all() for source in sources]
+    if director_id:
+        rows = [
+            queryset.filter(**{'admin_id' if queryset.model is Product else 'product__admin_id': director_id})
+            for queryset in rows
+        ]
+    return rows
+
+
+def normalize(rollup, name, value):
+    # Bazada saqlangan aniqlik bilan solishtirish uchun
+    field = rollup._meta.get_field(name.removesuffix('_id'))
+    if isinstance(field, models.DecimalField):
+        return Decimal(value).quantize(Decimal(1).scaleb(-field.decimal_places))
+    return value
+
+
+class Command(BaseCommand):
+    help = "Sotuv/ijara rollup va hisoblagich jadvallarini qayta quradi yoki tekshiradi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help="Faqat tekshirish, hech narsa yozilmaydi")
+        parser.add_argument('--director', type=int, help="Faqat shu direktor ma'lumotlari")
+
+    def handle(self, *args, **options):
+        mismatches = 0
+        for rollup, sources, key_fields, value_fields in ROLLUPS:
+            rows = source_rows(sources, options['director'])
+            stored = rollup.objects.all()
+            if options['director']:
+                stored = stored.filter(director_id=options['director'])
+
+            expected = rollup.build(*rows)
+            if options['verify']:
+                def as_dict(objects):
+                    return {
+                        tuple(getattr(obj, field) for field in key_fields):
+                        tuple(normalize(rollup, field, getattr(obj, field)) for field in value_fields)
+                        for obj in objects
+                    }
+                expected_map = as_dict(expected)
+                stored_map = as_dict(stored)
+                diff = [key for key in expected_map.keys() | stored_map.keys()
+                        if expected_map.get(key) != stored_map.get(key)]
+                for key in diff[:20]:
+                    self.stdout.write(f"{rollup.__name__} {key}: {stored_map.get(key)} != {expected_map.get(key)}")
+                mismatches += len(diff)
+                self.stdout.write(f"{rollup.__name__}: {len(stored_map)} qator, {len(diff)} ta farq")
+            else:
+                with transaction.atomic():
+                    stored.delete()
+                    rollup.objects.bulk_create(expected, batch_size=1000)
+                self.stdout.write(self.style.SUCCESS(f"{rollup.__name__}: {len(expected)} qator yozildi"))
+
+        if mismatches:
+            raise CommandError(f"Rollup jadvallarida {mismatches} ta farq topildi")
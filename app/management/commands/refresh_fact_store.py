@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.factstore import FactStore, np
+
+
+class Command(BaseCommand):
+    help = "Ustunli sotuv/ijara fakt nusxasini (FACT_STORE_DIR) yangilaydi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Noldan qayta qurish (o'chirilgan qatorlarni ham tozalaydi)")
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError("numpy o'rnatilmagan")
+        if not getattr(settings, 'FACT_STORE_DIR', None):
+            raise CommandError("FACT_STORE_DIR sozlanmagan")
+        store = FactStore(str(settings.FACT_STORE_DIR)).refresh(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Generatsiya {store.generation}: {len(store.segments)} segment, {store.row_count} qator"
+        ))
@@ -0,0 +1,116 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Cast, Replace, TruncDate
+from django.utils import timezone
+
+
+def backfill_rollups(apps, schema_editor):
+    # Mavjud sotuv va ijaralardan rollup qatorlari. Tarixiy modellar bilan ishlaydi,
+    # shuning uchun SaleDailyRollup.build / LendingDailyRollup.build mantiqining nusxasi
+    Sale = apps.get_model('app', 'Sale')
+    Lending = apps.get_model('app', 'Lending')
+    SaleDailyRollup = apps.get_model('app', 'SaleDailyRollup')
+    LendingDailyRollup = apps.get_model('app', 'LendingDailyRollup')
+    tz = timezone.get_current_timezone()
+
+    sale_rows = Sale.objects.exclude(status='CANCELLED').annotate(
+        day=TruncDate('sale_date', tzinfo=tz)
+    ).values(
+        'product_id', 'product__admin_id', 'seller_id', 'payment_type', 'day'
+    ).annotate(
+        total_count=Count('id'),
+        total_quantity=Sum('quantity'),
+        total_weight=Sum('product_weight'),
+        total_revenue=Sum('sale_price'),
+    ).order_by()
+    SaleDailyRollup.objects.bulk_create([
+        SaleDailyRollup(
+            director_id=row['product__admin_id'],
+            product_id=row['product_id'],
+            seller_id=row['seller_id'],
+            payment_type=row['payment_type'],
+            day=row['day'],
+            sale_count=row['total_count'],
+            quantity=row['total_quantity'] or 0,
+            weight=row['total_weight'] or 0,
+            revenue=row['total_revenue'] or 0,
+        )
+        for row in sale_rows
+    ], batch_size=1000)
+
+    lending_rows = Lending.objects.annotate(
+        day=TruncDate('borrow_date', tzinfo=tz)
+    ).values(
+        'product_id', 'product__admin_id', 'seller_id', 'day'
+    ).annotate(
+        total_count=Count('id'),
+        total_returned=Count('id', filter=Q(status='RETURNED')),
+        total_paid=Sum(Case(
+            When(status='RETURNED', then=Value(100)),
+            default=Cast(Replace(F('percentage'), Value('%'), Value('')), models.IntegerField()),
+            output_field=models.IntegerField()
+        )),
+    ).order_by()
+    LendingDailyRollup.objects.bulk_create([
+        LendingDailyRollup(
+            director_id=row['product__admin_id'],
+            product_id=row['product_id'],
+            seller_id=row['seller_id'],
+            day=row['day'],
+            lend_count=row['total_count'],
+            returned_count=row['total_returned'],
+            paid_percentage=row['total_paid'] or 0,
+        )
+        for row in lending_rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_sale_payment_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LendingDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('lend_count', models.PositiveIntegerField(default=0)),
+                ('returned_count', models.PositiveIntegerField(default=0)),
+                ('paid_percentage', models.PositiveIntegerField(default=0)),
+                ('director', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lending_rollups', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lending_rollups', to='app.product')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seller_lending_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['director', 'day'], name='app_lending_directo_2b5220_idx')],
+                'unique_together': {('product', 'seller', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SaleDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_type', models.CharField(choices=[('CASH', 'Naqd'), ('CARD', 'Karta')], max_length=10)),
+                ('day', models.DateField()),
+                ('sale_count', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('weight', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('revenue', models.DecimalField(decimal_places=4, default=0, max_digits=24)),
+                ('director', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sale_rollups', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sale_rollups', to='app.product')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seller_sale_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['director', 'day'], name='app_saledai_directo_092916_idx')],
+                'unique_together': {('product', 'seller', 'payment_type', 'day')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
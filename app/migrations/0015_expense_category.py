@@ -0,0 +1,41 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_sale_lending_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(max_length=100)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='expense_categories', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='cashwithdrawal',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='withdrawals', to='app.expensecategory'),
+        ),
+        migrations.AddIndex(
+            model_name='cashwithdrawal',
+            index=models.Index(fields=['seller', 'category', 'created_at'], name='app_cashwit_seller__f5bd71_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='expensecategory',
+            unique_together={('created_by', 'name')},
+        ),
+    ]
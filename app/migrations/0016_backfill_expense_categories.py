@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+DEFAULT_NAMES = ["Xodimlar maoshi", "Ijara haqi", "Kommunal xizmatlar", "Marketing", "Ta'mirlash"]
+
+
+def backfill_categories(apps, schema_editor):
+    # Umumiy kategoriyalarni yaratib, mavjud chiqimlarni izoh bo'yicha bog'laymiz
+    ExpenseCategory = apps.get_model('app', 'ExpenseCategory')
+    CashWithdrawal = apps.get_model('app', 'CashWithdrawal')
+    for name in DEFAULT_NAMES:
+        category, _ = ExpenseCategory.objects.get_or_create(name=name, created_by=None)
+        CashWithdrawal.objects.filter(
+            category__isnull=True,
+            comment__iexact=name
+        ).update(category=category)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_expense_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_categories, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_backfill_expense_categories'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('sales_count', models.PositiveIntegerField(default=0)),
+                ('lending_count', models.PositiveIntegerField(default=0)),
+                ('kpi', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('salary', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('sales_kpi_total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('lending_kpi_total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('common_kpi_total', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('salary_kpi', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('director', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payroll_snapshots', to=settings.AUTH_USER_MODEL)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payroll_history', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-month', 'employee_id'],
+                'indexes': [models.Index(fields=['director', 'month'], name='app_payroll_directo_f55bed_idx')],
+                'unique_together': {('employee', 'month')},
+            },
+        ),
+    ]
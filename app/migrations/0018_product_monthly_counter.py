@@ -0,0 +1,80 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+
+def backfill_counters(apps, schema_editor):
+    # Mavjud sotuv va ijaralardan oylik hisoblagichlar. Tarixiy modellar bilan ishlaydi,
+    # shuning uchun ProductMonthlyCounter.build mantiqining nusxasi
+    Sale = apps.get_model('app', 'Sale')
+    Lending = apps.get_model('app', 'Lending')
+    ProductMonthlyCounter = apps.get_model('app', 'ProductMonthlyCounter')
+    tz = timezone.get_current_timezone()
+    counters = {}
+
+    def counter(row):
+        key = (row['product_id'], row['month'])
+        if key not in counters:
+            counters[key] = ProductMonthlyCounter(
+                director_id=row['product__admin_id'], product_id=row['product_id'], month=row['month'],
+            )
+        return counters[key]
+
+    sale_rows = Sale.objects.exclude(status='CANCELLED').annotate(
+        month=Trunc('sale_date', 'month', output_field=models.DateField(), tzinfo=tz)
+    ).values('product_id', 'product__admin_id', 'month').annotate(
+        total_count=Count('id'),
+        total_quantity=Sum('quantity'),
+        total_weight=Sum('product_weight'),
+        total_revenue=Sum('sale_price'),
+    ).order_by()
+    for row in sale_rows:
+        item = counter(row)
+        item.sale_count = row['total_count']
+        item.quantity = row['total_quantity'] or 0
+        item.weight = row['total_weight'] or 0
+        item.revenue = row['total_revenue'] or 0
+
+    lending_rows = Lending.objects.annotate(
+        month=Trunc('borrow_date', 'month', output_field=models.DateField(), tzinfo=tz)
+    ).values('product_id', 'product__admin_id', 'month').annotate(
+        total_count=Count('id'),
+    ).order_by()
+    for row in lending_rows:
+        counter(row).lend_count = row['total_count']
+
+    ProductMonthlyCounter.objects.bulk_create(counters.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_payroll_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductMonthlyCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('sale_count', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('weight', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('revenue', models.DecimalField(decimal_places=4, default=0, max_digits=24)),
+                ('lend_count', models.PositiveIntegerField(default=0)),
+                ('director', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_counters', to=settings.AUTH_USER_MODEL)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_counters', to='app.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['director', 'month'], name='app_product_directo_9f5db9_idx')],
+                'unique_together': {('product', 'month')},
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
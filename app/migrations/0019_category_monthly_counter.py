@@ -0,0 +1,76 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+
+def backfill_counters(apps, schema_editor):
+    # Mavjud mahsulot va sotuvlardan kategoriya hisoblagichlari. Tarixiy modellar bilan ishlaydi,
+    # shuning uchun CategoryMonthlyCounter.build mantiqining nusxasi
+    Product = apps.get_model('app', 'Product')
+    Sale = apps.get_model('app', 'Sale')
+    CategoryMonthlyCounter = apps.get_model('app', 'CategoryMonthlyCounter')
+    tz = timezone.get_current_timezone()
+    counters = {}
+
+    def counter(director_id, category_id, month):
+        key = (director_id, category_id, month)
+        if key not in counters:
+            counters[key] = CategoryMonthlyCounter(director_id=director_id, category_id=category_id, month=month)
+        return counters[key]
+
+    product_rows = Product.objects.annotate(
+        month=Trunc('created_at', 'month', output_field=models.DateField(), tzinfo=tz)
+    ).values('admin_id', 'category_id', 'month').annotate(total_count=Count('id')).order_by()
+    for row in product_rows:
+        counter(row['admin_id'], row['category_id'], row['month']).product_count = row['total_count']
+
+    sale_rows = Sale.objects.exclude(status='CANCELLED').annotate(
+        month=Trunc('sale_date', 'month', output_field=models.DateField(), tzinfo=tz)
+    ).values('product__admin_id', 'product__category_id', 'month').annotate(
+        total_count=Count('id'),
+        total_quantity=Sum('quantity'),
+        total_weight=Sum('product_weight'),
+        total_revenue=Sum('sale_price'),
+    ).order_by()
+    for row in sale_rows:
+        item = counter(row['product__admin_id'], row['product__category_id'], row['month'])
+        item.sale_count = row['total_count']
+        item.quantity = row['total_quantity'] or 0
+        item.weight = row['total_weight'] or 0
+        item.revenue = row['total_revenue'] or 0
+
+    CategoryMonthlyCounter.objects.bulk_create(counters.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_product_monthly_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryMonthlyCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('sale_count', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('weight', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('revenue', models.DecimalField(decimal_places=4, default=0, max_digits=24)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_counters', to='app.category')),
+                ('director', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['director', 'month'], name='app_categor_directo_cf5a71_idx')],
+                'unique_together': {('director', 'category', 'month')},
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
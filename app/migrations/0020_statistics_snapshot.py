@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_category_monthly_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=50)),
+                ('period', models.CharField(choices=[('day', 'Kun'), ('month', 'Oy'), ('year', 'Yil')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('director', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statistics_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('director', 'endpoint', 'period', 'period_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0020_statistics_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cashwithdrawal',
+            index=models.Index(fields=['seller', 'created_at'], name='app_cashwit_seller__ac8e8f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lending',
+            index=models.Index(fields=['seller', 'borrow_date'], name='app_lending_seller__eb6220_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lending',
+            index=models.Index(fields=['product', 'borrow_date'], name='app_lending_product_e9624e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['seller', 'sale_date'], name='app_sale_seller__f19d9f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['product', 'sale_date'], name='app_sale_product_6c754b_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.3 on 2026-10-18 04:32
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_receipt_counters(apps, schema_editor):
+    # Eski "buyer-N" raqamlari bilan to'qnashmaslik uchun hisoblagich sotuvchining eng katta N idan boshlanadi
+    Sale = apps.get_model('app', 'Sale')
+    ReceiptCounter = apps.get_model('app', 'ReceiptCounter')
+    suffix = re.compile(r"-(\d+)$")
+    last_numbers = {}
+    for seller_id, buyer in Sale.objects.filter(buyer__contains='-').values_list('seller_id', 'buyer').iterator():
+        match = suffix.search(buyer)
+        if match:
+            last_numbers[seller_id] = max(last_numbers.get(seller_id, 0), int(match.group(1)))
+    ReceiptCounter.objects.bulk_create([
+        ReceiptCounter(seller_id=seller_id, last_number=number) for seller_id, number in last_numbers.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0021_date_range_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Receipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('number', models.PositiveIntegerField()),
+                ('buyer', models.CharField(max_length=100)),
+                ('payment_type', models.CharField(choices=[('CASH', 'Naqd'), ('CARD', 'Karta')], default='CASH', max_length=10)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='receipts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='receipt',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales', to='app.receipt'),
+        ),
+        migrations.CreateModel(
+            name='ReceiptCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_number', models.PositiveIntegerField(default=0)),
+                ('seller', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='receipt_counter', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['seller', 'created_at'], name='app_receipt_seller__31cabe_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='receipt',
+            unique_together={('seller', 'number')},
+        ),
+        migrations.RunPython(seed_receipt_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,106 @@
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Trunc, TruncDate
+from django.utils import timezone
+
+
+def rebuild_sale_revenue(apps, schema_editor):
+    # Sotuv summasi endi sale_price (qator summasi): rollup va hisoblagichlar qayta quriladi,
+    # eski summalar bilan saqlangan statistika snapshotlari o'chiriladi (so'rov bo'yicha qayta yoziladi).
+    # Tarixiy modellar bilan ishlaydi, shuning uchun modellardagi build mantiqining nusxasi
+    Sale = apps.get_model('app', 'Sale')
+    Product = apps.get_model('app', 'Product')
+    Lending = apps.get_model('app', 'Lending')
+    SaleDailyRollup = apps.get_model('app', 'SaleDailyRollup')
+    ProductMonthlyCounter = apps.get_model('app', 'ProductMonthlyCounter')
+    CategoryMonthlyCounter = apps.get_model('app', 'CategoryMonthlyCounter')
+    tz = timezone.get_current_timezone()
+    sales = Sale.objects.exclude(status='CANCELLED')
+    totals = dict(
+        total_count=Count('id'),
+        total_quantity=Sum('quantity'),
+        total_weight=Sum('product_weight'),
+        total_revenue=Sum('sale_price'),
+    )
+
+    def fill(item, row):
+        item.sale_count = row['total_count']
+        item.quantity = row['total_quantity'] or 0
+        item.weight = row['total_weight'] or 0
+        item.revenue = row['total_revenue'] or 0
+        return item
+
+    # Kunlik sotuv rollup lari
+    rows = sales.annotate(day=TruncDate('sale_date', tzinfo=tz)).values(
+        'product_id', 'product__admin_id', 'seller_id', 'payment_type', 'day'
+    ).annotate(**totals).order_by()
+    SaleDailyRollup.objects.all().delete()
+    SaleDailyRollup.objects.bulk_create([
+        fill(SaleDailyRollup(
+            director_id=row['product__admin_id'], product_id=row['product_id'], seller_id=row['seller_id'],
+            payment_type=row['payment_type'], day=row['day'],
+        ), row)
+        for row in rows
+    ], batch_size=1000)
+
+    # Mahsulot oylik hisoblagichlari (sotuvlar va barcha ijaralar)
+    counters = {}
+
+    def counter(model, key, **fields):
+        if key not in counters:
+            counters[key] = model(**fields)
+        return counters[key]
+
+    def month(field):
+        return Trunc(field, 'month', output_field=models.DateField(), tzinfo=tz)
+
+    rows = sales.annotate(month=month('sale_date')).values('product_id', 'product__admin_id', 'month').annotate(
+        **totals
+    ).order_by()
+    for row in rows:
+        fill(counter(
+            ProductMonthlyCounter, (row['product_id'], row['month']),
+            director_id=row['product__admin_id'], product_id=row['product_id'], month=row['month'],
+        ), row)
+    rows = Lending.objects.annotate(month=month('borrow_date')).values(
+        'product_id', 'product__admin_id', 'month'
+    ).annotate(total_count=Count('id')).order_by()
+    for row in rows:
+        counter(
+            ProductMonthlyCounter, (row['product_id'], row['month']),
+            director_id=row['product__admin_id'], product_id=row['product_id'], month=row['month'],
+        ).lend_count = row['total_count']
+    ProductMonthlyCounter.objects.all().delete()
+    ProductMonthlyCounter.objects.bulk_create(counters.values(), batch_size=1000)
+
+    # Kategoriya oylik hisoblagichlari (yaratilgan mahsulotlar va sotuvlar)
+    counters = {}
+    rows = Product.objects.annotate(month=month('created_at')).values('admin_id', 'category_id', 'month').annotate(
+        total_count=Count('id')
+    ).order_by()
+    for row in rows:
+        key = (row['admin_id'], row['category_id'], row['month'])
+        counter(
+            CategoryMonthlyCounter, key, director_id=key[0], category_id=key[1], month=key[2],
+        ).product_count = row['total_count']
+    rows = sales.annotate(month=month('sale_date')).values('product__admin_id', 'product__category_id', 'month').annotate(
+        **totals
+    ).order_by()
+    for row in rows:
+        key = (row['product__admin_id'], row['product__category_id'], row['month'])
+        fill(counter(CategoryMonthlyCounter, key, director_id=key[0], category_id=key[1], month=key[2]), row)
+    CategoryMonthlyCounter.objects.all().delete()
+    CategoryMonthlyCounter.objects.bulk_create(counters.values(), batch_size=1000)
+
+    apps.get_model('app', 'StatisticsSnapshot').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0022_receipt'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_sale_revenue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.3 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0023_rebuild_sale_revenue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FactStoreChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(0, 'Sale'), (1, 'Lending'), (2, 'Product')])),
+                ('source_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -1,15 +1,21 @@
 from typing import Iterable
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save
+from django.db.models import Sum, Count, F, Q, Case, When, Value, DecimalField, IntegerField
+from django.db.models.functions import Cast, Coalesce, Replace, Trunc, TruncDate
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib import admin
 from rest_framework import serializers
 from django.utils import timezone
 import pytz
 from decimal import Decimal
+from collections import defaultdict
+from datetime import datetime, time, timedelta
 from django.utils.timezone import now
+from .cache import invalidate_director, invalidate_facts, director_id_of
 
 class BaseModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -188,8 +194,45 @@ class Product(BaseModel):
             raise ValidationError("faqat bitta malumot yuborishingiz mumkin!")
         # if not self.price and not self.rental_price:
         #     raise ValidationError("price yoki rental price maydonlaridan birini kiritishingiz kerak!")
+        old = Product.objects.filter(pk=self.pk).values('category_id', 'admin_id', 'rental_price').first() if self.pk else None
         super().save(*args, **kwargs)
 
+        # Fakt nusxasidagi sotuv/ijara qatorlari mahsulotning shu maydonlarini saqlaydi
+        if old is not None and (old['category_id'], old['admin_id'], old['rental_price']) != (self.category_id, self.admin_id, self.rental_price):
+            FactStoreChange.record(FactStoreChange.PRODUCT, self.pk)
+
+        # Kategoriya hisoblagichlari: yangi mahsulot yoki kategoriyasi/direktori o'zgargan mahsulot
+        if old is None:
+            CategoryMonthlyCounter.refresh(CategoryMonthlyCounter.cells(products=[self]))
+        elif (old['category_id'], old['admin_id']) != (self.category_id, self.admin_id):
+            months = {
+                timezone.localdate(sale_date).replace(day=1)
+                for sale_date in self.sales.values_list('sale_date', flat=True)
+            }
+            months.add(timezone.localdate(self.created_at).replace(day=1))
+            CategoryMonthlyCounter.refresh(
+                (director_id, category_id, month)
+                for director_id, category_id in ((old['admin_id'], old['category_id']), (self.admin_id, self.category_id))
+                for month in months
+            )
+
+    def adjust_stock(self, quantity=0, weight=0):
+        """
+        Qoldiqni bitta shartli UPDATE bilan o'zgartiradi: manfiy qiymat - sotuv, musbat - qaytarish.
+        Kamaytirishda qoldiq yetmasa (WHERE quantity >= n) hech narsa yozilmaydi va False qaytadi.
+        Xotiradagi obyekt yangilanmaydi, kerak bo'lsa refresh_from_db chaqiriladi.
+        """
+        filters, values = {}, {'updated_at': timezone.now()}
+        if quantity:
+            values['quantity'] = Coalesce(F('quantity'), 0) + quantity
+            if quantity < 0:
+                filters['quantity__gte'] = -quantity
+        if weight:
+            values['weight'] = Coalesce(F('weight'), Decimal(0)) + weight
+            if weight < 0:
+                filters['weight__gte'] = -weight
+        return Product.objects.filter(pk=self.pk, **filters).update(**values) > 0
+
 
 
 class Lending(BaseModel):
@@ -248,6 +291,11 @@ class Lending(BaseModel):
     )
     class Meta:
         ordering = ['-borrow_date']
+        # Statistika oraliqlari [start, end) shu indekslar bo'yicha o'qiladi
+        indexes = [
+            models.Index(fields=['seller', 'borrow_date']),
+            models.Index(fields=['product', 'borrow_date']),
+        ]
         
     def clean(self):
         print(self.seller.created_by)
@@ -257,6 +305,7 @@ class Lending(BaseModel):
         if self.product.choice != 'RENT':
             raise ValidationError("Bu mahsulot ijaraga berish uchun emas")
 
+    @transaction.atomic  # post_save dagi rollup yangilanishi ham shu tranzaksiyada
     def save(self, *args, **kwargs):
         self.clean()
         super().save(*args, **kwargs)
@@ -302,13 +351,37 @@ class Sale(BaseModel):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
     payment_type = models.CharField(max_length=10, choices=PAYMENT_TYPE_CHOICES, default='CASH')
     reason_cancelled = models.CharField(max_length=200, null=True, blank=True)
+    receipt = models.ForeignKey('Receipt', on_delete=models.SET_NULL, null=True, blank=True, related_name='sales')
 
     class Meta:
         ordering = ['-sale_date']
+        # Statistika oraliqlari [start, end) shu indekslar bo'yicha o'qiladi
+        indexes = [
+            models.Index(fields=['seller', 'sale_date']),
+            models.Index(fields=['product', 'sale_date']),
+        ]
 
     def __str__(self):
         return f"{self.product.name} sold by {self.seller.username} to {self.buyer} for {self.sale_price}"
 
+    def take_stock(self):
+        # Sotilgan miqdorni qoldiqdan yechadi; yetmasa ValidationError (tranzaksiya bekor bo'ladi)
+        taken = self.product.adjust_stock(
+            quantity=-(self.quantity or 0),
+            weight=-Decimal(self.product_weight or 0),
+        )
+        self.product.refresh_from_db(fields=['quantity', 'weight', 'updated_at'])
+        if taken:
+            return
+        if self.quantity:
+            if not self.product.quantity:
+                raise ValidationError("productning soni yoq")
+            raise ValidationError("Sotilayotgan miqdor mahsulotning mavjud miqdoridan oshib ketmasligi kerak.")
+        if not self.product.weight:
+            raise ValidationError("productning soni yoq")
+        raise ValidationError("Sotilayotgan og'irlik mahsulotning mavjud og'irligidan oshib ketmasligi kerak.")
+
+    @transaction.atomic
     def save(self, *args, **kwargs):
         # Mahsulotning mavjud miqdorini tekshirish
         if (self.quantity is None or self.quantity == 0) and (self.product_weight is None or self.product_weight == 0):
@@ -316,58 +389,476 @@ class Sale(BaseModel):
         if self.quantity and self.product_weight:
             raise ValidationError("Faqat Quantity yoki Product Weight dan birini kiriting, ikkalasini emas.")
 
-        if self.quantity:
-            if not self.product.quantity:
-                raise ValidationError("productning soni yoq")
-            if self.quantity > self.product.quantity:
-                raise ValidationError("Sotilayotgan miqdor mahsulotning mavjud miqdoridan oshib ketmasligi kerak.")
-        
-        if self.product_weight:
-            if not self.product.weight:
-                raise ValidationError("productning soni yoq")
-            if self.product_weight > self.product.weight:
-                raise ValidationError("Sotilayotgan og'irlik mahsulotning mavjud og'irligidan oshib ketmasligi kerak.")
-        
         # Mahsulotning choice ni tekshirish
         if self.product.choice != 'SELL':
             raise ValidationError("Faqat 'SELL' tanloviga ega mahsulotlarni sotish mumkin.")
         
         if self.product.admin != self.seller.created_by and self.product.admin != self.seller:
             raise ValidationError("Sotuvchi mahsulotning admini bilan bir xil 'created_by' ga ega bo'lishi kerak.")
-        # Agar hammasi to'g'ri bo'lsa, saqlash
 
-        # Sotilgandan so'ng, mahsulotning miqdorini yangilash
-        if self.pk:
-            old_instance = Sale.objects.get(pk=self.pk)
-            old_quantity = old_instance.quantity or 0
-            old_weight = old_instance.product_weight or 0
-        else:
-            old_quantity = 0
-            old_weight = 0
-
-        if not self.pk:  # Yangi ob'ekt
-            if self.quantity is not None:
-                self.product.quantity -= self.quantity
-            elif self.product_weight is not None:
-                self.product.weight -= Decimal(self.product_weight)
-        else:  # Yangilanish
-            if self.status == 'CANCELLED' and old_instance.status != 'CANCELLED':
-                # Cancel qilinganda, eski qiymatni qaytarish
-                if old_quantity:
-                    self.product.quantity += old_quantity
-                if old_weight:
-                    self.product.weight += Decimal(old_weight)
-            elif self.status != 'CANCELLED' and old_instance.status == 'CANCELLED':
-                # Cancel'dan qayta sotilishga o'tgan bo'lsa
-                if self.quantity is not None:
-                    self.product.quantity -= self.quantity
-                elif self.product_weight is not None:
-                    self.product.weight -= Decimal(self.product_weight)
-
-        self.product.save()
+        old_instance = Sale.objects.get(pk=self.pk) if self.pk else None
+
+        # Qoldiq bazada shartli UPDATE bilan o'zgaradi (xotiradagi product eskirgan bo'lishi mumkin):
+        # yangi sotuv va bekor qilingandan qayta tiklash - kamaytirish, bekor qilish - qaytarish
+        if old_instance is None or (self.status != 'CANCELLED' and old_instance.status == 'CANCELLED'):
+            self.take_stock()
+        elif self.status == 'CANCELLED' and old_instance.status != 'CANCELLED':
+            self.product.adjust_stock(
+                quantity=old_instance.quantity or 0,
+                weight=Decimal(old_instance.product_weight or 0),
+            )
+            self.product.refresh_from_db(fields=['quantity', 'weight', 'updated_at'])
+
         super().save(*args, **kwargs)
 
-    
+        # Kunlik rollup va oylik hisoblagichlarni yangilash (kalit o'zgargan bo'lsa, eskisini ham)
+        changed = [self] if old_instance is None else [old_instance, self]
+        SaleDailyRollup.refresh(changed)
+        ProductMonthlyCounter.refresh(sales=changed)
+        CategoryMonthlyCounter.refresh(CategoryMonthlyCounter.cells(sales=changed))
+
+
+class ReceiptCounter(models.Model):
+    # Sotuvchining oxirgi chek raqami; raqam shu qatorni qulflab oshiriladi
+    seller = models.OneToOneField(User, on_delete=models.CASCADE, related_name='receipt_counter')
+    last_number = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.seller_id}: {self.last_number}"
+
+    @classmethod
+    def next_number(cls, seller):
+        # Tranzaksiya ichida chaqiriladi: parallel checkoutlar shu qatorda navbatga turadi
+        counter, _ = cls.objects.select_for_update().get_or_create(seller=seller)
+        counter.last_number += 1
+        counter.save(update_fields=['last_number'])
+        return counter.last_number
+
+
+class Receipt(BaseModel):
+    # Bitta checkout dagi sotuv qatorlari (chek)
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='receipts')
+    number = models.PositiveIntegerField()  # Sotuvchi bo'yicha tartib raqam
+    buyer = models.CharField(max_length=100)
+    payment_type = models.CharField(max_length=10, choices=Sale.PAYMENT_TYPE_CHOICES, default='CASH')
+    item_count = models.PositiveIntegerField(default=0)
+    total_price = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-created_at']
+        unique_together = ('seller', 'number')
+        indexes = [models.Index(fields=['seller', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.buyer}-{self.number}: {self.total_price}"
+
+    @property
+    def buyer_name(self):
+        # Sale.buyer da saqlanadigan ko'rinish: "buyer-N"
+        return f"{self.buyer}-{self.number}"
+
+
+# Sotuv summasi: sale_price qatorning umumiy summasi (narx * soni yoki narx * og'irlik holida saqlanadi)
+SALE_REVENUE = F('sale_price')
+
+
+def local_day_range(day):
+    # Mahalliy kun uchun [start, end) oralig'i
+    start = datetime.combine(day, time.min, tzinfo=timezone.get_current_timezone())
+    return start, start + timedelta(days=1)
+
+
+def local_month_range(month):
+    # Mahalliy oy uchun [start, end) oralig'i, month - oyning birinchi kuni
+    start = datetime.combine(month, time.min, tzinfo=timezone.get_current_timezone())
+    following = (month + timedelta(days=32)).replace(day=1)
+    return start, datetime.combine(following, time.min, tzinfo=timezone.get_current_timezone())
+
+
+def group_by_cell(instances, date_field):
+    # (seller, kun) -> o'zgargan product id lari
+    cells = defaultdict(set)
+    for instance in instances:
+        day = timezone.localdate(getattr(instance, date_field))
+        cells[(instance.seller_id, day)].add(instance.product_id)
+    return cells
+
+
+class SaleDailyRollup(models.Model):
+    director = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sale_rollups')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sale_rollups')
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='seller_sale_rollups')
+    payment_type = models.CharField(max_length=10, choices=Sale.PAYMENT_TYPE_CHOICES)
+    day = models.DateField()
+    sale_count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    weight = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    revenue = models.DecimalField(max_digits=24, decimal_places=4, default=0)
+
+    class Meta:
+        unique_together = ('product', 'seller', 'payment_type', 'day')
+        indexes = [models.Index(fields=['director', 'day'])]
+
+    def __str__(self):
+        return f"{self.product_id} / {self.seller_id} / {self.day}: {self.revenue}"
+
+    @classmethod
+    def build(cls, sales):
+        # Bekor qilinmagan sotuvlardan rollup qatorlarini yig'ish (saqlanmagan obyektlar)
+        rows = sales.exclude(status='CANCELLED').annotate(
+            day=TruncDate('sale_date', tzinfo=timezone.get_current_timezone())
+        ).values(
+            'product_id', 'product__admin_id', 'seller_id', 'payment_type', 'day'
+        ).annotate(
+            total_count=Count('id'),
+            total_quantity=Sum('quantity'),
+            total_weight=Sum('product_weight'),
+            total_revenue=Sum(SALE_REVENUE),
+        ).order_by()
+        return [
+            cls(
+                director_id=row['product__admin_id'],
+                product_id=row['product_id'],
+                seller_id=row['seller_id'],
+                payment_type=row['payment_type'],
+                day=row['day'],
+                sale_count=row['total_count'],
+                quantity=row['total_quantity'] or 0,
+                weight=row['total_weight'] or 0,
+                revenue=row['total_revenue'] or 0,
+            )
+            for row in rows
+        ]
+
+    @classmethod
+    def refresh(cls, sales):
+        # O'zgargan sotuvlar tegishli (product, seller, kun) kataklarini qayta hisoblash
+        for (seller_id, day), product_ids in group_by_cell(sales, 'sale_date').items():
+            start, end = local_day_range(day)
+            cls.objects.filter(seller_id=seller_id, day=day, product_id__in=product_ids).delete()
+            cls.objects.bulk_create(cls.build(Sale.objects.filter(
+                seller_id=seller_id,
+                product_id__in=product_ids,
+                sale_date__gte=start,
+                sale_date__lt=end,
+            )))
+
+
+class LendingDailyRollup(models.Model):
+    director = models.ForeignKey(User, on_delete=models.CASCADE, related_name='lending_rollups')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='lending_rollups')
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='seller_lending_rollups')
+    day = models.DateField()
+    lend_count = models.PositiveIntegerField(default=0)
+    returned_count = models.PositiveIntegerField(default=0)
+    # Qaytarilganlar uchun 100, qolganlari uchun percentage qiymatlari yig'indisi.
+    # Daromad = product.rental_price * paid_percentage / 100 (narx o'zgarsa ham to'g'ri qoladi)
+    paid_percentage = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'seller', 'day')
+        indexes = [models.Index(fields=['director', 'day'])]
+
+    def __str__(self):
+        return f"{self.product_id} / {self.seller_id} / {self.day}: {self.lend_count}"
+
+    @classmethod
+    def build(cls, lendings):
+        rows = lendings.annotate(
+            day=TruncDate('borrow_date', tzinfo=timezone.get_current_timezone())
+        ).values(
+            'product_id', 'product__admin_id', 'seller_id', 'day'
+        ).annotate(
+            total_count=Count('id'),
+            total_returned=Count('id', filter=Q(status=Lending.RETURNED)),
+            total_paid=Sum(Case(
+                When(status=Lending.RETURNED, then=Value(100)),
+                default=Cast(Replace(F('percentage'), Value('%'), Value('')), IntegerField()),
+                output_field=IntegerField()
+            )),
+        ).order_by()
+        return [
+            cls(
+                director_id=row['product__admin_id'],
+                product_id=row['product_id'],
+                seller_id=row['seller_id'],
+                day=row['day'],
+                lend_count=row['total_count'],
+                returned_count=row['total_returned'],
+                paid_percentage=row['total_paid'] or 0,
+            )
+            for row in rows
+        ]
+
+    @classmethod
+    def refresh(cls, lendings):
+        for (seller_id, day), product_ids in group_by_cell(lendings, 'borrow_date').items():
+            start, end = local_day_range(day)
+            cls.objects.filter(seller_id=seller_id, day=day, product_id__in=product_ids).delete()
+            cls.objects.bulk_create(cls.build(Lending.objects.filter(
+                seller_id=seller_id,
+                product_id__in=product_ids,
+                borrow_date__gte=start,
+                borrow_date__lt=end,
+            )))
+
+
+class ProductMonthlyCounter(models.Model):
+    # Direktor x mahsulot x mahalliy oy hisoblagichlari (top mahsulotlar reytingi uchun).
+    # Ijara daromadi o'qishda lend_count * product.rental_price sifatida olinadi.
+    director = models.ForeignKey(User, on_delete=models.CASCADE, related_name='product_counters')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='monthly_counters')
+    month = models.DateField()  # Oyning birinchi kuni
+    sale_count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    weight = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    revenue = models.DecimalField(max_digits=24, decimal_places=4, default=0)
+    lend_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'month')
+        indexes = [models.Index(fields=['director', 'month'])]
+
+    def __str__(self):
+        return f"{self.product_id} / {self.month:%Y-%m}: {self.sale_count} / {self.lend_count}"
+
+    @classmethod
+    def build(cls, sales, lendings):
+        # Bekor qilinmagan sotuvlar va barcha ijaralardan hisoblagichlar (saqlanmagan obyektlar)
+        tz = timezone.get_current_timezone()
+        counters = {}
+
+        def counter(row):
+            key = (row['product_id'], row['month'])
+            if key not in counters:
+                counters[key] = cls(director_id=row['product__admin_id'], product_id=row['product_id'], month=row['month'])
+            return counters[key]
+
+        sale_rows = sales.exclude(status='CANCELLED').annotate(
+            month=Trunc('sale_date', 'month', output_field=models.DateField(), tzinfo=tz)
+        ).values('product_id', 'product__admin_id', 'month').annotate(
+            total_count=Count('id'),
+            total_quantity=Sum('quantity'),
+            total_weight=Sum('product_weight'),
+            total_revenue=Sum(SALE_REVENUE),
+        ).order_by()
+        for row in sale_rows:
+            item = counter(row)
+            item.sale_count = row['total_count']
+            item.quantity = row['total_quantity'] or 0
+            item.weight = row['total_weight'] or 0
+            item.revenue = row['total_revenue'] or 0
+
+        lending_rows = lendings.annotate(
+            month=Trunc('borrow_date', 'month', output_field=models.DateField(), tzinfo=tz)
+        ).values('product_id', 'product__admin_id', 'month').annotate(
+            total_count=Count('id'),
+        ).order_by()
+        for row in lending_rows:
+            counter(row).lend_count = row['total_count']
+
+        return list(counters.values())
+
+    @classmethod
+    def refresh(cls, sales=(), lendings=()):
+        # O'zgargan yozuvlar tegishli (product, oy) kataklarini qayta hisoblash
+        cells = defaultdict(set)
+        for instances, date_field in ((sales, 'sale_date'), (lendings, 'borrow_date')):
+            for instance in instances:
+                cells[timezone.localdate(getattr(instance, date_field)).replace(day=1)].add(instance.product_id)
+        for month, product_ids in cells.items():
+            start, end = local_month_range(month)
+            cls.objects.filter(month=month, product_id__in=product_ids).delete()
+            cls.objects.bulk_create(cls.build(
+                Sale.objects.filter(product_id__in=product_ids, sale_date__gte=start, sale_date__lt=end),
+                Lending.objects.filter(product_id__in=product_ids, borrow_date__gte=start, borrow_date__lt=end),
+            ))
+
+
+def category_filter(category_ids, prefix=''):
+    # category_id__in NULL ni qamramaydi, kategoriyasiz mahsulotlar alohida shart bilan
+    ids = [pk for pk in category_ids if pk is not None]
+    condition = Q(**{f'{prefix}category_id__in': ids})
+    if None in category_ids:
+        condition |= Q(**{f'{prefix}category__isnull': True})
+    return condition
+
+
+class CategoryMonthlyCounter(models.Model):
+    # Direktor x kategoriya x mahalliy oy: yaratilgan mahsulotlar va bekor qilinmagan sotuvlar
+    director = models.ForeignKey(User, on_delete=models.CASCADE, related_name='category_counters')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='monthly_counters')
+    month = models.DateField()  # Oyning birinchi kuni
+    product_count = models.PositiveIntegerField(default=0)
+    sale_count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    weight = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    revenue = models.DecimalField(max_digits=24, decimal_places=4, default=0)
+
+    class Meta:
+        unique_together = ('director', 'category', 'month')
+        indexes = [models.Index(fields=['director', 'month'])]
+
+    def __str__(self):
+        return f"{self.director_id} / {self.category_id} / {self.month:%Y-%m}: {self.product_count} / {self.sale_count}"
+
+    @classmethod
+    def build(cls, products, sales):
+        tz = timezone.get_current_timezone()
+        counters = {}
+
+        def counter(director_id, category_id, month):
+            key = (director_id, category_id, month)
+            if key not in counters:
+                counters[key] = cls(director_id=director_id, category_id=category_id, month=month)
+            return counters[key]
+
+        product_rows = products.annotate(
+            month=Trunc('created_at', 'month', output_field=models.DateField(), tzinfo=tz)
+        ).values('admin_id', 'category_id', 'month').annotate(total_count=Count('id')).order_by()
+        for row in product_rows:
+            counter(row['admin_id'], row['category_id'], row['month']).product_count = row['total_count']
+
+        sale_rows = sales.exclude(status='CANCELLED').annotate(
+            month=Trunc('sale_date', 'month', output_field=models.DateField(), tzinfo=tz)
+        ).values('product__admin_id', 'product__category_id', 'month').annotate(
+            total_count=Count('id'),
+            total_quantity=Sum('quantity'),
+            total_weight=Sum('product_weight'),
+            total_revenue=Sum(SALE_REVENUE),
+        ).order_by()
+        for row in sale_rows:
+            item = counter(row['product__admin_id'], row['product__category_id'], row['month'])
+            item.sale_count = row['total_count']
+            item.quantity = row['total_quantity'] or 0
+            item.weight = row['total_weight'] or 0
+            item.revenue = row['total_revenue'] or 0
+
+        return list(counters.values())
+
+    @staticmethod
+    def cells(sales=(), products=()):
+        # O'zgargan yozuvlar tegishli (direktor, kategoriya, oy) kataklari
+        cells = set()
+        for sale in sales:
+            cells.add((sale.product.admin_id, sale.product.category_id, timezone.localdate(sale.sale_date).replace(day=1)))
+        for product in products:
+            cells.add((product.admin_id, product.category_id, timezone.localdate(product.created_at).replace(day=1)))
+        return cells
+
+    @classmethod
+    def refresh(cls, cells):
+        grouped = defaultdict(set)
+        for director_id, category_id, month in cells:
+            grouped[(director_id, month)].add(category_id)
+        for (director_id, month), category_ids in grouped.items():
+            start, end = local_month_range(month)
+            cls.objects.filter(category_filter(category_ids), director_id=director_id, month=month).delete()
+            cls.objects.bulk_create(cls.build(
+                Product.objects.filter(category_filter(category_ids), admin_id=director_id, created_at__gte=start, created_at__lt=end),
+                Sale.objects.filter(category_filter(category_ids, 'product__'), product__admin_id=director_id, sale_date__gte=start, sale_date__lt=end),
+            ))
+
+
+@receiver(post_delete, sender=Sale)
+def refresh_sale_rollups(sender, instance, **kwargs):
+    SaleDailyRollup.refresh([instance])
+    ProductMonthlyCounter.refresh(sales=[instance])
+    CategoryMonthlyCounter.refresh(CategoryMonthlyCounter.cells(sales=[instance]))
+
+
+@receiver(post_delete, sender=Product)
+def refresh_product_counters(sender, instance, **kwargs):
+    CategoryMonthlyCounter.refresh(CategoryMonthlyCounter.cells(products=[instance]))
+
+
+@receiver(post_delete, sender=Category)
+def drop_category_counters(sender, instance, **kwargs):
+    # Kategoriya o'chirilganda sotuv signallari qayta yaratgan qatorlar ham qolmasin
+    CategoryMonthlyCounter.objects.filter(category_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Lending)
+@receiver(post_delete, sender=Lending)
+def refresh_lending_rollups(sender, instance, **kwargs):
+    LendingDailyRollup.refresh([instance])
+    ProductMonthlyCounter.refresh(lendings=[instance])
+
+
+class PayrollSnapshot(models.Model):
+    # Oylik hisob-kitob natijasi. Saqlangandan keyin o'zgartirilmaydi,
+    # qayta hisoblashda oyning yozuvlari o'chirilib yangidan yaratiladi.
+    director = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payroll_snapshots')
+    employee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payroll_history')
+    month = models.DateField()  # Oyning birinchi kuni
+    sales_count = models.PositiveIntegerField(default=0)
+    lending_count = models.PositiveIntegerField(default=0)
+    kpi = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    salary = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    sales_kpi_total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    lending_kpi_total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    common_kpi_total = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    salary_kpi = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-month', 'employee_id']
+        unique_together = ('employee', 'month')
+        indexes = [models.Index(fields=['director', 'month'])]
+
+    def __str__(self):
+        return f"{self.employee_id} / {self.month:%Y-%m}: {self.salary_kpi}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Payroll snapshot o'zgartirilmaydi, oyni qayta hisoblang.")
+        super().save(*args, **kwargs)
+
+
+class StatisticsSnapshot(models.Model):
+    # Yopilgan davr (kun/oy/yil) uchun hisoblangan statistika javobi. O'zgarmaydi;
+    # davrga tegishli kechikkan Sale/Lending yozuvi snapshotni o'chiradi va u qayta hisoblanadi.
+    DAY = 'day'
+    MONTH = 'month'
+    YEAR = 'year'
+    PERIOD_CHOICES = [
+        (DAY, 'Kun'),
+        (MONTH, 'Oy'),
+        (YEAR, 'Yil'),
+    ]
+
+    director = models.ForeignKey(User, on_delete=models.CASCADE, related_name='statistics_snapshots')
+    endpoint = models.CharField(max_length=50)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('director', 'endpoint', 'period', 'period_start')
+
+    def __str__(self):
+        return f"{self.director_id} / {self.endpoint} / {self.period} {self.period_start}"
+
+    @classmethod
+    def period_end(cls, period, start):
+        if period == cls.DAY:
+            return start + timedelta(days=1)
+        if period == cls.MONTH:
+            return (start + timedelta(days=32)).replace(day=1)
+        return start.replace(year=start.year + 1)
+
+    @classmethod
+    def invalidate(cls, director_id, day):
+        # Bugungi yozuvlar yopilgan davrga tegmaydi, qo'shimcha so'rov ham kerak emas
+        if director_id is None or day >= timezone.localdate():
+            return
+        cls.objects.filter(
+            Q(period=cls.DAY, period_start=day)
+            | Q(period=cls.MONTH, period_start=day.replace(day=1))
+            | Q(period=cls.YEAR, period_start=day.replace(month=1, day=1)),
+            director_id=director_id,
+        ).delete()
 
 
 class VideoQollanma(models.Model):
@@ -436,11 +927,106 @@ class CartItem(BaseModel):
         return f"{self.product.name} in cart of {self.cart.seller.username}"
 
 
+class ExpenseCategory(BaseModel):
+    # created_by bo'sh bo'lsa - barcha direktorlar uchun umumiy kategoriya
+    DEFAULT_NAMES = ["Xodimlar maoshi", "Ijara haqi", "Kommunal xizmatlar", "Marketing", "Ta'mirlash"]
+    OTHER_NAME = "Boshqa xarajatlar"  # Kategoriyasiz chiqimlar
+
+    name = models.CharField(max_length=100)
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='expense_categories'
+    )
+
+    class Meta:
+        ordering = ['name']
+        unique_together = ('created_by', 'name')
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def for_director(cls, director):
+        return cls.objects.filter(Q(created_by__isnull=True) | Q(created_by=director))
+
+
 class CashWithdrawal(BaseModel):
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='withdrawals')
     amount = models.DecimalField(max_digits=15, decimal_places=2)
     comment = models.CharField(max_length=255, blank=True, null=True)
+    category = models.ForeignKey(
+        ExpenseCategory,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='withdrawals'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['seller', 'category', 'created_at']),
+            models.Index(fields=['seller', 'created_at']),
+        ]
+
     def __str__(self):
-        return f"Withdrawal of {self.amount} by {self.seller.username} on {self.created_at}"
\ No newline at end of file
+        return f"Withdrawal of {self.amount} by {self.seller.username} on {self.created_at}"
+
+# Statistika keshini direktor bo'yicha eskirtirish (app/cache.py)
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=Lending)
+@receiver(post_delete, sender=Lending)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=CashWithdrawal)
+@receiver(post_delete, sender=CashWithdrawal)
+def invalidate_statistics_cache(sender, instance, **kwargs):
+    if sender is Product:
+        invalidate_director(instance.admin_id)
+        invalidate_facts()
+    elif sender is CashWithdrawal:
+        invalidate_director(director_id_of(instance.seller))
+    else:
+        invalidate_director(instance.product.admin_id)
+        invalidate_facts()
+
+
+# Yopilgan davrlarga kechikkan yozuv (masalan o'tgan yilgi sotuvni bekor qilish)
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=Lending)
+@receiver(post_delete, sender=Lending)
+def invalidate_statistics_snapshots(sender, instance, **kwargs):
+    date_value = instance.sale_date if sender is Sale else instance.borrow_date
+    StatisticsSnapshot.invalidate(instance.product.admin_id, timezone.localdate(date_value))
+
+
+class FactStoreChange(models.Model):
+    # Ustunli fakt nusxasi (app/factstore.py) updated_at orqali ko'ra olmaydigan o'zgarishlar:
+    # o'chirilgan sotuv/ijara va kategoriyasi, direktori yoki ijara narxi o'zgargan mahsulot
+    SALE, LENDING, PRODUCT = 0, 1, 2
+    KIND_CHOICES = [
+        (SALE, 'Sale'),
+        (LENDING, 'Lending'),
+        (PRODUCT, 'Product'),
+    ]
+
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    source_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    @classmethod
+    def record(cls, kind, source_id):
+        # Fakt nusxasi o'chirilgan bo'lsa yozmaymiz (yoqilganda u noldan quriladi)
+        if getattr(settings, 'FACT_STORE_DIR', None):
+            cls.objects.create(kind=kind, source_id=source_id)
+
+
+@receiver(post_delete, sender=Sale)
+@receiver(post_delete, sender=Lending)
+def record_deleted_fact(sender, instance, **kwargs):
+    FactStoreChange.record(FactStoreChange.SALE if sender is Sale else FactStoreChange.LENDING, instance.pk)
@@ -0,0 +1,177 @@
+"""
+Savatcha sotuvlari va ularni bekor qilish: butun savat bitta tranzaksiyada, hammasi yoki hech narsa.
+
+Sale.save har bir qator uchun mahsulotni alohida o'qiydi va to'liq product.save() qiladi.
+Bu yerda mahsulotlar bitta so'rovda qulflanadi, sotuvlar bulk_create bilan yoziladi,
+qoldiq har bir mahsulot uchun bitta shartli UPDATE bilan kamaytiriladi, chek raqami
+sotuvchining hisoblagich qatoridan olinadi.
+bulk_create va update() signal yubormaydi, shuning uchun rollup, hisoblagich,
+snapshot va kesh shu yerning o'zida yangilanadi.
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate_director, invalidate_facts
+from .models import (
+    Product, Sale, Receipt, ReceiptCounter, SaleDailyRollup, ProductMonthlyCounter, CategoryMonthlyCounter,
+    StatisticsSnapshot,
+)
+
+
+class CheckoutError(Exception):
+    # status - javobning HTTP statusi (mahsulot topilmasa 404)
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _product_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise CheckoutError(f"Mahsulot topilmadi: {value}", status=404)
+
+
+def _check_product(product, seller):
+    # Sale.save dagi tekshiruvlar, lekin 400 javob bilan
+    if product.price is None:
+        raise CheckoutError(f"{product.name} mahsulotining narxi kiritilmagan.")
+    if product.choice != 'SELL':
+        raise CheckoutError("Faqat 'SELL' tanloviga ega mahsulotlarni sotish mumkin.")
+    if product.admin_id not in (seller.created_by_id, seller.pk):
+        raise CheckoutError("Sotuvchi mahsulotning admini bilan bir xil 'created_by' ga ega bo'lishi kerak.")
+
+
+def _build_sales(seller, payment_type, items, products):
+    """
+    Savat qatorlaridan saqlanmagan Sale obyektlari va har bir mahsulot uchun
+    jami talab {product_id: [quantity, weight]}. Qoldiq butun savat bo'yicha tekshiriladi.
+    """
+    sales = []
+    demand = defaultdict(lambda: [0, Decimal('0')])
+    for item in items:
+        product_id = _product_id(item.get('product_id'))
+        product = products.get(product_id)
+        if product is None:
+            raise CheckoutError(f"Mahsulot topilmadi: {item.get('product_id')}", status=404)
+        _check_product(product, seller)
+
+        quantity = item.get('quantity')
+        weight = item.get('weight')
+        if quantity is not None:
+            try:
+                quantity = int(quantity)
+            except (TypeError, ValueError):
+                raise CheckoutError(f"{product.name} uchun quantity noto'g'ri.")
+            if quantity <= 0:
+                raise CheckoutError(f"{product.name} uchun quantity noto'g'ri.")
+            demand[product_id][0] += quantity
+            if not product.quantity or product.quantity < demand[product_id][0]:
+                raise CheckoutError(f"{product.name} mahsulotining yetarli soni yo'q.")
+            sale_price, weight = product.price * quantity, None
+        elif weight is not None:
+            try:
+                weight = Decimal(str(weight))
+            except InvalidOperation:
+                raise CheckoutError(f"{product.name} uchun weight noto'g'ri.")
+            if not weight.is_finite() or weight <= 0:
+                raise CheckoutError(f"{product.name} uchun weight noto'g'ri.")
+            demand[product_id][1] += weight
+            if not product.weight or product.weight < demand[product_id][1]:
+                raise CheckoutError(f"{product.name} mahsulotining yetarli og'irligi yo'q.")
+            sale_price, quantity = product.price * weight, None
+        else:
+            raise CheckoutError(f"{product.name} uchun quantity yoki weight kiritilishi shart.")
+
+        sales.append(Sale(
+            product=product,
+            seller=seller,
+            sale_price=sale_price,
+            quantity=quantity,
+            product_weight=weight,
+            status='COMPLETED',
+            payment_type=payment_type,
+        ))
+    return sales, demand
+
+
+def _decrement_stock(products, demand):
+    # Har bir mahsulot uchun bitta shartli UPDATE; qoldiq yetmasa (parallel sotuv) hammasi bekor qilinadi
+    for product_id, (quantity, weight) in demand.items():
+        if not products[product_id].adjust_stock(quantity=-quantity, weight=-weight):
+            raise CheckoutError(f"{products[product_id].name} mahsulotining yetarli qoldig'i yo'q.")
+
+
+def refresh_sale_aggregates(sales):
+    # Sale.save va signallar qiladigan ishlar: rollup, oylik hisoblagichlar, snapshot va kesh
+    SaleDailyRollup.refresh(sales)
+    ProductMonthlyCounter.refresh(sales=sales)
+    CategoryMonthlyCounter.refresh(CategoryMonthlyCounter.cells(sales=sales))
+    for director_id, day in {(sale.product.admin_id, timezone.localdate(sale.sale_date)) for sale in sales}:
+        StatisticsSnapshot.invalidate(director_id, day)
+    for director_id in {sale.product.admin_id for sale in sales}:
+        invalidate_director(director_id)
+    invalidate_facts()
+
+
+@transaction.atomic
+def checkout(seller, buyer, payment_type, items):
+    """
+    Savatni sotadi va (chek, sotuv qatorlari) qaytaradi.
+    Biror qator noto'g'ri bo'lsa yoki qoldiq yetmasa CheckoutError, hech narsa saqlanmaydi.
+    """
+    products = Product.objects.select_for_update().in_bulk(
+        {_product_id(item.get('product_id')) for item in items}
+    )
+    sales, demand = _build_sales(seller, payment_type, items, products)
+
+    # Chek raqami sotuvchi hisoblagichidan: eski sotuvlarni skanerlash shart emas
+    receipt = Receipt.objects.create(
+        seller=seller,
+        number=ReceiptCounter.next_number(seller),
+        buyer=buyer,
+        payment_type=payment_type,
+        item_count=len(sales),
+        total_price=sum((sale.sale_price for sale in sales), Decimal('0')),
+    )
+    for sale in sales:
+        sale.receipt = receipt
+        sale.buyer = receipt.buyer_name
+    Sale.objects.bulk_create(sales)
+    _decrement_stock(products, demand)
+    refresh_sale_aggregates(sales)
+    return receipt, sales
+
+
+@transaction.atomic
+def cancel_sales(seller, sale_ids, reason_cancelled=''):
+    """
+    Sotuvchining sotuvlarini bitta tranzaksiyada bekor qiladi va topilganlar sonini qaytaradi.
+    Sotuvlar bitta so'rovda o'qiladi, holati bitta UPDATE bilan o'zgaradi, qoldiq har bir
+    mahsulot uchun bitta UPDATE bilan qaytariladi. Avval bekor qilinganlarning faqat sababi yangilanadi.
+    """
+    sales = list(
+        Sale.objects.select_for_update().select_related('product').filter(id__in=sale_ids, seller=seller)
+    )
+    if not sales:
+        return 0
+    Sale.objects.filter(pk__in=[sale.pk for sale in sales]).update(
+        status='CANCELLED', reason_cancelled=reason_cancelled, updated_at=timezone.now()
+    )
+
+    active = [sale for sale in sales if sale.status != 'CANCELLED']
+    restored = defaultdict(lambda: [0, Decimal('0')])
+    for sale in active:
+        restored[sale.product_id][0] += sale.quantity or 0
+        restored[sale.product_id][1] += sale.product_weight or 0
+    products = {sale.product_id: sale.product for sale in active}
+    for product_id, (quantity, weight) in restored.items():
+        products[product_id].adjust_stock(quantity=quantity, weight=weight)
+
+    # Rollup lar bazadan qayta quriladi, bekor qilingan sotuvlar ularga kirmaydi
+    refresh_sale_aggregates(active)
+    return len(sales)
@@ -3,6 +3,7 @@ from decimal import Decimal
 from django.contrib.auth.hashers import make_password
 from rest_framework.permissions import IsAuthenticated
 from .models import *
+from .cache import director_id_of
 from django.db.models import Sum
 from rest_framework.response import Response
 
@@ -527,8 +528,50 @@ class CartSerializer(serializers.ModelSerializer):
         return total
 
 
+class ExpenseCategorySerializer(serializers.ModelSerializer):
+    is_default = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExpenseCategory
+        fields = ['id', 'name', 'is_default']
+
+    def get_is_default(self, obj):
+        return obj.created_by_id is None
+
+    def validate_name(self, value):
+        director = director_id_of(self.context['request'].user)
+        if ExpenseCategory.for_director(director).filter(name__iexact=value).exists():
+            raise serializers.ValidationError("Bunday nomli xarajat kategoriyasi mavjud.")
+        return value
+
+
+class PayrollSnapshotSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='employee.username', read_only=True)
+
+    class Meta:
+        model = PayrollSnapshot
+        fields = [
+            'id', 'employee', 'username', 'month', 'sales_count', 'lending_count', 'kpi', 'salary',
+            'sales_kpi_total', 'lending_kpi_total', 'common_kpi_total', 'salary_kpi', 'created_at'
+        ]
+        read_only_fields = fields
+
+
 class CashWithdrawalSerializer(serializers.ModelSerializer):
     class Meta:
         model = CashWithdrawal
-        fields = ['id', 'seller', 'amount', 'comment', 'created_at']
-        read_only_fields = ['id', 'seller', 'created_at']
\ No newline at end of file
+        fields = ['id', 'seller', 'amount', 'comment', 'category', 'created_at']
+        read_only_fields = ['id', 'seller', 'created_at']
+
+    def validate(self, attrs):
+        director = director_id_of(self.context['request'].user)
+        category = attrs.get('category')
+        if category is not None:
+            if category.created_by_id not in (None, director):
+                raise serializers.ValidationError({"category": "Bu kategoriya sizga tegishli emas."})
+        elif attrs.get('comment'):
+            # Eski mijozlar: kategoriya izohdan aniqlanadi
+            attrs['category'] = ExpenseCategory.for_director(director).filter(
+                name__iexact=attrs['comment'].strip()
+            ).first()
+        return attrs
\ No newline at end of file
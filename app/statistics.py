@@ -0,0 +1,778 @@
+import calendar
+import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import models, connections, transaction, IntegrityError
+from django.db.models import Sum, Min, F, Q, Value, ExpressionWrapper, DecimalField, Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Trunc, Coalesce, ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import (
+    SALE_REVENUE, User, Sale, Lending, CashWithdrawal, SaleDailyRollup, LendingDailyRollup, PayrollSnapshot,
+    ProductMonthlyCounter, CategoryMonthlyCounter, StatisticsSnapshot,
+)
+from .factstore import get_fact_store, SALE, LENDING
+
+
+def local_now():
+    # Hozirgi vaqt direktor vaqt zonasida (settings.TIME_ZONE = Asia/Tashkent)
+    return timezone.localtime(timezone.now())
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    year, month = value.year + month // 12, month % 12 + 1
+    # 31-yanvar + 1 oy -> 28/29-fevral
+    return value.replace(year=year, month=month, day=min(value.day, calendar.monthrange(year, month)[1]))
+
+
+def period_range(period, now=None):
+    """
+    'day', 'week', 'month', 'year' davrlari uchun [start, end) oralig'ini qaytaradi.
+    """
+    now = now or local_now()
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'day':
+        return start, start + timedelta(days=1)
+    if period == 'week':
+        start -= timedelta(days=start.weekday())  # Dushanbadan boshlanadi
+        return start, start + timedelta(days=7)
+    if period == 'month':
+        start = start.replace(day=1)
+        return start, add_months(start, 1)
+    if period == 'year':
+        start = start.replace(month=1, day=1)
+        return start, start.replace(year=start.year + 1)
+    raise ValueError(f"Noma'lum davr: {period}")
+
+
+def local_datetime(year, month=1, day=1):
+    # Mahalliy vaqt zonasidagi kun boshi (aware datetime)
+    return datetime(year, month, day, tzinfo=timezone.get_current_timezone())
+
+
+def date_range(start_date, end_date):
+    """
+    Foydalanuvchi kiritgan [start_date, end_date] kunlarini (end_date ham kiradi)
+    mahalliy vaqtdagi yarim ochiq [start, end) oraliqqa aylantiradi.
+    """
+    start = datetime.combine(start_date, time.min, tzinfo=timezone.get_current_timezone())
+    end = datetime.combine(end_date + timedelta(days=1), time.min, tzinfo=timezone.get_current_timezone())
+    return start, end
+
+
+def in_range(field, start, end):
+    # field__range o'rniga: [start, end) - chegaradagi yozuvlar ikki marta sanalmaydi
+    return Q(**{f'{field}__gte': start, f'{field}__lt': end})
+
+
+def iter_buckets(start, end, kind):
+    # start allaqachon kind bo'yicha yaxlitlangan bo'lishi kerak
+    bucket = start
+    while bucket < end:
+        yield bucket
+        if kind == 'hour':
+            bucket += timedelta(hours=1)
+        elif kind == 'day':
+            bucket += timedelta(days=1)
+        elif kind == 'week':
+            bucket += timedelta(days=7)
+        elif kind == 'month':
+            bucket = add_months(bucket, 1)
+        elif kind == 'year':
+            bucket = bucket.replace(year=bucket.year + 1)
+        else:
+            raise ValueError(f"Noma'lum bucket: {kind}")
+
+
+def truncate(value, kind):
+    # Mahalliy vaqtni bucket boshiga yaxlitlash (hafta Dushanbadan)
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if kind == 'hour':
+        return value
+    value = value.replace(hour=0)
+    if kind == 'day':
+        return value
+    if kind == 'week':
+        return value - timedelta(days=value.weekday())
+    if kind == 'month':
+        return value.replace(day=1)
+    if kind == 'year':
+        return value.replace(month=1, day=1)
+    raise ValueError(f"Noma'lum bucket: {kind}")
+
+
+def bucket_totals(queryset, date_field, kind, value):
+    # Bitta GROUP BY so'rovi: {bucket boshlanishi: yig'indi}
+    tzinfo = None
+    if isinstance(queryset.model._meta.get_field(date_field), models.DateTimeField):
+        tzinfo = timezone.get_current_timezone()
+    rows = queryset.annotate(
+        bucket=Trunc(date_field, kind, tzinfo=tzinfo)
+    ).values('bucket').annotate(
+        total=Sum(value)
+    ).order_by()
+    return {row['bucket']: row['total'] or 0 for row in rows}
+
+
+def revenue_series(sources, start, end, kind):
+    """
+    sources: (queryset, date_field, value) lar ro'yxati. Har bir manba uchun
+    bitta so'rov bajariladi, bo'sh bucketlar 0 bilan to'ldiriladi.
+    """
+    totals = defaultdict(int)
+    for queryset, date_field, value in sources:
+        queryset = queryset.filter(**{f'{date_field}__gte': start, f'{date_field}__lt': end})
+        for bucket, total in bucket_totals(queryset, date_field, kind, value).items():
+            totals[bucket] += total
+    return [(bucket, totals[bucket]) for bucket in iter_buckets(start, end, kind)]
+
+
+def rollup_revenue_series(director, start, end, kind, lending_full_price=False):
+    """
+    Kunlik rollup jadvallaridan daromad seriyasi (start, end - sanalar, [start, end)).
+    So'rov narxi sotuvlar soniga emas, kunlar soniga bog'liq.
+    FACT_STORE_DIR sozlangan bo'lsa ustunli fakt nusxasidan vektorli hisoblanadi.
+    """
+    store = get_fact_store()
+    if store is not None:
+        buckets = list(iter_buckets(start, end, kind))
+        tzinfo = timezone.get_current_timezone()
+        boundaries = [datetime.combine(day, time.min, tzinfo=tzinfo) for day in buckets + [end]]
+        totals = store.bucket_totals(director.pk, boundaries, {
+            SALE: 'amount',
+            LENDING: 'full_amount' if lending_full_price else 'amount',
+        })
+        return list(zip(buckets, totals))
+    if lending_full_price:
+        lending_value = F('product__rental_price') * F('lend_count')
+    else:
+        lending_value = ExpressionWrapper(
+            F('product__rental_price') * F('paid_percentage') / 100.0,
+            output_field=DecimalField()
+        )
+    sources = [
+        (SaleDailyRollup.objects.filter(director=director), 'day', F('revenue')),
+        (LendingDailyRollup.objects.filter(director=director), 'day', lending_value),
+    ]
+    return revenue_series(sources, start, end, kind)
+
+
+def _count_by_seller(queryset):
+    # Sotuvchi bo'yicha sanoq uchun korrelyatsiyalangan subquery
+    return Coalesce(Subquery(
+        queryset.filter(seller=OuterRef('pk')).values('seller').annotate(
+            total=Count('id')
+        ).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def employee_activity(director, start, end):
+    """
+    Direktor yaratgan xodimlarning [start, end) oralig'idagi sotuv va ijaralar soni.
+    Barcha xodimlar uchun bitta so'rov: {username: sotuvlar + ijaralar}.
+    """
+    sales = Sale.objects.filter(product__admin=director, sale_date__gte=start, sale_date__lt=end)
+    lendings = Lending.objects.filter(product__admin=director, borrow_date__gte=start, borrow_date__lt=end)
+    employees = User.objects.filter(created_by=director).annotate(
+        sales_count=_count_by_seller(sales),
+        lending_count=_count_by_seller(lendings),
+    ).values_list('username', 'sales_count', 'lending_count')
+    return {username: sales_count + lending_count for username, sales_count, lending_count in employees}
+
+
+def _sum_by_seller(queryset, value):
+    # Sotuvchi bo'yicha yig'indi uchun korrelyatsiyalangan subquery (bo'lmasa 0)
+    return Coalesce(Subquery(
+        queryset.filter(seller=OuterRef('pk')).values('seller').annotate(
+            total=Sum(value)
+        ).values('total'),
+        output_field=DecimalField()
+    ), Value(Decimal(0)), output_field=DecimalField())
+
+
+def employee_metrics(employees, start, end):
+    """
+    Xodimlar querysetiga [start, end) oralig'i uchun sales_count, lending_count,
+    income va commission (KPI bo'yicha) annotatsiyalarini qo'shadi. Xodimlar soniga
+    bog'liq bo'lmagan bitta so'rov; saralash va sahifalash ham SQL da bajariladi.
+    """
+    sales = Sale.objects.filter(sale_date__gte=start, sale_date__lt=end)
+    lendings = Lending.objects.filter(borrow_date__gte=start, borrow_date__lt=end)
+    return employees.annotate(
+        sales_count=_count_by_seller(sales),
+        lending_count=_count_by_seller(lendings),
+        sales_income=_sum_by_seller(sales, SALE_REVENUE),
+        lending_income=_sum_by_seller(lendings, 'product__rental_price'),
+        # Komissiya faqat dona bo'yicha sotuvlardan (quantity bo'lmasa NULL - hisobga olinmaydi)
+        sales_kpi_base=_sum_by_seller(sales.filter(quantity__isnull=False), SALE_REVENUE),
+    ).annotate(
+        income=ExpressionWrapper(F('sales_income') + F('lending_income'), output_field=DecimalField()),
+        commission=ExpressionWrapper(
+            (F('sales_kpi_base') + F('lending_income')) * Coalesce(F('KPI'), Value(Decimal(0))) / 100.0,
+            output_field=DecimalField()
+        ),
+    )
+
+
+def payroll_rows(director, month):
+    """
+    Direktorning barcha xodimlari uchun oy (month - birinchi kun, date) bo'yicha
+    maosh va KPI. Xodimlar soniga bog'liq bo'lmagan bitta so'rov, saqlanmagan
+    PayrollSnapshot obyektlari ro'yxati qaytadi.
+    """
+    start = datetime.combine(month, time.min, tzinfo=timezone.get_current_timezone())
+    end = add_months(start, 1)
+    sales = Sale.objects.filter(sale_date__gte=start, sale_date__lt=end)
+    returned = Lending.objects.filter(borrow_date__gte=start, borrow_date__lt=end, status=Lending.RETURNED)
+    employees = User.objects.filter(created_by=director).annotate(
+        sales_count=_count_by_seller(sales),
+        lending_count=_count_by_seller(returned),
+        sales_base=_sum_by_seller(sales.filter(Q(quantity__isnull=False) | Q(product_weight__isnull=False)), SALE_REVENUE),
+        lending_base=_sum_by_seller(returned, 'product__rental_price'),
+    ).order_by('id')
+    rows = []
+    for employee in employees:
+        kpi = employee.KPI or Decimal(0)
+        sales_kpi_total = (employee.sales_base * kpi / 100).quantize(Decimal('0.01'))
+        lending_kpi_total = (employee.lending_base * kpi / 100).quantize(Decimal('0.01'))
+        rows.append(PayrollSnapshot(
+            director_id=getattr(director, 'pk', director),
+            employee=employee,
+            month=month,
+            sales_count=employee.sales_count,
+            lending_count=employee.lending_count,
+            kpi=kpi,
+            salary=employee.salary,
+            sales_kpi_total=sales_kpi_total,
+            lending_kpi_total=lending_kpi_total,
+            common_kpi_total=sales_kpi_total + lending_kpi_total,
+            salary_kpi=employee.salary + sales_kpi_total + lending_kpi_total,
+        ))
+    return rows
+
+
+@transaction.atomic
+def run_payroll(director, month, recompute=False):
+    """
+    Oy uchun payroll: mavjud snapshotlar o'zgarmaydi, faqat yo'qlari yaratiladi.
+    recompute=True bo'lsa oyning barcha snapshotlari qayta hisoblanadi.
+    """
+    snapshots = PayrollSnapshot.objects.filter(director=director, month=month)
+    if recompute:
+        snapshots.delete()
+    existing = set(snapshots.values_list('employee_id', flat=True))
+    PayrollSnapshot.objects.bulk_create([
+        row for row in payroll_rows(director, month) if row.employee_id not in existing
+    ])
+    return snapshots.select_related('employee').order_by('employee_id')
+
+
+def lending_histogram(director, start, end):
+    """
+    [start, end) oralig'idagi ijaralar foizlari taqsimoti bitta shartli COUNT so'rovida.
+    return_statistic kaliti - qaytarilgan ijaraning to'lanmagan qismi (100 - percentage).
+    """
+    percentages = range(0, 101, 25)
+    returned = Q(status=Lending.RETURNED)
+    counts = Lending.objects.filter(
+        product__admin=director, borrow_date__gte=start, borrow_date__lt=end
+    ).aggregate(
+        total_count=Count('id'),
+        total_return_count=Count('id', filter=returned),
+        **{f'lend_{p}': Count('id', filter=Q(percentage=f"{p}%")) for p in percentages},
+        **{f'return_{p}': Count('id', filter=returned & Q(percentage=f"{100 - p}%")) for p in percentages},
+    )
+    return {
+        'lend_statistic': {f"{p}%": counts[f'lend_{p}'] for p in percentages},
+        'return_statistic': {f"{p}%": counts[f'return_{p}'] for p in percentages},
+        'total_count': counts['total_count'],
+        'total_return_count': counts['total_return_count'],
+    }
+
+
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+
+def sales_heatmap(director, start, end, seller=None, by_seller=False):
+    """
+    [start, end) dagi bekor qilinmagan sotuvlar: hafta kuni (dushanba=0) x soat (0-23)
+    bo'yicha summa va soni, mahalliy vaqtda. Bitta GROUP BY so'rovi.
+    by_seller=True bo'lsa har bir sotuvchi uchun alohida matritsa ham qaytariladi.
+    """
+    tzinfo = timezone.get_current_timezone()
+    sales = Sale.objects.filter(
+        product__admin=director, sale_date__gte=start, sale_date__lt=end
+    ).exclude(status='CANCELLED')
+    if seller is not None:
+        sales = sales.filter(seller_id=seller)
+    group = ['seller_id', 'seller__username'] if by_seller else []
+    rows = sales.annotate(
+        weekday=ExtractIsoWeekDay('sale_date', tzinfo=tzinfo),
+        hour=ExtractHour('sale_date', tzinfo=tzinfo),
+    ).values(*group, 'weekday', 'hour').annotate(
+        total_revenue=Sum(SALE_REVENUE),
+        total_count=Count('id'),
+    ).order_by()
+
+    def empty():
+        return {'revenue': [[0] * 24 for _ in WEEKDAYS], 'count': [[0] * 24 for _ in WEEKDAYS]}
+
+    result = {'days': list(WEEKDAYS), 'hours': list(range(24)), **empty()}
+    sellers = {}
+    for row in rows:
+        day, hour = row['weekday'] - 1, row['hour']
+        targets = [result]
+        if by_seller:
+            if row['seller_id'] not in sellers:
+                sellers[row['seller_id']] = {'seller_id': row['seller_id'], 'username': row['seller__username'], **empty()}
+            targets.append(sellers[row['seller_id']])
+        for target in targets:
+            target['revenue'][day][hour] += row['total_revenue'] or 0
+            target['count'][day][hour] += row['total_count']
+    if by_seller:
+        result['sellers'] = sorted(sellers.values(), key=lambda item: item['username'])
+    return result
+
+
+def sales_heatmap_hourly(director, start, end, seller=None):
+    # Taqqoslash uchun eski usul: har bir soat uchun alohida aggregate so'rovi
+    result = {'days': list(WEEKDAYS), 'hours': list(range(24)),
+              'revenue': [[0] * 24 for _ in WEEKDAYS], 'count': [[0] * 24 for _ in WEEKDAYS]}
+    sales = Sale.objects.filter(product__admin=director).exclude(status='CANCELLED')
+    if seller is not None:
+        sales = sales.filter(seller_id=seller)
+    for bucket in iter_buckets(truncate(timezone.localtime(start), 'hour'), end, 'hour'):
+        bucket = timezone.localtime(bucket)
+        totals = sales.filter(sale_date__gte=bucket, sale_date__lt=bucket + timedelta(hours=1)).aggregate(
+            revenue=Sum(SALE_REVENUE), count=Count('id')
+        )
+        result['revenue'][bucket.weekday()][bucket.hour] += totals['revenue'] or 0
+        result['count'][bucket.weekday()][bucket.hour] += totals['count']
+    return result
+
+
+TOP_PRODUCT_ORDERING = {
+    'sold': ('-total_sold', '-sale_income', 'product_id'),
+    'lended': ('-total_lent', '-lend_income', 'product_id'),
+}
+
+
+def year_month_params(params):
+    """
+    So'rovdagi ?year= (standart - joriy yil) va ixtiyoriy ?month= ni tekshiradi.
+    (year, month yoki None) qaytaradi, noto'g'ri qiymatda ValueError (xabari javob uchun).
+    """
+    try:
+        year = int(params.get('year') or timezone.localdate().year)
+        month = int(params['month']) if params.get('month') else None
+    except ValueError:
+        raise ValueError("year va month butun son bo'lishi kerak")
+    if not 1 <= year <= 9999:
+        raise ValueError("year 1 va 9999 oralig'ida bo'lishi kerak")
+    if month is not None and not 1 <= month <= 12:
+        raise ValueError("month 1 va 12 oralig'ida bo'lishi kerak")
+    return year, month
+
+
+def top_products(director_id, year, month=None, by='sold', limit=10):
+    """
+    Direktorning top mahsulotlari oylik hisoblagichlardan (ProductMonthlyCounter).
+    Yil uchun mahsulotning 12 tagacha oylik qatori bitta GROUP BY da qo'shiladi.
+    """
+    # Oy kalitlari bo'yicha oraliq: (director, month) indeksidan foydalanadi
+    first, last = (date(year, month, 1), date(year, month, 1)) if month else (date(year, 1, 1), date(year, 12, 1))
+    counters = ProductMonthlyCounter.objects.filter(director_id=director_id, month__gte=first, month__lte=last)
+    rows = counters.values('product_id', 'product__name', 'product__category__name').annotate(
+        total_sold=Sum('sale_count'),
+        total_lent=Sum('lend_count'),
+        total_quantity=Sum('quantity'),
+        total_weight=Sum('weight'),
+        sale_income=Sum('revenue'),
+        lend_income=Coalesce(
+            Sum(F('lend_count') * F('product__rental_price'), output_field=DecimalField()),
+            Value(Decimal(0)), output_field=DecimalField()
+        ),
+    )
+    rows = rows.filter(total_sold__gt=0) if by == 'sold' else rows.filter(total_lent__gt=0)
+    return list(rows.order_by(*TOP_PRODUCT_ORDERING[by])[:limit])
+
+
+CATEGORY_SHARE_MODES = {
+    'products': 'total_products',  # yaratilgan mahsulotlar soni (avvalgi xatti-harakat)
+    'count': 'total_sales',  # bekor qilinmagan sotuvlar soni
+    'revenue': 'total_revenue',
+}
+
+
+def category_share(director_id, year, month=None, mode='products'):
+    """
+    Kategoriyalar ulushi oylik kategoriya hisoblagichlaridan (CategoryMonthlyCounter),
+    mahsulot yoki sotuv jadvallari skanerlanmaydi.
+    """
+    value = CATEGORY_SHARE_MODES[mode]
+    # Oy kalitlari bo'yicha oraliq: (director, month) indeksidan foydalanadi
+    first, last = (date(year, month, 1), date(year, month, 1)) if month else (date(year, 1, 1), date(year, 12, 1))
+    counters = CategoryMonthlyCounter.objects.filter(director_id=director_id, month__gte=first, month__lte=last)
+    rows = list(counters.values('category__name').annotate(
+        total_products=Sum('product_count'),
+        total_sales=Sum('sale_count'),
+        total_quantity=Sum('quantity'),
+        total_weight=Sum('weight'),
+        total_revenue=Sum('revenue'),
+    ).filter(**{f'{value}__gt': 0}).order_by(f'-{value}', 'category__name'))
+    total = sum(row[value] for row in rows) or 1  # 0 bo'lsa bo'linishda xatolik bo'lmasin
+    for row in rows:
+        row['percent'] = round(float(row[value]) * 100 / float(total), 2)
+    return rows
+
+
+def is_closed_period(period, period_start):
+    return StatisticsSnapshot.period_end(period, period_start) <= timezone.localdate()
+
+
+def closed_snapshots(director, endpoint, period, starts):
+    # {period_start: data} - bitta indeksli so'rov (director, endpoint, period, period_start)
+    return dict(StatisticsSnapshot.objects.filter(
+        director=director, endpoint=endpoint, period=period, period_start__in=starts
+    ).values_list('period_start', 'data'))
+
+
+def save_snapshot(director, endpoint, period, period_start, data):
+    """
+    Javobni JSON ko'rinishida saqlaydi va saqlangan ko'rinishni qaytaradi (Decimal -> float,
+    Response bilan bir xil). Parallel so'rov allaqachon saqlagan bo'lsa xato bermaydi.
+    """
+    data = json.loads(json.dumps(data, cls=JSONEncoder))
+    try:
+        with transaction.atomic():
+            StatisticsSnapshot.objects.create(
+                director=director, endpoint=endpoint, period=period, period_start=period_start, data=data
+            )
+    except IntegrityError:
+        pass
+    return data
+
+
+def first_activity_date(director):
+    # Direktorning birinchi sotuv yoki ijara kuni (rollup lardan, (director, day) indeksi), bo'lmasa None
+    days = [
+        rollup.objects.filter(director=director).aggregate(first=Min('day'))['first']
+        for rollup in (SaleDailyRollup, LendingDailyRollup)
+    ]
+    return min((day for day in days if day is not None), default=None)
+
+
+def period_snapshot(director, endpoint, period, period_start, compute):
+    """
+    Yopilgan davr uchun saqlangan natija yoki compute() natijasini saqlab qaytaradi.
+    Ochiq (joriy yoki kelajak) davr har doim qayta hisoblanadi.
+    """
+    if not is_closed_period(period, period_start):
+        return compute()
+    stored = closed_snapshots(director, endpoint, period, [period_start])
+    if period_start in stored:
+        return stored[period_start]
+    return save_snapshot(director, endpoint, period, period_start, compute())
+
+
+def _run_in_thread(func, tzinfo):
+    # Har bir thread o'z DB ulanishini ochadi, ish tugagach yopamiz
+    try:
+        with timezone.override(tzinfo):
+            return func()
+    finally:
+        connections.close_all()
+
+
+def run_concurrently(tasks, max_workers=None):
+    """
+    tasks: {nom: argumentsiz funksiya}. Mustaqil hisoblarni cheklangan thread pool da
+    parallel bajaradi va natijalarni shu tartibda qaytaradi.
+    max_workers <= 1 bo'lsa (SQLite da standart) ketma-ket bajariladi.
+    """
+    if max_workers is None:
+        default = 1 if connections['default'].vendor == 'sqlite' else 4
+        max_workers = getattr(settings, 'STATISTICS_MAX_WORKERS', default)
+    if max_workers <= 1 or len(tasks) <= 1:
+        return {name: func() for name, func in tasks.items()}
+    tzinfo = timezone.get_current_timezone()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as pool:
+        futures = {name: pool.submit(_run_in_thread, func, tzinfo) for name, func in tasks.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+# Dinamika grafiklari uchun asosiy ko'rsatkichlar: (model, sana maydoni, qiymat)
+SERIES_METRICS = {
+    'sales_revenue': (Sale, 'sale_date', SALE_REVENUE),
+    'lending_revenue': (Lending, 'borrow_date', F('product__rental_price')),
+    'expense': (CashWithdrawal, 'created_at', F('amount')),
+}
+SERIES_GRANULARITIES = ('hour', 'day', 'week', 'month', 'year')
+SERIES_LABELS = {
+    'hour': '%Y-%m-%d %H:%M',
+    'day': '%Y-%m-%d',
+    'week': '%Y-%m-%d',
+    'month': '%Y-%m',
+    'year': '%Y',
+}
+SERIES_MIN_STEP = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(days=7),
+    'month': timedelta(days=28),
+    'year': timedelta(days=365),
+}
+MAX_SERIES_BUCKETS = 1000
+
+
+def time_series(metrics, start, end, granularity, querysets=None):
+    """
+    [start, end) oralig'i uchun granularity bo'yicha seriya: [(bucket, {metric: total})].
+    Har bir ko'rsatkich uchun bitta GROUP BY so'rovi, bucketlar soniga bog'liq emas.
+    querysets: {metric: queryset} - masalan direktor bo'yicha filtrlangan manbalar.
+    """
+    querysets = querysets or {}
+    start = truncate(timezone.localtime(start), granularity)
+    series = {}
+    for metric in metrics:
+        model, date_field, value = SERIES_METRICS[metric]
+        queryset = querysets.get(metric, model.objects.all())
+        series[metric] = revenue_series([(queryset, date_field, value)], start, end, granularity)
+    buckets = list(iter_buckets(start, end, granularity))
+    return [
+        (bucket, {metric: series[metric][i][1] for metric in metrics})
+        for i, bucket in enumerate(buckets)
+    ]
+
+
+# Fakt nusxasidan olinadigan SERIES_METRICS: (fakt turi, ustun). Xom jadvallar kabi
+# bekor qilingan sotuvlar ham, ijara to'liq rental_price bilan
+STORE_SERIES = {
+    'sales_revenue': (SALE, 'amount'),
+    'lending_revenue': (LENDING, 'full_amount'),
+}
+
+
+def director_time_series(director_id, metrics, start, end, granularity):
+    """
+    Direktor ma'lumotlari bo'yicha time_series. FACT_STORE_DIR sozlangan bo'lsa sotuv va ijara
+    ko'rsatkichlari ustunli nusxadan vektorli hisoblanadi, qolganlari (chiqimlar) SQL dan.
+    """
+    store = get_fact_store()
+    stored = [metric for metric in metrics if store is not None and metric in STORE_SERIES]
+    series = time_series(
+        [metric for metric in metrics if metric not in stored], start, end, granularity, director_querysets(director_id)
+    )
+    if stored:
+        boundaries = [bucket for bucket, _ in series] + [end]
+        for metric in stored:
+            kind, column = STORE_SERIES[metric]
+            totals = store.bucket_totals(director_id, boundaries, {kind: column}, include_cancelled=True)
+            for (_, values), total in zip(series, totals):
+                # SQL yo'li kabi Decimal (summalar 2 xonali), bo'sh bucket 0
+                values[metric] = Decimal(str(round(total, 2))) if total else 0
+    return series
+
+
+def parse_local_date(value):
+    try:
+        day = datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        raise ValueError("Sana formati noto'g'ri (YYYY-MM-DD)")
+    return datetime.combine(day, time.min, tzinfo=timezone.get_current_timezone())
+
+
+def resolve_series_range(params):
+    """
+    So'rov parametrlaridan (start, end, granularity, label_format) ni aniqlaydi.
+    Tayyor davrlar: ?period=year|month|week|day (&year=). Ixtiyoriy oraliq:
+    ?start_date=&end_date= (end_date ham kiradi) yoki ?days=90, &granularity=.
+    Noto'g'ri parametrlar uchun ValueError.
+    """
+    now = local_now()
+    if params.get('start_date') or params.get('end_date') or params.get('days'):
+        if params.get('days'):
+            try:
+                days = int(params['days'])
+            except ValueError:
+                raise ValueError("days butun son bo'lishi kerak")
+            if days < 1:
+                raise ValueError("days musbat bo'lishi kerak")
+            end = truncate(now, 'day') + timedelta(days=1)
+            start = end - timedelta(days=days)
+        else:
+            start = parse_local_date(params.get('start_date'))
+            end = parse_local_date(params.get('end_date')) + timedelta(days=1)
+        if start >= end:
+            raise ValueError("start_date end_date dan katta bo'lmasligi kerak")
+        granularity = params.get('granularity', 'day')
+        if granularity not in SERIES_GRANULARITIES:
+            raise ValueError("granularity noto'g'ri")
+        label_format = SERIES_LABELS[granularity]
+    else:
+        period = params.get('period', 'month')
+        try:
+            year = int(params.get('year', now.year))
+        except ValueError:
+            raise ValueError("year butun son bo'lishi kerak")
+        if period == 'year':
+            start = truncate(now, 'year').replace(year=year - 4)  # oxirgi 5 yil
+            end = start.replace(year=year + 1)
+            granularity, label_format = 'year', '%Y'
+        elif period == 'month':
+            start = truncate(now, 'year').replace(year=year)
+            end = start.replace(year=year + 1)
+            granularity, label_format = 'month', '%b'
+        elif period == 'week':
+            start, end = period_range('week', now)
+            granularity, label_format = 'day', '%A'
+        elif period == 'day':
+            start, end = period_range('day', now)
+            granularity, label_format = 'hour', None  # "HH:MM-HH:MM"
+        else:
+            raise ValueError("period noto'g'ri")
+    if (end - start) / SERIES_MIN_STEP[granularity] > MAX_SERIES_BUCKETS:
+        raise ValueError(f"Oraliq juda katta (ko'pi bilan {MAX_SERIES_BUCKETS} ta nuqta)")
+    return start, end, granularity, label_format
+
+
+def series_label(bucket, label_format):
+    if label_format is None:
+        return f"{bucket.strftime('%H:%M')}-{(bucket + timedelta(hours=1)).strftime('%H:%M')}"
+    return bucket.strftime(label_format)
+
+
+def director_querysets(director):
+    # SERIES_METRICS manbalari faqat shu direktor ma'lumotlari bilan
+    return {
+        'sales_revenue': Sale.objects.filter(product__admin=director),
+        'lending_revenue': Lending.objects.filter(product__admin=director),
+        'expense': CashWithdrawal.objects.filter(Q(seller=director) | Q(seller__created_by=director)),
+    }
+
+
+def shift_range(start, end, period=None, months=None):
+    """
+    [start, end) ni orqaga suradi: months berilsa shuncha oyga (12 - o'tgan yilning
+    shu davri), period berilsa bitta davrga, aks holda oraliq uzunligiga.
+    """
+    if months is None and period in ('month', 'year'):
+        months = 1 if period == 'month' else 12
+    if months is not None:
+        return add_months(start, -months), add_months(end, -months)
+    return start - (end - start), start
+
+
+def resolve_comparison(params):
+    """
+    StatisticsReportView uchun joriy va solishtiriladigan [start, end) oraliqlari.
+    Joriy: ?start_date=&end_date= yoki ?period=day|week|month|year, aks holda butun davr (None).
+    Solishtirish: ?compare_start=&compare_end=, ?compare=last_year yoki oldingi teng davr.
+    """
+    period = params.get('period')
+    if params.get('start_date') and params.get('end_date'):
+        current = (parse_local_date(params['start_date']), parse_local_date(params['end_date']) + timedelta(days=1))
+        period = None
+    elif period in ('day', 'week', 'month', 'year'):
+        current = period_range(period)
+    else:
+        return None, None
+    if current[0] >= current[1]:
+        raise ValueError("start_date end_date dan katta bo'lmasligi kerak")
+
+    if params.get('compare_start') and params.get('compare_end'):
+        previous = (parse_local_date(params['compare_start']), parse_local_date(params['compare_end']) + timedelta(days=1))
+    elif params.get('compare') == 'last_year':
+        previous = shift_range(*current, months=12)
+    elif params.get('compare', 'previous') == 'previous':
+        previous = shift_range(*current, period=period)
+    else:
+        raise ValueError("compare noto'g'ri (previous yoki last_year)")
+    return current, previous
+
+
+def compare_totals(metrics, ranges, querysets):
+    """
+    ranges: {nom: (start, end) yoki None - butun davr}. Har bir jadval uchun bitta
+    shartli aggregate: {nom: {metric: total}}. Sana filtrlari ustunni funksiyaga
+    o'ramaydi, shuning uchun (sana) indekslaridan foydalanish mumkin.
+    """
+    result = {name: {} for name in ranges}
+    for metric in metrics:
+        _, date_field, value = SERIES_METRICS[metric]
+        conditions = {
+            name: Q() if bounds is None else Q(**{f'{date_field}__gte': bounds[0], f'{date_field}__lt': bounds[1]})
+            for name, bounds in ranges.items()
+        }
+        queryset = querysets[metric]
+        if all(bounds is not None for bounds in ranges.values()):
+            any_range = Q()
+            for condition in conditions.values():
+                any_range |= condition
+            queryset = queryset.filter(any_range)
+        totals = queryset.aggregate(**{
+            name: Sum(value, filter=condition) if condition else Sum(value)
+            for name, condition in conditions.items()
+        })
+        for name in ranges:
+            result[name][metric] = totals[name] or 0
+    return result
+
+
+GROWTH_PERIODS = ('day', 'week', 'month', 'year')
+MAX_GROWTH_PERIODS = 24
+# Hosilaviy ko'rsatkichlar SERIES_METRICS yig'indilaridan
+DERIVED_METRICS = {
+    'total_revenue': lambda totals: totals['sales_revenue'] + totals['lending_revenue'],
+    'net_profit': lambda totals: totals['sales_revenue'] + totals['lending_revenue'] - totals['expense'],
+}
+
+
+def growth_ranges(period, count, now=None):
+    """
+    Joriy davr bilan tugaydigan count+1 ta ketma-ket [start, end) oraliq (eskisidan
+    yangisiga) - birinchisi faqat eng eski davr o'sishini hisoblash uchun.
+    """
+    ranges = [period_range(period, now)]
+    for _ in range(count):
+        ranges.insert(0, shift_range(*ranges[0], period=period))
+    return ranges
+
+
+def growth_totals(metrics, period, count, querysets, year_over_year=True, now=None):
+    """
+    Har bir jadval uchun bitta shartli aggregate (compare_totals): count ta davr,
+    bitta oldingi davr va yoy=True bo'lsa ularning o'tgan yilgi tengi.
+    Natija: [(start, end, {metric: total}, {metric: o'tgan yil} yoki None)], eski -> yangi,
+    hamda birinchi davrdan oldingi davr yig'indilari.
+    """
+    base = sorted({
+        source
+        for metric in metrics
+        for source in (['sales_revenue', 'lending_revenue', 'expense'] if metric in DERIVED_METRICS else [metric])
+    })
+    periods = growth_ranges(period, count, now)
+    ranges = {f'p{index}': bounds for index, bounds in enumerate(periods)}
+    if year_over_year:
+        ranges.update({f'y{index}': shift_range(*bounds, months=12) for index, bounds in enumerate(periods) if index})
+    totals = compare_totals(base, ranges, querysets)
+
+    def pick(name):
+        values = totals[name]
+        return {
+            metric: DERIVED_METRICS[metric](values) if metric in DERIVED_METRICS else values[metric]
+            for metric in metrics
+        }
+
+    rows = [
+        (start, end, pick(f'p{index}'), pick(f'y{index}') if year_over_year else None)
+        for index, (start, end) in enumerate(periods) if index
+    ]
+    return rows, pick('p0')
@@ -1,3 +1,644 @@
-from django.test import TestCase
+import calendar
+import csv
+import threading
+import zipfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .analytics import parse_query, run_query
+from .statistics import (
+    top_products, category_share, CATEGORY_SHARE_MODES, sales_heatmap_hourly, parse_local_date,
+    date_range, period_range, resolve_series_range,
+)
+from .models import (
+    User, Category, Product, Sale, Lending, Receipt, CashWithdrawal, PayrollSnapshot, SaleDailyRollup, LendingDailyRollup,
+    StatisticsSnapshot,
+)
+from .sales import checkout, cancel_sales, CheckoutError
+
+
+class ConcurrentStockTest(TransactionTestCase):
+    # Bir nechta kassa bir vaqtda bitta mahsulotni sotganda qoldiq manfiy bo'lmasligi va yo'qolmasligi
+    THREADS = 8
+    ATTEMPTS = 5
+
+    def setUp(self):
+        self.director = User.objects.create_user(username='director', role=User.DIRECTOR)
+        self.sellers = [
+            User.objects.create_user(username=f'seller{i}', role=User.SELLER, created_by=self.director)
+            for i in range(self.THREADS)
+        ]
+
+    def create_product(self, quantity=None, weight=None):
+        return Product.objects.create(
+            name='Mahsulot', description='', price=Decimal('10'), created_by=self.director,
+            admin=self.director, choice='SELL', quantity=quantity, weight=weight,
+        )
+
+    def sell_concurrently(self, product, quantity=None, weight=None):
+        # Har bir oqim ATTEMPTS marta sotishga urinadi; muvaffaqiyatli sotuvlar sonini qaytaradi
+        sold = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker(seller):
+            # Kassadagi mahsulot obyekti bir marta o'qiladi va keyin eskiradi
+            stale_product = Product.objects.get(pk=product.pk)
+            try:
+                barrier.wait()
+                for _ in range(self.ATTEMPTS):
+                    while True:
+                        try:
+                            Sale(
+                                product=stale_product, seller=seller, buyer='xaridor',
+                                sale_price=product.price, quantity=quantity, product_weight=weight,
+                                status='COMPLETED',
+                            ).save()
+                            sold.append(1)
+                        except ValidationError:
+                            pass  # qoldiq tugagan
+                        except OperationalError:
+                            continue  # SQLite yozishni qulflagan, qayta urinamiz
+                        break
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(seller,)) for seller in self.sellers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(sold)
+
+    def test_no_oversell(self):
+        product = self.create_product(quantity=12)
+        sold = self.sell_concurrently(product, quantity=1)
+        product.refresh_from_db()
+        self.assertEqual(sold, 12)
+        self.assertEqual(product.quantity, 0)
+        self.assertEqual(Sale.objects.filter(product=product).count(), 12)
+
+    def test_no_lost_updates(self):
+        product = self.create_product(quantity=1000)
+        sold = self.sell_concurrently(product, quantity=3)
+        product.refresh_from_db()
+        self.assertEqual(sold, self.THREADS * self.ATTEMPTS)
+        self.assertEqual(product.quantity, 1000 - 3 * sold)
+
+    def test_no_oversell_by_weight(self):
+        product = self.create_product(weight=Decimal('10.00'))
+        sold = self.sell_concurrently(product, weight=Decimal('1.50'))
+        product.refresh_from_db()
+        self.assertEqual(sold, 6)
+        self.assertEqual(product.weight, Decimal('1.00'))
+
+    def test_cancel_and_reactivate_restore_stock(self):
+        product = self.create_product(quantity=5)
+        sale = Sale(product=product, seller=self.sellers[0], buyer='xaridor', sale_price=product.price, quantity=5)
+        sale.save()
+        sale.status = 'CANCELLED'
+        sale.save()
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 5)
+
+        # Bekor qilingan paytda qoldiq sotib yuborilsa, qayta tiklash rad etiladi
+        Sale(product=product, seller=self.sellers[1], buyer='xaridor', sale_price=product.price, quantity=4).save()
+        sale.status = 'COMPLETED'
+        with self.assertRaises(ValidationError):
+            sale.save()
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 1)
+
+
+class SalesTestCase(TestCase):
+    def setUp(self):
+        self.director = User.objects.create_user(username='director', role=User.DIRECTOR)
+        self.seller = User.objects.create_user(username='seller', role=User.SELLER, created_by=self.director)
+        self.pieces = self.create_product(quantity=5)
+        self.bulk = self.create_product(weight=Decimal('10.00'))
+
+    def create_product(self, quantity=None, weight=None, **fields):
+        fields = {'choice': 'SELL', 'price': Decimal('10'), 'admin': self.director, **fields}
+        return Product.objects.create(
+            name='Mahsulot', description='', created_by=self.director,
+            quantity=quantity, weight=weight, **fields,
+        )
+
+    def assert_stock(self, quantity, weight):
+        self.pieces.refresh_from_db()
+        self.bulk.refresh_from_db()
+        self.assertEqual(self.pieces.quantity, quantity)
+        self.assertEqual(self.bulk.weight, weight)
+
+    def assert_rollups_match(self):
+        # Farq bo'lsa buyruq CommandError ko'taradi
+        call_command('rebuild_rollups', verify=True, stdout=StringIO())
+
+
+class RollupMaintenanceTest(SalesTestCase):
+    # Sale/Lending save va delete tegishli rollup kataklarini qayta hisoblaydi
+    def sale_cells(self):
+        return set(SaleDailyRollup.objects.values_list('payment_type', 'day', 'sale_count', 'revenue'))
+
+    def test_sale_save_and_delete(self):
+        today = timezone.localdate()
+        sale = Sale.objects.create(
+            product=self.pieces, seller=self.seller, buyer='xaridor', sale_price=Decimal('30'),
+            quantity=3, status='COMPLETED',
+        )
+        self.assertEqual(self.sale_cells(), {('CASH', today, 1, Decimal('30'))})
+
+        # Kalit o'zgarsa eski katak ham qayta hisoblanadi
+        sale.payment_type = 'CARD'
+        sale.sale_date -= timedelta(days=1)
+        sale.save()
+        self.assertEqual(self.sale_cells(), {('CARD', today - timedelta(days=1), 1, Decimal('30'))})
+        self.assert_rollups_match()
+
+        sale.status = 'CANCELLED'
+        sale.save()
+        self.assertEqual(self.sale_cells(), set())
+        self.assert_stock(5, Decimal('10.00'))
+
+        sale.status = 'COMPLETED'
+        sale.save()
+        sale.delete()
+        self.assertEqual(self.sale_cells(), set())
+        self.assert_rollups_match()
+
+    def test_lending_save_and_delete(self):
+        product = self.create_product(quantity=1, choice='RENT', price=None, rental_price=Decimal('40'))
+        lending = Lending.objects.create(
+            product=product, seller=self.seller, borrower_name='ijarachi', return_date=timezone.now(),
+            percentage='25%', pledge='pledge_img/test.png',
+        )
+        rollup = LendingDailyRollup.objects.get()
+        self.assertEqual((rollup.lend_count, rollup.returned_count, rollup.paid_percentage), (1, 0, 25))
+
+        lending.status = Lending.RETURNED
+        lending.actual_return_date = timezone.localdate()
+        lending.save()
+        rollup = LendingDailyRollup.objects.get()
+        self.assertEqual((rollup.lend_count, rollup.returned_count, rollup.paid_percentage), (1, 1, 100))
+        self.assert_rollups_match()
+
+        lending.delete()
+        self.assertFalse(LendingDailyRollup.objects.exists())
+        self.assert_rollups_match()
+
+
+class CheckoutTest(SalesTestCase):
+    # Savat bitta tranzaksiyada: hammasi yoki hech narsa
+
+    def test_failing_line_saves_nothing(self):
+        items = [
+            {'product_id': self.bulk.pk, 'weight': '2.5'},
+            {'product_id': self.pieces.pk, 'quantity': 6},
+        ]
+        with self.assertRaises(CheckoutError):
+            checkout(self.seller, 'xaridor', 'CASH', items)
+        with self.assertRaises(CheckoutError) as error:
+            checkout(self.seller, 'xaridor', 'CASH', [items[0], {'product_id': 0, 'quantity': 1}])
+        self.assertEqual(error.exception.status, 404)
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(Receipt.objects.exists())
+        self.assert_stock(5, Decimal('10.00'))
+
+    def test_stock_checked_against_whole_basket(self):
+        items = [{'product_id': self.pieces.pk, 'quantity': 3}, {'product_id': self.pieces.pk, 'quantity': 3}]
+        with self.assertRaises(CheckoutError):
+            checkout(self.seller, 'xaridor', 'CASH', items)
+        self.assert_stock(5, Decimal('10.00'))
+
+        items[1]['quantity'] = 2
+        receipt, sales = checkout(self.seller, 'xaridor', 'CASH', items)
+        self.assertEqual(receipt.item_count, 2)
+        self.assertEqual(len(sales), 2)
+        self.assert_stock(0, Decimal('10.00'))
+
+    def test_rollups_match_after_checkout(self):
+        receipt, sales = checkout(self.seller, 'xaridor', 'CASH', [
+            {'product_id': self.pieces.pk, 'quantity': 2},
+            {'product_id': self.bulk.pk, 'weight': '1.25'},
+        ])
+        self.assertEqual(receipt.total_price, Decimal('32.50'))
+        self.assert_stock(3, Decimal('8.75'))
+        self.assert_rollups_match()
+
+
+class ReceiptNumberTest(SalesTestCase):
+    # Chek raqami sotuvchi bo'yicha ketma-ket; bekor bo'lgan checkout raqam yemaydi
+    def test_numbers_per_seller(self):
+        other = User.objects.create_user(username='other', role=User.SELLER, created_by=self.director)
+        item = [{'product_id': self.pieces.pk, 'quantity': 1}]
+        first, _ = checkout(self.seller, 'xaridor', 'CASH', item)
+        with self.assertRaises(CheckoutError):
+            checkout(self.seller, 'xaridor', 'CASH', [{'product_id': self.pieces.pk, 'quantity': 10}])
+        second, sales = checkout(self.seller, 'xaridor', 'CARD', item)
+        third, _ = checkout(other, 'xaridor', 'CASH', item)
+
+        self.assertEqual([first.number, second.number, third.number], [1, 2, 1])
+        self.assertEqual(sales[0].buyer, 'xaridor-2')
+        self.assertEqual(sales[0].receipt_id, second.pk)
+        self.assertEqual((second.item_count, second.total_price, second.payment_type), (1, Decimal('10'), 'CARD'))
+
+
+class CancelSalesTest(SalesTestCase):
+    # Ko'plab bekor qilish: qoldiq bir marta qaytadi, rollup lar mos qoladi
+    def setUp(self):
+        super().setUp()
+        _, self.sales = checkout(self.seller, 'xaridor', 'CASH', [
+            {'product_id': self.pieces.pk, 'quantity': 2},
+            {'product_id': self.bulk.pk, 'weight': '1.25'},
+        ])
+        self.ids = [sale.pk for sale in self.sales]
+
+    def test_stock_restored_once(self):
+        self.assertEqual(cancel_sales(self.seller, self.ids, 'xato'), 2)
+        self.assert_stock(5, Decimal('10.00'))
+        self.assertEqual(cancel_sales(self.seller, self.ids, 'xato'), 2)
+        self.assert_stock(5, Decimal('10.00'))
+
+    def test_cancelled_sales_only_get_new_reason(self):
+        cancel_sales(self.seller, self.ids[:1], 'birinchi')
+        cancel_sales(self.seller, self.ids, 'ikkinchi')
+        self.assertEqual(
+            set(Sale.objects.filter(pk__in=self.ids).values_list('status', 'reason_cancelled')),
+            {('CANCELLED', 'ikkinchi')},
+        )
+        self.assert_stock(5, Decimal('10.00'))
+
+    def test_other_sellers_sales_ignored(self):
+        other = User.objects.create_user(username='other', role=User.SELLER, created_by=self.director)
+        _, other_sales = checkout(other, 'xaridor', 'CASH', [{'product_id': self.pieces.pk, 'quantity': 1}])
+        self.assertEqual(cancel_sales(self.seller, self.ids + [other_sales[0].pk]), 2)
+        self.assertEqual(Sale.objects.get(pk=other_sales[0].pk).status, 'COMPLETED')
+        self.assert_stock(4, Decimal('10.00'))
+        self.assertEqual(cancel_sales(self.seller, [other_sales[0].pk]), 0)
+
+    def test_bulk_view_rejects_boolean_ids(self):
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        url = reverse('app:sale-cancel-bulk')
+        response = client.post(url, {'ids': [True]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Sale.objects.filter(status='CANCELLED').count(), 0)
+        response = client.post(url, {'ids': [self.ids[0], str(self.ids[1])]}, format='json')
+        self.assertEqual(response.data['updated_count'], 2)
+
+    def test_rollups_match_after_cancel(self):
+        cancel_sales(self.seller, self.ids[:1])
+        self.assert_rollups_match()
+        cancel_sales(self.seller, self.ids)
+        self.assert_rollups_match()
+
+
+class AnalyticsQueryTest(SalesTestCase):
+    def setUp(self):
+        super().setUp()
+        checkout(self.seller, 'xaridor', 'CASH', [{'product_id': self.pieces.pk, 'quantity': 2}])
+        CashWithdrawal.objects.create(seller=self.seller, amount=Decimal('7'))
+
+    def test_without_dimensions_returns_one_total_row(self):
+        # Har bir manba bir xil ustunlar bilan UNION ALL ga tushadi
+        result = run_query(self.director.pk, parse_query({'metrics': 'revenue,expense,lend_count'}))
+        self.assertEqual(result['row_count'], 1)
+        self.assertEqual(result['columns']['revenue'], [Decimal('20')])
+        self.assertEqual(result['columns']['expense'], [Decimal('7')])
+        self.assertEqual(result['columns']['lend_count'], [0])
+
+    def test_grouped_by_seller(self):
+        result = run_query(self.director.pk, parse_query({'metrics': 'revenue,expense', 'dimensions': 'seller'}))
+        self.assertEqual(result['columns']['seller'], [self.seller.pk])
+        self.assertEqual(result['columns']['seller_name'], ['seller'])
+        self.assertEqual(result['columns']['revenue'], [Decimal('20')])
+
+
+class PayrollTest(SalesTestCase):
+    # Snapshot faqat yopilgan oy uchun yoziladi, ochiq oy har doim jonli hisoblanadi
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.director)
+        self.current = timezone.localdate().replace(day=1)
+        self.previous = (self.current - timedelta(days=1)).replace(day=1)
+
+    def test_open_month_rejected(self):
+        for name in ['payroll', 'payroll-recompute']:
+            response = self.client.post(reverse(f'app:{name}'), {'month': f'{self.current:%Y-%m}'})
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(PayrollSnapshot.objects.exists())
+
+        response = self.client.post(reverse('app:payroll'), {'month': f'{self.previous:%Y-%m}'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row['employee'] for row in response.data], [self.seller.pk])
+
+    def test_monthly_income_ignores_open_month_snapshot(self):
+        # Eski (xato) snapshot ochiq oy uchun qaytarilmaydi
+        PayrollSnapshot.objects.create(
+            director=self.director, employee=self.seller, month=self.current, sales_count=99,
+        )
+        checkout(self.seller, 'xaridor', 'CASH', [{'product_id': self.pieces.pk, 'quantity': 2}])
+        last_day = calendar.monthrange(self.current.year, self.current.month)[1]
+        response = self.client.post(reverse('app:user-monthly-income', args=[self.seller.pk]), {
+            'start_date': f'{self.current:%Y-%m-%d}',
+            'end_date': f'{self.current.replace(day=last_day):%Y-%m-%d}',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['sales_count'], 1)
+
+
+class ExportTest(SalesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.director)
+
+    def export(self, ledger, **params):
+        response = self.client.get(reverse('app:export', args=[ledger]), params)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        return content if params.get('type') == 'xlsx' else content.decode('utf-8-sig')
+
+    def test_csv_text_cells_not_formulas(self):
+        checkout(self.seller, '=HYPERLINK("http://x")', 'CASH', [{'product_id': self.pieces.pk, 'quantity': 2}])
+        CashWithdrawal.objects.create(seller=self.seller, amount=Decimal('7'), comment='-2+3')
+        sales = list(csv.reader(StringIO(self.export('sales'))))
+        self.assertEqual(sales[1][5], '\'=HYPERLINK("http://x")-1')
+        self.assertEqual(sales[1][8], '20.0')
+        withdrawals = list(csv.reader(StringIO(self.export('withdrawals'))))
+        self.assertEqual(withdrawals[1][5], "'-2+3")
+
+    def test_status_filter_and_xlsx(self):
+        _, sales = checkout(self.seller, 'xaridor', 'CASH', [
+            {'product_id': self.pieces.pk, 'quantity': 2},
+            {'product_id': self.bulk.pk, 'weight': '1.5'},
+        ])
+        cancel_sales(self.seller, [sales[0].pk], 'xato')
+        rows = list(csv.reader(StringIO(self.export('sales', status='cancelled'))))
+        self.assertEqual([row[0] for row in rows[1:]], [str(sales[0].pk)])
+
+        with zipfile.ZipFile(BytesIO(self.export('sales', type='xlsx'))) as archive:
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 3)
+        self.assertIn('<c><v>15.0</v></c>', sheet)
+
+        response = self.client.get(reverse('app:export', args=['sales']), {'status': 'boshqa'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(STATISTICS_CACHE_ALIAS='default')
+class StatisticsTestCase(SalesTestCase):
+    # Fayl keshi testlar orasida saqlanib qoladi (direktor id lari takrorlanadi), shuning uchun LocMem
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.director)
+
+    def get(self, name, **params):
+        response = self.client.get(reverse(f'app:{name}'), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def sell(self, quantity, day, hour=12, minute=0, status='COMPLETED'):
+        # Dona mahsulotdan sotuv, sanasi mahalliy vaqtda berilgan kunga ko'chiriladi
+        _, sales = checkout(self.seller, 'xaridor', 'CASH', [{'product_id': self.pieces.pk, 'quantity': quantity}])
+        sale = sales[0]
+        sale.sale_date = datetime.combine(day, time(hour, minute), tzinfo=timezone.get_current_timezone())
+        sale.status = status
+        sale.save()
+
+
+class StatisticsCacheTest(StatisticsTestCase):
+    def test_write_invalidates_only_own_director(self):
+        self.assertEqual(self.get('top-sold-products')['X-Statistics-Cache'], 'MISS')
+        self.assertEqual(self.get('top-sold-products')['X-Statistics-Cache'], 'HIT')
+
+        # Versiya commit dan keyin oshadi
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(self.seller, 'xaridor', 'CASH', [{'product_id': self.pieces.pk, 'quantity': 2}])
+        response = self.get('top-sold-products')
+        self.assertEqual(response['X-Statistics-Cache'], 'MISS')
+        self.assertEqual([row['sold_count'] for row in response.data], [1])
+
+        other = User.objects.create_user(username='other', role=User.DIRECTOR)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_product(quantity=1, admin=other)
+        self.assertEqual(self.get('top-sold-products')['X-Statistics-Cache'], 'HIT')
+        self.assertEqual(self.get('top-sold-products', nocache=1)['X-Statistics-Cache'], 'BYPASS')
+
+
+class TopProductsTest(SalesTestCase):
+    # Reyting ProductMonthlyCounter dan: sotuv va bekor qilishda hisoblagich darhol yangilanadi
+    def ranking(self, by='sold'):
+        today = timezone.localdate()
+        key = 'total_sold' if by == 'sold' else 'total_lent'
+        return [(row['product_id'], row[key]) for row in top_products(self.director.pk, today.year, today.month, by)]
+
+    def test_ranking_follows_sales_and_cancellations(self):
+        other = self.create_product(quantity=5)
+        checkout(self.seller, 'xaridor', 'CASH', [{'product_id': self.pieces.pk, 'quantity': 3}])
+        _, first = checkout(self.seller, 'xaridor', 'CASH', [{'product_id': other.pk, 'quantity': 1}])
+        _, second = checkout(self.seller, 'xaridor', 'CARD', [{'product_id': other.pk, 'quantity': 1}])
+        self.assertEqual(self.ranking(), [(other.pk, 2), (self.pieces.pk, 1)])
+
+        cancel_sales(self.seller, [first[0].pk, second[0].pk])
+        self.assertEqual(self.ranking(), [(self.pieces.pk, 1)])
+        self.assert_rollups_match()
+
+    def test_lended_ranking(self):
+        product = self.create_product(quantity=1, choice='RENT', price=None, rental_price=Decimal('40'))
+        Lending.objects.create(
+            product=product, seller=self.seller, borrower_name='ijarachi', return_date=timezone.now(),
+            percentage='50%', pledge='pledge_img/test.png',
+        )
+        self.assertEqual(self.ranking('lended'), [(product.pk, 1)])
+        self.assertEqual(self.ranking(), [])
+
+
+class CategoryShareTest(SalesTestCase):
+    # Ulush CategoryMonthlyCounter dan: mahsulot kategoriyasi o'zgarsa sotuvlari ham ko'chadi
+    def share(self, mode):
+        today = timezone.localdate()
+        return [
+            (row['category__name'], row[CATEGORY_SHARE_MODES[mode]], row['percent'])
+            for row in category_share(self.director.pk, today.year, today.month, mode)
+        ]
+
+    def test_share_follows_category_change(self):
+        food = Category.objects.create(name='Oziq-ovqat', created_by=self.director)
+        tools = Category.objects.create(name='Asboblar', created_by=self.director)
+        self.pieces.category = food
+        self.pieces.save()
+        checkout(self.seller, 'xaridor', 'CASH', [
+            {'product_id': self.pieces.pk, 'quantity': 3},
+            {'product_id': self.bulk.pk, 'weight': '1'},
+        ])
+        # Teng qiymatlarda NULL kategoriya tartibi bazaga bog'liq
+        self.assertCountEqual(self.share('products'), [(None, 1, 50.0), ('Oziq-ovqat', 1, 50.0)])
+        self.assertEqual(self.share('revenue'), [('Oziq-ovqat', Decimal('30'), 75.0), (None, Decimal('10'), 25.0)])
+
+        self.pieces.category = tools
+        self.pieces.save()
+        self.assertCountEqual(self.share('count'), [(None, 1, 50.0), ('Asboblar', 1, 50.0)])
+        self.assertEqual(self.share('revenue')[0], ('Asboblar', Decimal('30'), 75.0))
+        self.assert_rollups_match()
+
+
+class StatisticsSnapshotTest(StatisticsTestCase):
+    # Yopilgan yillar snapshotdan, birinchi ma'lumotdan oldingi va joriy yil hisoblanadi
+    def setUp(self):
+        super().setUp()
+        self.year = timezone.localdate().year
+        _, sales = checkout(self.seller, 'xaridor', 'CASH', [{'product_id': self.pieces.pk, 'quantity': 3}])
+        self.sale = sales[0]
+        self.sale.sale_date = self.sale.sale_date.replace(year=self.year - 1, month=6, day=15)
+        self.sale.save()
+
+    def snapshot_years(self, endpoint):
+        return sorted(StatisticsSnapshot.objects.filter(
+            director=self.director, endpoint=endpoint, period=StatisticsSnapshot.YEAR
+        ).values_list('period_start__year', flat=True))
+
+    def test_only_closed_years_with_data_stored(self):
+        for year in [self.year - 2, self.year - 1, self.year]:
+            self.client.get(reverse('app:yearly-statistics', args=[year]))
+        self.assertEqual(self.snapshot_years('yearly-detail'), [self.year - 1])
+
+        response = self.get('yearly-statistics')
+        self.assertEqual(response.data[str(self.year - 1)], 30.0)
+        self.assertEqual(response.data[str(self.year - 2)], 0)
+        self.assertEqual(self.snapshot_years('yearly'), [self.year - 1])
+
+    def test_late_write_drops_closed_snapshot(self):
+        self.get('yearly-statistics')
+        self.sale.status = 'CANCELLED'
+        self.sale.save()
+        self.assertEqual(self.snapshot_years('yearly'), [])
+        self.assertEqual(self.get('yearly-statistics', nocache=1).data[str(self.year - 1)], 0)
+        # Bekor qilingandan keyin ma'lumot qolmadi: bo'sh yil snapshot sifatida saqlanmaydi
+        self.assertEqual(self.snapshot_years('yearly'), [])
+
+
+class SalesHeatmapTest(StatisticsTestCase):
+    # Hafta kuni x soat mahalliy vaqtda: Toshkentda 23:30 UTC bo'yicha 18:30
+    def setUp(self):
+        super().setUp()
+        today = timezone.localdate()
+        self.monday = today - timedelta(days=today.weekday() + 7)
+
+    def test_local_weekday_and_hour(self):
+        self.sell(2, self.monday, 23, 30)
+        self.sell(1, self.monday + timedelta(days=1), 0, 15)
+        self.sell(1, self.monday, 23, 45, status='CANCELLED')
+        data = self.get(
+            'sales-heatmap', start_date=f'{self.monday}', end_date=f'{self.monday + timedelta(days=6)}', by_seller=1,
+        ).data
+        self.assertEqual((data['revenue'][0][23], data['count'][0][23]), (20, 1))
+        self.assertEqual((data['revenue'][1][0], data['count'][1][0]), (10, 1))
+        self.assertEqual(sum(map(sum, data['count'])), 2)
+        self.assertEqual([seller['username'] for seller in data['sellers']], ['seller'])
+        self.assertEqual(data['sellers'][0]['count'], data['count'])
+
+        # Bitta GROUP BY natijasi eski soatma-soat hisob bilan bir xil
+        start = parse_local_date(f'{self.monday}')
+        hourly = sales_heatmap_hourly(self.director.pk, start, start + timedelta(days=7))
+        self.assertEqual((data['revenue'], data['count']), (hourly['revenue'], hourly['count']))
+
+
+class GrowthComparisonTest(StatisticsTestCase):
+    def test_month_over_month_and_year_over_year(self):
+        self.pieces.adjust_stock(quantity=5)
+        current = timezone.localdate().replace(day=1)
+        self.sell(1, (current - timedelta(days=1)).replace(day=15))
+        self.sell(2, current.replace(year=current.year - 1, day=15))
+        self.sell(3, timezone.localdate())
+        CashWithdrawal.objects.create(seller=self.seller, amount=Decimal('7'))
+
+        data = self.get('growth-comparison', metrics='sales_revenue,expense,net_profit', periods=2).data
+        previous, latest = data['periods']
+        self.assertEqual(latest['start_date'], current)
+        self.assertEqual(latest['values'], {'sales_revenue': 30, 'expense': 7, 'net_profit': 23})
+        self.assertEqual(latest['growth']['sales_revenue'], '+200.0%')
+        self.assertEqual(latest['year_ago']['sales_revenue'], 20)
+        self.assertEqual(latest['yoy_growth']['sales_revenue'], '+50.0%')
+        self.assertEqual(previous['values']['sales_revenue'], 10)
+        self.assertEqual(previous['growth']['sales_revenue'], '+0%')
+
+        self.assertNotIn('year_ago', self.get('growth-comparison', periods=1, yoy=0).data['periods'][0])
+        for params in [{'periods': 0}, {'metrics': 'foo'}, {'period': 'decade'}]:
+            self.assertEqual(self.client.get(reverse('app:growth-comparison'), params).status_code, 400)
+
+
+class RangeResolverTest(StatisticsTestCase):
+    # Oraliqlar mahalliy yarim tunda boshlanadigan [start, end): UTC sanasi bo'yicha emas
+    def test_local_half_open_ranges(self):
+        start, end = date_range(date(2026, 3, 1), date(2026, 3, 31))
+        self.assertEqual((start.isoformat(), end.isoformat()), ('2026-03-01T00:00:00+05:00', '2026-04-01T00:00:00+05:00'))
+
+        wednesday = datetime(2026, 3, 4, 0, 30, tzinfo=timezone.get_current_timezone())
+        start, end = period_range('week', wednesday)
+        self.assertEqual((start.day, end.day, start.hour), (2, 9, 0))
+
+        start, end, granularity, _ = resolve_series_range({'start_date': '2026-03-01', 'end_date': '2026-03-01'})
+        self.assertEqual((end - start, granularity), (timedelta(days=1), 'day'))
+        for params in [{'start_date': '2026-03-02', 'end_date': '2026-03-01'}, {'days': '0'}, {'start_date': '01.03.2026'}]:
+            with self.assertRaises(ValueError):
+                resolve_series_range(params)
+
+    def test_sales_at_local_midnight_stay_in_their_month(self):
+        # 1-kun 00:30 va oxirgi kun 23:30 (UTC da qo'shni kunlar) - ikkalasi ham shu oyda
+        month_start = (timezone.localdate().replace(day=1) - timedelta(days=1)).replace(day=1)
+        month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        self.sell(1, month_start, 0, 30)
+        self.sell(2, month_end, 23, 30)
+
+        def income(start, end):
+            response = self.client.post(reverse('app:user-monthly-income', args=[self.seller.pk]), {
+                'start_date': f'{start}', 'end_date': f'{end}',
+            })
+            return response.data['sales_count']
+
+        self.assertEqual(income(month_start, month_end), 2)
+        self.assertEqual(income(month_start, month_start), 1)
+        previous_end = month_start - timedelta(days=1)
+        self.assertEqual(income(previous_end.replace(day=1), previous_end), 0)
+
+
+class SoldProductsHistoryTest(SalesTestCase):
+    # Xaridor (chek) bo'yicha guruhlar, eng oxirgisi birinchi; bekor qilinganlar ko'rinmaydi
+    def test_grouped_and_paginated(self):
+        checkout(self.seller, 'ali', 'CASH', [
+            {'product_id': self.pieces.pk, 'quantity': 2},
+            {'product_id': self.bulk.pk, 'weight': '1.5'},
+        ])
+        checkout(self.seller, 'vali', 'CARD', [{'product_id': self.pieces.pk, 'quantity': 1}])
+        _, cancelled = checkout(self.seller, 'bek', 'CASH', [{'product_id': self.pieces.pk, 'quantity': 1}])
+        cancel_sales(self.seller, [cancelled[0].pk])
+        Sale.objects.create(
+            product=self.pieces, seller=self.seller, buyer='', sale_price=Decimal('10'), quantity=1, status='COMPLETED',
+        )
+
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        url = reverse('app:cart-sold')
+        first = client.get(url, {'page_size': 2}).data
+        self.assertEqual(first['count'], 3)
+        self.assertEqual([group['buyer'] for group in first['results']], ["Noma'lum", 'vali-2'])
+        self.assertEqual(first['results'][1]['payment_type'], 'CARD')
+
+        last = client.get(url, {'page_size': 2, 'page': 2}).data['results']
+        self.assertEqual(len(last), 1)
+        self.assertEqual(last[0]['buyer'], 'ali-1')
+        self.assertEqual(last[0]['total_price'], '35.00')
+        self.assertEqual(sorted(item['total_price'] for item in last[0]['item']), ['15.00', '20.00'])
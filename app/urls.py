@@ -40,6 +40,8 @@ urlpatterns = [
     path('user/image/', views.UserImageView.as_view(), name='user-image'),
     path('user/<int:user_id>/statistics/', views.UserStatisticsView.as_view(), name='user-statistics'),
     path('user/<int:user_id>/monthly_income/', views.UserMonthlyIncomeView.as_view(), name='user-monthly-income'),
+    path('payroll/', views.PayrollView.as_view(), name='payroll'),
+    path('payroll/recompute/', views.PayrollRecomputeView.as_view(), name='payroll-recompute'),
     path('user/<int:user_id>/management/', views.UserManagementView.as_view(), name='user-management'),
 
 
@@ -63,8 +65,10 @@ urlpatterns = [
     path('cart/sold/', views.SoldProductsHistoryView.as_view(), name='cart-sold'),
     path('cart/delete/<int:item_id>/', views.CartItemDeleteView.as_view(), name='cart-item-delete'),
     path('cash/withdraw/',views.CashWithdrawalView.as_view(), name='cash-withdraw'),
+    path('cash/expense-categories/', views.ExpenseCategoryListCreateView.as_view(), name='expense-category-list'),
 
     path('statistics/report/', views.StatisticsReportView.as_view(), name='statistics-report'),
+    path('statistics/growth/', views.GrowthComparisonView.as_view(), name='growth-comparison'),
     path('statistics/income-expense/', views.IncomeExpenseDetailView.as_view(), name='income-expense-detail'),
     path('statistics/dynamics/', views.IncomeExpenseDynamicsView.as_view(), name='income-expense-dynamics'),
     path('statistics/revenue-dynamics/', views.RevenueDynamicsView.as_view(), name='revenue-dynamics'),
@@ -72,4 +76,8 @@ urlpatterns = [
     path('statistics/top-sold-products/', views.TopSoldProductsView.as_view(), name='top-sold-products'),
     path('statistics/top-lended-products/', views.TopLendedProductsView.as_view(), name='top-lended-products'),
     path('statistics/employee/', views.EmployeeStatisticsView.as_view(), name='employee-statistics'),
+    path('statistics/cache/', views.StatisticsCacheView.as_view(), name='statistics-cache'),
+    path('statistics/heatmap/', views.SalesHeatmapView.as_view(), name='sales-heatmap'),
+    path('statistics/analytics/', views.AnalyticsView.as_view(), name='analytics'),
+    path('export/<str:ledger>/', views.ExportView.as_view(), name='export'),
 ] 
\ No newline at end of file
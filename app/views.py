@@ -9,19 +9,30 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.hashers import make_password
 from rest_framework import serializers
 from django.contrib.auth import authenticate
+from django.http import StreamingHttpResponse
 from .models import *
 from .serializers import *
-from django.db.models import Q, Avg
+from django.db.models import Q, Avg, Max, CharField
 from django.utils import timezone
 from django.db.models import Sum, F, Case, When, FloatField, Value, DecimalField, ExpressionWrapper, Count, IntegerField
 from django.db.models.functions import Cast, Replace, Coalesce
 from collections import defaultdict
 from decimal import Decimal
-import pytz
 import calendar
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from .pagination import *
-import re
+from .analytics import parse_query as parse_analytics_query, run_query as run_analytics_query
+from .sales import checkout, cancel_sales, CheckoutError
+from .exports import LEDGERS, EXPORT_TYPES, ledger_header, iter_ledger, stream_table
+from .cache import cache_statistics, cache_info, director_id_of
+from .statistics import (
+    period_range, revenue_series, rollup_revenue_series, employee_activity, lending_histogram, run_concurrently,
+    time_series, director_time_series, resolve_series_range, series_label, resolve_comparison, compare_totals, director_querysets,
+    parse_local_date, employee_metrics, run_payroll, top_products, year_month_params, first_activity_date,
+    category_share, CATEGORY_SHARE_MODES, closed_snapshots, save_snapshot, period_snapshot, SERIES_METRICS,
+    sales_heatmap, growth_totals, GROWTH_PERIODS, DERIVED_METRICS, MAX_GROWTH_PERIODS, SERIES_LABELS,
+    local_datetime, date_range, in_range,
+)
 
 def get_tokens_for_user(user):
     refresh = RefreshToken.for_user(user)
@@ -650,32 +661,27 @@ class UserListView(generics.ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        today = timezone.now()
-        month_start = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        if today.month == 12:
-            month_end = today.replace(year=today.year + 1, month=1, day=1)
-        else:
-            month_end = today.replace(month=today.month + 1, day=1)
+        month_start, month_end = period_range('month')  # joriy oy, Asia/Tashkent, [start, end)
 
         if user.role == User.DIRECTOR:
             return User.objects.filter(created_by=user).annotate(
                 monthly_sales=Count(
                     'sales',
-                    filter=Q(sales__sale_date__range=(month_start, month_end))
+                    filter=in_range('sales__sale_date', month_start, month_end)
                 ),
                 monthly_lendings=Count(
                     'lendings',
-                    filter=Q(lendings__borrow_date__range=(month_start, month_end))
+                    filter=in_range('lendings__borrow_date', month_start, month_end)
                 ),
                 total_products_sold=Sum(
                     Case(
                         When(
-                            sales__sale_date__range=(month_start, month_end),
+                            in_range('sales__sale_date', month_start, month_end),
                             sales__product_weight__isnull=False,
                             then=F('sales__product_weight')
                         ),
                         When(
-                            sales__sale_date__range=(month_start, month_end),
+                            in_range('sales__sale_date', month_start, month_end),
                             then=F('sales__quantity')
                         ),
                         default=0,
@@ -688,21 +694,21 @@ class UserListView(generics.ListAPIView):
             return User.objects.filter(created_by=user.created_by).annotate(
                 monthly_sales=Count(
                     'sales',
-                    filter=Q(sales__sale_date__range=(month_start, month_end))
+                    filter=in_range('sales__sale_date', month_start, month_end)
                 ),
                 monthly_lendings=Count(
                     'lendings',
-                    filter=Q(lendings__borrow_date__range=(month_start, month_end))
+                    filter=in_range('lendings__borrow_date', month_start, month_end)
                 ),
                 total_products_sold=Sum(
                     Case(
                         When(
-                            sales__sale_date__range=(month_start, month_end),
+                            in_range('sales__sale_date', month_start, month_end),
                             sales__product_weight__isnull=False,
                             then=F('sales__product_weight')
                         ),
                         When(
-                            sales__sale_date__range=(month_start, month_end),
+                            in_range('sales__sale_date', month_start, month_end),
                             then=F('sales__quantity')
                         ),
                         default=0,
@@ -820,6 +826,7 @@ class UserImageView(APIView):
 class StatisticsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_statistics('overview')
     def get(self, request):
 
         user = request.user
@@ -827,121 +834,55 @@ class StatisticsView(APIView):
         # Faqat Directorlar uchun
         if user.role != User.DIRECTOR:
             return Response({'status': 'error', 'message': 'Only directors can view statistics.'}, status=403)
-        # Get the current date
-        # Kunlik statistikalar (har ikki soatda)
-        daily_revenue = defaultdict(float)
-        now = timezone.now()
 
-        for hour in range(0, 24, 2):  # Har 2 soatda
-            start_time = now.replace(hour=hour, minute=0, second=0, microsecond=0)
-            end_time = start_time + timezone.timedelta(hours=2)
-            
-            # Sale daromadini hisoblash
-            sale_revenue = Sale.objects.filter(
-                sale_date__range=(start_time, end_time),
-                product__created_by__in=[request.user] + list(request.user.created_users.all())
-            ).annotate(total_price=F('sale_price') * F('quantity')).aggregate(total_revenue=Sum('total_price'))['total_revenue'] or 0
+        # Director va u yaratgan userlar (subquery sifatida, har bir bucket uchun qayta yuklanmaydi)
+        owners = User.objects.filter(Q(pk=user.pk) | Q(created_by=user))
+        sources = [
+            (
+                Sale.objects.filter(product__created_by__in=owners),
+                'sale_date',
+                SALE_REVENUE
+            ),
+            (
+                Lending.objects.filter(product__admin__in=owners),
+                'borrow_date',
+                F('product__rental_price')  # Faqat rental_price ni hisoblaymiz
+            ),
+        ]
 
-            # Lending daromadini hisoblash
-            lending_revenue = Lending.objects.filter(
-                borrow_date__range=(start_time, end_time),
-                product__admin__in=[request.user] + list(request.user.created_users.all())
-            ).aggregate(
-                total_rental_revenue=Sum('product__rental_price')  # Faqat rental_price ni hisoblaymiz
-            )['total_rental_revenue'] or 0
-            
-            # Umumiy daromadni yig'ish
-            total_revenue = sale_revenue + lending_revenue
-            daily_revenue[start_time.strftime("%H:%M")] = total_revenue
+        # Kunlik statistikalar (har ikki soatda)
+        daily_revenue = defaultdict(int)
+        start, end = period_range('day')
+        for bucket, total in revenue_series(sources, start, end, 'hour'):
+            daily_revenue[f"{bucket.hour - bucket.hour % 2:02d}:00"] += total
 
         # Haftalik statistikalar (Dushanbadan Yakshabgacha)
-        weekly_revenue = defaultdict(float)
-        now = timezone.now()
-        start_of_week = now - timezone.timedelta(days=now.weekday())  # Dushanbadan boshlanadi
-
-        for i in range(7):  # Haftada 7 kun
-            day = start_of_week + timezone.timedelta(days=i)
-            
-            # Sale daromadini hisoblash
-            # Sale daromadini hisoblash
-            sale_revenue = Sale.objects.filter(
-                sale_date__date=day,
-                product__created_by__in=[request.user] + list(request.user.created_users.all())
-            ).annotate(total_price=F('sale_price') * F('quantity')).aggregate(total_revenue=Sum('total_price'))['total_revenue'] or 0
-
-            # Lending daromadini hisoblash
-            lending_revenue = Lending.objects.filter(
-                borrow_date__date=day,
-                product__admin__in=[request.user] + list(request.user.created_users.all())
-            ).aggregate(
-                total_rental_revenue=Sum('product__rental_price')  # Faqat rental_price ni hisoblaymiz
-            )['total_rental_revenue'] or 0
-            
-            # Umumiy daromadni yig'ish
-            total_revenue = sale_revenue + lending_revenue
-            weekly_revenue[day.strftime("%A")] = total_revenue  # Kun nomi
+        start, end = period_range('week')
+        weekly_revenue = {
+            bucket.strftime("%A"): total  # Kun nomi
+            for bucket, total in revenue_series(sources, start, end, 'day')
+        }
 
         # Monthly statistics (daily revenue for each day of the current month)
-        monthly_revenue = defaultdict(float)
-        start_of_month = now.replace(day=1)  # Oyning birinchi kuni
-        end_of_month = (start_of_month + timezone.timedelta(days=31)).replace(day=1)  # Keyingi oyning birinchi kuni
-
-        # Har bir kun uchun daromadni hisoblash
-        for day in range(1, (end_of_month - start_of_month).days + 1):
-            day_date = start_of_month.replace(day=day)
-            
-            # Sale daromadini hisoblash
-            sale_revenue = Sale.objects.filter(
-                sale_date__date=day_date,
-                product__created_by__in=[request.user] + list(request.user.created_users.all())
-            ).annotate(total_price=F('sale_price') * F('quantity')).aggregate(total_revenue=Sum('total_price'))['total_revenue'] or 0
-
-            # Lending daromadini hisoblash
-            lending_revenue = Lending.objects.filter(
-                borrow_date__date=day_date,
-                product__admin__in=[request.user] + list(request.user.created_users.all())
-            ).aggregate(
-                total_rental_revenue=Sum('product__rental_price')  # Faqat rental_price ni hisoblaymiz
-            )['total_rental_revenue'] or 0
-            
-            # Umumiy daromadni yig'ish
-            total_revenue = sale_revenue + lending_revenue
-            monthly_revenue[day_date.strftime("%d")] = total_revenue  # Sanani formatlash
+        start, end = period_range('month')
+        monthly_revenue = {
+            bucket.strftime("%d"): total  # Sanani formatlash
+            for bucket, total in revenue_series(sources, start, end, 'day')
+        }
 
         # Yillik statistikalar (har bir oy uchun daromad)
-        yearly_revenue = defaultdict(float)
-        now = timezone.now()
-        start_of_year = now.replace(month=1, day=1)
-
-        for month in range(1, 13):  # 1 dan 12 gacha
-            month_date = start_of_year.replace(month=month)
-            
-            # Sale daromadini hisoblash
-            sale_revenue = Sale.objects.filter(
-                sale_date__year=now.year,
-                sale_date__month=month,
-                product__created_by__in=[request.user] + list(request.user.created_users.all())
-            ).annotate(total_price=F('sale_price') * F('quantity')).aggregate(total_revenue=Sum('total_price'))['total_revenue'] or 0
-
-            # Lending daromadini hisoblash
-            lending_revenue = Lending.objects.filter(
-                borrow_date__year=now.year,
-                borrow_date__month=month,
-                product__admin__in=[request.user] + list(request.user.created_users.all())
-            ).aggregate(
-                total_rental_revenue=Sum('product__rental_price')  # Faqat rental_price ni hisoblaymiz
-            )['total_rental_revenue'] or 0
-            
-            # Umumiy daromadni yig'ish
-            total_revenue = sale_revenue + lending_revenue
-            yearly_revenue[month_date.strftime("%B")] = total_revenue  # Oy nomi
+        start, end = period_range('year')
+        yearly_revenue = {
+            bucket.strftime("%B"): total  # Oy nomi
+            for bucket, total in revenue_series(sources, start, end, 'month')
+        }
 
         # Prepare the response data
         statistics = {
             'daily': dict(daily_revenue),
-            'weekly': dict(weekly_revenue),
-            'monthly': dict(monthly_revenue),
-            'yearly': dict(yearly_revenue),
+            'weekly': weekly_revenue,
+            'monthly': monthly_revenue,
+            'yearly': yearly_revenue,
         }
 
         return Response(statistics)
@@ -949,6 +890,7 @@ class StatisticsView(APIView):
 class DailyStatisticsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_statistics('daily')
     def get(self, request):
         user = request.user
         if user.role != User.DIRECTOR:
@@ -956,47 +898,31 @@ class DailyStatisticsView(APIView):
         return Response(self.get_daily_statistics(user))
 
     def get_daily_statistics(self, user):
-        uzbekistan_tz = pytz.timezone('Asia/Tashkent')
-        now = timezone.now().astimezone(uzbekistan_tz)
+        day_start, _ = period_range('day')
         daily_revenue = defaultdict(float)
-        daily_lend_statistic = {f"{i}%": 0 for i in range(0, 101, 25)}
-        daily_returned_statistic = {f"{i}%": 0 for i in range(0, 101, 25)}
-        total_count = 0
-        total_return_count = 0
-        users_product_count = defaultdict(int)
 
         work_start = user.work_start_time.hour
         work_end = user.work_end_time.hour
-        start = now.replace(hour=work_start, minute=0, second=0, microsecond=0)  # 00:00
-        end = now.replace(hour=work_end, minute=59, second=59, microsecond=999999)  # 23:59:59
-        print(work_start, work_end)
-        for hour in range(work_start, work_end+1, 1):  # Har 2 soatda
-            uzbekistan_tz = pytz.timezone('Asia/Tashkent')
-            start_time = now.replace(hour=hour, minute=0, second=0, microsecond=9)
-            end_time = start_time + timezone.timedelta(hours=1)
+        # Ish kuni: [work_start:00, work_end+1:00) mahalliy vaqtda
+        start = day_start + timedelta(hours=work_start)
+        end = day_start + timedelta(hours=work_end + 1)
+        for hour in range(work_start, work_end+1, 1):
+            start_time = day_start + timedelta(hours=hour)
+            end_time = start_time + timedelta(hours=1)
 
             # Sale daromadini hisoblash
             sale_revenue = Sale.objects.filter(
-                sale_date__range=(start_time, end_time),
+                in_range('sale_date', start_time, end_time),
                 product__admin=user,
             ).exclude(
                 status='CANCELLED'
-            ).annotate(
-                total_price=ExpressionWrapper(
-                    Case(
-                        When(product_weight__isnull=False, then=F('product_weight') * F('sale_price')),
-                        default=F('sale_price') * F('quantity'),
-                        output_field=DecimalField()  # Ensure this is included
-                    ),
-                    output_field=DecimalField()  # This is the missing argument
-                )
             ).aggregate(
-                total_revenue=Sum('total_price')
+                total_revenue=Sum(SALE_REVENUE)
             )['total_revenue'] or Decimal(0)
             # Lending daromadini hisoblash
             lending_revenue = Lending.objects.filter(
-                Q(status='RETURNED', return_date__range=(start_time, end_time)) | 
-                Q(status='LENT', borrow_date__range=(start_time, end_time)),
+                Q(status='RETURNED') & in_range('return_date', start_time, end_time) |
+                Q(status='LENT') & in_range('borrow_date', start_time, end_time),
                 product__admin__in=[user] + list(user.created_users.all())
             ).annotate(
                 percentage_value=Cast(Replace(F('percentage'), Value('%'), Value('')), FloatField()),
@@ -1011,48 +937,13 @@ class DailyStatisticsView(APIView):
 
             daily_revenue[start_time.strftime("%H:%M")] = sale_revenue + lending_revenue
 
-            # Lending Percentage statistikasi
-            lendings = Lending.objects.filter(
-                borrow_date__range=(start_time, end_time),
-                product__admin=user
-            )
-
-            for lending in lendings:
-                percentage = lending.percentage  # Percentage maydoni
-                daily_lend_statistic[percentage] += 1
-
-            total_count += lendings.count()
-
-            returned_lendings = lendings.filter(status='RETURNED')  # Statusi 'returned' bo'lgan lendinglar
-            total_return_count += returned_lendings.count()
+        # Ijara foizlari taqsimoti va xodimlar faolligi butun ish kuni uchun bitta so'rovda
+        histogram = lending_histogram(user, start, end)
+        users_product_count = employee_activity(user, start, end)
 
-            for returned_lending in returned_lendings:
-                percentage_value = int(returned_lending.percentage.rstrip('%'))  # '%' ni olib tashlaymiz va int ga aylantiramiz
-                returned_percentage = 100 - percentage_value  # 100 - Percentage
-                returned_percentage_str = f"{returned_percentage}%"  # Natijani formatlash
-
-                daily_returned_statistic[returned_percentage_str] += 1
-            
-            # Foydalanuvchilarni hisoblash
-            created_users = user.created_users.all()
-
-            for created_user in created_users:
-                sales_count = Sale.objects.filter(
-                    seller=created_user,
-                    sale_date__range=(start, end),
-                    product__admin=user
-                ).count()
-                lending_count = Lending.objects.filter(
-                    borrow_date__range=(start, end),
-                    product__admin=user,
-                    seller=created_user
-                ).count()
-                count = lending_count + sales_count
-                users_product_count[created_user.username] = count
-        
         top_products = Sale.objects.filter(
+            in_range('sale_date', start, end),
             product__admin=user,
-            sale_date__range=(start, end)
         ).exclude(
             status='CANCELLED'
         ).values(
@@ -1073,8 +964,8 @@ class DailyStatisticsView(APIView):
         # Get bottom 10 least sold products (excluding products from top 10)
         excluded_ids = [p['product__id'] for p in top_products]
         bottom_products = Sale.objects.filter(
+            in_range('sale_date', start, end),
             product__admin=user,
-            sale_date__range=(start, end)
         ).exclude(
             product__id__in=excluded_ids
         ).values(
@@ -1096,10 +987,7 @@ class DailyStatisticsView(APIView):
 
         return {
             'statistic': dict(daily_revenue),
-            'lend_statistic': dict(daily_lend_statistic),
-            'return_statistic': dict(daily_returned_statistic),
-            'total_count': total_count,
-            'total_return_count': total_return_count,
+            **histogram,
             'users_product_count': dict(users_product_count),
             'top_products': [
                 {
@@ -1125,6 +1013,7 @@ class DailyStatisticsView(APIView):
 class WeeklyStatisticsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_statistics('weekly')
     def get(self, request):
         user = request.user
         if user.role != User.DIRECTOR:
@@ -1132,101 +1021,19 @@ class WeeklyStatisticsView(APIView):
         return Response(self.get_weekly_statistics(user))
 
     def get_weekly_statistics(self, user):
-        now = timezone.now()
-        start_of_week = now - timezone.timedelta(days=now.weekday())  # Dushanbadan boshlanadi
-        end_of_week = start_of_week + timezone.timedelta(days=6)
-        weekly_revenue = defaultdict(float)
-        weekly_lend_statistic = {f"{i}%": 0 for i in range(0, 101, 25)}
-        weekly_returned_statistic = {f"{i}%": 0 for i in range(0, 101, 25)}
-        users_product_count = defaultdict(int)
-
-        
-        total_count = 0
-        total_return_count = 0
-
-        for i in range(7):  # Haftada 7 kun
-            day = start_of_week + timezone.timedelta(days=i)
-            day_name = day.strftime("%A")
-
-            # Sale daromadini hisoblash
-            sale_revenue = Sale.objects.filter(
-                sale_date__date=day,
-                product__admin=user
-            ).exclude(
-                status='CANCELLED'
-            ).annotate(total_price=ExpressionWrapper(
-                    Case(
-                        When(product_weight__isnull=False, then=F('product_weight') * F('sale_price')),
-                        default=F('sale_price') * F('quantity'),
-                        output_field=DecimalField()  # Ensure this is included
-                    ),
-                    output_field=DecimalField()  # This is the missing argument
-                )).aggregate(Sum('total_price'))['total_price__sum'] or 0
-
-            # Lending daromadini hisoblash
-            lending_revenue = Lending.objects.filter(
-                borrow_date__date=day,
-                product__admin=user
-            ).annotate(
-                # '%' belgisini olib tashlaymiz va float ga aylantiramiz
-                percentage_value=Cast(Replace(F('percentage'), Value('%'), Value('')), FloatField()),  # '%' belgisini olib tashlaymiz
-                effective_rental_price=Case(
-                    When(status='RETURNED', then=F('product__rental_price')),  # Agar status 'returned' bo'lsa, rental_price ni to'liq hisoblaymiz
-                    default=F('product__rental_price') * (F('percentage_value') / 100),  # Aks holda, rental_price ni percentage ga ko'paytiramiz
-                    output_field=DecimalField()  # Natijaning turini belgilaymiz
-                )
-            ).aggregate(
-                total_rental_revenue=Sum('effective_rental_price')  # Hisoblangan rental_price ni yig'amiz
-            )['total_rental_revenue'] or Decimal(0)
-
-            weekly_revenue[day_name] = sale_revenue + lending_revenue
-
-            lendings = Lending.objects.filter(
-                borrow_date__date=day,
-                product__admin=user
-            )
-
-            for lending in lendings:
-                percentage = lending.percentage  # Percentage maydoni
-                if percentage in weekly_lend_statistic:
-                    weekly_lend_statistic[percentage] += 1
-                else:
-                    weekly_lend_statistic[percentage] = 1
-            total_count += lendings.count()
-
-            returned_lendings = lendings.filter(status='RETURNED')  # Statusi 'returned' bo'lgan lendinglar
-            total_return_count += returned_lendings.count()
-
-            for returned_lending in returned_lendings:
-                # Percentage qiymatini to'g'ri formatlash
-                percentage_value = int(returned_lending.percentage.rstrip('%'))  # '%' ni olib tashlaymiz va int ga aylantiramiz
-                returned_percentage = 100 - percentage_value  # 100 - Percentage
-                returned_percentage_str = f"{returned_percentage}%"  # Natijani formatlash
-
-                if returned_percentage_str in weekly_returned_statistic:
-                    weekly_returned_statistic[returned_percentage_str] += 1
-                else:
-                   weekly_returned_statistic[returned_percentage_str] = 1
-            
-            created_users = user.created_users.all()
-
-            for created_user in created_users:
-                sales_count = Sale.objects.filter(
-                    seller=created_user,
-                    sale_date__date__range=(start_of_week, end_of_week),
-                    product__admin=user
-                ).count()
-                lending_count = Lending.objects.filter(
-                    borrow_date__date__range=(start_of_week, end_of_week),
-                    product__admin=user,
-                    seller=created_user
-                ).count()
-                count = lending_count + sales_count
-                users_product_count[created_user.username] = count
+        week_start, week_end = period_range('week')  # Dushanbadan boshlanadi
+        histogram = lending_histogram(user, week_start, week_end)
+        users_product_count = employee_activity(user, week_start, week_end)
+
+        # Kunlik daromad rollup jadvalidan (bitta GROUP BY so'rovi)
+        weekly_revenue = {
+            bucket.strftime("%A"): total
+            for bucket, total in rollup_revenue_series(user, week_start.date(), week_end.date(), 'day')
+        }
 
         top_products = Sale.objects.filter(
+            in_range('sale_date', week_start, week_end),
             product__admin=user,
-            sale_date__range=(start_of_week, end_of_week)
         ).exclude(
             status='CANCELLED'
         ).values(
@@ -1247,8 +1054,8 @@ class WeeklyStatisticsView(APIView):
         # Get bottom 10 least sold products (excluding products from top 10)
         excluded_ids = [p['product__id'] for p in top_products]
         bottom_products = Sale.objects.filter(
+            in_range('sale_date', week_start, week_end),
             product__admin=user,
-            sale_date__range=(start_of_week, end_of_week)
         ).exclude(
             product__id__in=excluded_ids
         ).values(
@@ -1270,11 +1077,8 @@ class WeeklyStatisticsView(APIView):
 
 
         return {
-            "statistic":dict(weekly_revenue),
-            'lend_statistic': dict(weekly_lend_statistic),
-            'return_statistic': dict(weekly_returned_statistic),
-            'total_count': total_count,
-            'total_return_count': total_return_count,
+            "statistic": weekly_revenue,
+            **histogram,
             "users_product_count": dict(users_product_count),
             'top_products': [
                 {
@@ -1301,6 +1105,7 @@ class WeeklyStatisticsView(APIView):
 class MonthlyStatisticsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_statistics('monthly')
     def get(self, request):
         user = request.user
         if user.role != User.DIRECTOR:
@@ -1308,109 +1113,19 @@ class MonthlyStatisticsView(APIView):
         return Response(self.get_monthly_statistics(user))
 
     def get_monthly_statistics(self, user):
-        now = timezone.now()
-        year = now.year
-        month = now.month
-        monthly_revenue = defaultdict(float)
-        monthly_lend_statistic = {f"{i}%": 0 for i in range(0, 101, 25)}
-        monthly_returned_statistic = {f"{i}%": 0 for i in range(0, 101, 25)}
-        users_product_count = defaultdict(int)
-
-        start_of_month = now.replace(day=1)
-        last_day_of_month = calendar.monthrange(year, month)[1]
-        end_of_month = now.replace(day=last_day_of_month)
-
-        total_count = 0
-        total_return_count = 0
-        # Oyning har bir kunini hisoblash
-        for day in range(1, 32):  # 1 dan 31 gacha
-            try:
-                date = timezone.datetime(year, month, day)
-            except ValueError:
-                # Agar bu oyda bunday kun bo'lmasa, davom etamiz
-                continue
-
-            # Sale daromadini hisoblash
-            sale_revenue = Sale.objects.filter(
-                sale_date__date=date,
-                product__admin=user
-            ).exclude(
-                status='CANCELLED'
-            ).annotate(total_price=ExpressionWrapper(
-                    Case(
-                        When(product_weight__isnull=False, then=F('product_weight') * F('sale_price')),
-                        default=F('sale_price') * F('quantity'),
-                        output_field=DecimalField()  # Ensure this is included
-                    ),
-                    output_field=DecimalField()  # This is the missing argument
-                )).aggregate(Sum('total_price'))['total_price__sum'] or 0
-
-            # Lending daromadini hisoblash
-            lending_revenue = Lending.objects.filter(
-                borrow_date__date=date,
-                product__admin=user
-            ).annotate(
-                # '%' belgisini olib tashlaymiz va float ga aylantiramiz
-                percentage_value=Cast(Replace(F('percentage'), Value('%'), Value('')), FloatField()),  # '%' belgisini olib tashlaymiz
-                effective_rental_price=Case(
-                    When(status='RETURNED', then=F('product__rental_price')),  # Agar status 'returned' bo'lsa, rental_price ni to'liq hisoblaymiz
-                    default=F('product__rental_price') * (F('percentage_value') / 100),  # Aks holda, rental_price ni percentage ga ko'paytiramiz
-                    output_field=DecimalField()  # Natijaning turini belgilaymiz
-                )
-            ).aggregate(
-                total_rental_revenue=Sum('effective_rental_price')  # Hisoblangan rental_price ni yig'amiz
-            )['total_rental_revenue'] or Decimal(0)
-
-            monthly_revenue[date.strftime("%d")] = sale_revenue + lending_revenue  # Kun raqami
-
-            lendings = Lending.objects.filter(
-                borrow_date__date=date,
-                product__admin=user
-            )
-
-            for lending in lendings:
-                percentage = lending.percentage  # Percentage maydoni
-                if percentage in monthly_lend_statistic:
-                    monthly_lend_statistic[percentage] += 1
-                else:
-                    monthly_lend_statistic[percentage] = 1
-            total_count += lendings.count()
-
-
-            returned_lendings = lendings.filter(status='RETURNED')  # Statusi 'returned' bo'lgan lendinglar
-            total_return_count += returned_lendings.count()
-
-            for returned_lending in returned_lendings:
-                # Percentage qiymatini to'g'ri formatlash
-                percentage_value = int(returned_lending.percentage.rstrip('%'))  # '%' ni olib tashlaymiz va int ga aylantiramiz
-                returned_percentage = 100 - percentage_value  # 100 - Percentage
-                returned_percentage_str = f"{returned_percentage}%"  # Natijani formatlash
-
-                if returned_percentage_str in monthly_returned_statistic:
-                    monthly_returned_statistic[returned_percentage_str] += 1
-                else:
-                   monthly_returned_statistic[returned_percentage_str] = 1
-            
-
-            created_users = user.created_users.all()
-
-            for created_user in created_users:
-                sales_count = Sale.objects.filter(
-                    seller=created_user,
-                    sale_date__range=(start_of_month, end_of_month),
-                    product__admin=user
-                ).count()
-                lending_count = Lending.objects.filter(
-                    borrow_date__range=(start_of_month, end_of_month),
-                    product__admin=user,
-                    seller=created_user
-                ).count()
-                count = lending_count + sales_count
-                users_product_count[created_user.username] = count
+        month_start, month_end = period_range('month')
+        histogram = lending_histogram(user, month_start, month_end)
+        users_product_count = employee_activity(user, month_start, month_end)
+
+        # Kunlik daromad rollup jadvalidan (bitta GROUP BY so'rovi)
+        monthly_revenue = {
+            bucket.strftime("%d"): total  # Kun raqami
+            for bucket, total in rollup_revenue_series(user, month_start.date(), month_end.date(), 'day')
+        }
 
         top_products = Sale.objects.filter(
+            in_range('sale_date', month_start, month_end),
             product__admin=user,
-            sale_date__range=(start_of_month, end_of_month)
         ).exclude(
             status='CANCELLED'
         ).values(
@@ -1431,8 +1146,8 @@ class MonthlyStatisticsView(APIView):
         # Get bottom 10 least sold products (excluding products from top 10)
         excluded_ids = [p['product__id'] for p in top_products]
         bottom_products = Sale.objects.filter(
+            in_range('sale_date', month_start, month_end),
             product__admin=user,
-            sale_date__range=(start_of_month, end_of_month)
         ).exclude(
             product__id__in=excluded_ids
         ).values(
@@ -1454,11 +1169,8 @@ class MonthlyStatisticsView(APIView):
 
 
         return {
-            "statistic":dict(monthly_revenue),
-            'lend_statistic': dict(monthly_lend_statistic),
-            'return_statistic': dict(monthly_returned_statistic),
-            'total_count': total_count,
-            'total_return_count': total_return_count,
+            "statistic": monthly_revenue,
+            **histogram,
             "users_product_count": dict(users_product_count),
             'top_products': [
                 {
@@ -1483,6 +1195,7 @@ class MonthlyStatisticsView(APIView):
 class YearlyStatisticsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_statistics('yearly')
     def get(self, request):
         user = request.user
         if user.role != User.DIRECTOR:
@@ -1490,144 +1203,63 @@ class YearlyStatisticsView(APIView):
         return Response(self.get_yearly_statistics(user))
 
     def get_yearly_statistics(self, user):
-        now = timezone.now()
-        current_year = now.year
-        yearly_revenue = defaultdict(float)
-
-        for year in range(current_year - 4, current_year + 1):  # 2 yil oldin va hozirgi yil
-            # Sale daromadini hisoblash
-            sale_revenue = Sale.objects.filter(
-                sale_date__year=year,
-                product__admin=user
-            ).annotate(total_price=ExpressionWrapper(
-                    Case(
-                        When(product_weight__isnull=False, then=F('product_weight') * F('sale_price')),
-                        default=F('sale_price') * F('quantity'),
-                        output_field=DecimalField()  # Ensure this is included
-                    ),
-                    output_field=DecimalField()  # This is the missing argument
-                )).aggregate(Sum('total_price'))['total_price__sum'] or 0
-
-            # Lending daromadini hisoblash
-            lending_revenue = Lending.objects.filter(
-                borrow_date__year=year,
-                product__admin=user
-            ).aggregate(
-                total_rental_revenue=Sum('product__rental_price')  # Faqat rental_price ni hisoblaymiz
-            )['total_rental_revenue'] or 0
-
-            yearly_revenue[str(year)] = sale_revenue + lending_revenue
-
-        return dict(yearly_revenue)
+        current_year = timezone.localdate().year
+        # Yopilgan yillar snapshotdan, qolganlari rollup jadvalidan (ijara to'liq rental_price bo'yicha)
+        closed_years = [date(year, 1, 1) for year in range(current_year - 4, current_year)]
+        stored = closed_snapshots(user, 'yearly', StatisticsSnapshot.YEAR, closed_years)
+        start = date(current_year, 1, 1) if len(stored) == len(closed_years) else closed_years[0]
+        yearly_revenue = {
+            bucket: total
+            for bucket, total in rollup_revenue_series(user, start, date(current_year + 1, 1, 1), 'year', lending_full_price=True)
+        }
+        # Birinchi ma'lumotdan oldingi yillar bo'sh: ular uchun snapshot saqlanmaydi
+        first_day = first_activity_date(user) if len(stored) < len(closed_years) else None
+        for year_start in closed_years:
+            if year_start not in stored:
+                if first_day is None or year_start.year < first_day.year:
+                    continue
+                stored[year_start] = save_snapshot(
+                    user, 'yearly', StatisticsSnapshot.YEAR, year_start, {'total': yearly_revenue[year_start]}
+                )
+            yearly_revenue[year_start] = stored[year_start]['total']
+        return {str(bucket.year): yearly_revenue[bucket] for bucket in sorted(yearly_revenue)}
 
 
 class YearlyDetailStatisticsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_statistics('yearly-detail')
     def get(self, request, year):
         user = request.user
         if user.role != User.DIRECTOR:
             raise serializers.ValidationError({"error": "Siz director emasssiz shuning uchun tur yo'qol bo'ttan"})
-        return Response(self.get_yearly_statistics(user, year))
+        if not 2000 <= year <= timezone.localdate().year:
+            return Response({"error": f"year 2000 va {timezone.localdate().year} oralig'ida bo'lishi kerak"}, status=400)
+
+        # Birinchi ma'lumotdan oldingi yillar bo'sh: snapshot saqlanmaydi
+        first_day = first_activity_date(user)
+        if first_day is None or year < first_day.year:
+            return Response(self.get_yearly_statistics(user, year))
+        # O'tgan yillar bitta indeksli so'rov bilan snapshotdan o'qiladi
+        return Response(period_snapshot(
+            user, 'yearly-detail', StatisticsSnapshot.YEAR, date(year, 1, 1),
+            lambda: self.get_yearly_statistics(user, year)
+        ))
 
     def get_yearly_statistics(self, user, year):
-        yearly_revenue = defaultdict(float)
-        yearly_lend_statistic = {f"{i}%": 0 for i in range(0, 101, 25)}
-        yearly_returned_statistic = {f"{i}%": 0 for i in range(0, 101, 25)}
-        users_product_count = defaultdict(int)
-
-        start_of_year = timezone.make_aware(datetime(year, 1, 1), timezone.get_current_timezone())
-        end_of_year = timezone.make_aware(datetime(year, 12, 31, 23, 59, 59, 999999), timezone.get_current_timezone())
-
-        total_count = 0
-        total_return_count = 0
-
-        # Har bir oy uchun daromadlarni hisoblash
-        for month in range(1, 13):  # 1 dan 12 gacha
-            month_name = timezone.datetime(year, month, 1).strftime("%B")
-
-            # Sale daromadini hisoblash
-            sale_revenue = Sale.objects.filter(
-                sale_date__year=year,
-                sale_date__month=month,
-                product__admin=user
-            ).exclude(
-                status='CANCELLED'
-            ).annotate(total_price=ExpressionWrapper(
-                    Case(
-                        When(product_weight__isnull=False, then=F('product_weight') * F('sale_price')),
-                        default=F('sale_price') * F('quantity'),
-                        output_field=DecimalField()  # Ensure this is included
-                    ),
-                    output_field=DecimalField()  # This is the missing argument
-                )).aggregate(Sum('total_price'))['total_price__sum'] or 0
-
-            # Lending daromadini hisoblash
-            lending_revenue = Lending.objects.filter(
-                borrow_date__year=year,
-                borrow_date__month=month,
-                product__admin=user
-            ).annotate(
-                # '%' belgisini olib tashlaymiz va float ga aylantiramiz
-                percentage_value=Cast(Replace(F('percentage'), Value('%'), Value('')), FloatField()),  # '%' belgisini olib tashlaymiz
-                effective_rental_price=Case(
-                    When(status='RETURNED', then=F('product__rental_price')),  # Agar status 'returned' bo'lsa, rental_price ni to'liq hisoblaymiz
-                    default=F('product__rental_price') * (F('percentage_value') / 100),  # Aks holda, rental_price ni percentage ga ko'paytiramiz
-                    output_field=DecimalField()  # Natijaning turini belgilaymiz
-                )
-            ).aggregate(
-                total_rental_revenue=Sum('effective_rental_price')  # Hisoblangan rental_price ni yig'amiz
-            )['total_rental_revenue'] or Decimal(0)
-
-            yearly_revenue[month_name.lower()] = sale_revenue + lending_revenue  # Oyning nomini kichik harflar bilan saqlaymiz
-
-            lendings = Lending.objects.filter(
-                borrow_date__year=year,
-                borrow_date__month=month,
-                product__admin=user
-            )
+        start_of_year, next_year = period_range('year', local_datetime(year))
+        histogram = lending_histogram(user, start_of_year, next_year)
+        users_product_count = employee_activity(user, start_of_year, next_year)
+
+        # Oylik daromad rollup jadvalidan (bitta GROUP BY so'rovi)
+        yearly_revenue = {
+            bucket.strftime("%B").lower(): total  # Oyning nomini kichik harflar bilan saqlaymiz
+            for bucket, total in rollup_revenue_series(user, date(year, 1, 1), date(year + 1, 1, 1), 'month')
+        }
 
-            for lending in lendings:
-                percentage = lending.percentage  # Percentage maydoni
-                if percentage in yearly_lend_statistic:
-                    yearly_lend_statistic[percentage] += 1
-                else:
-                    yearly_lend_statistic[percentage] = 1
-            total_count += lendings.count()
-
-            returned_lendings = lendings.filter(status='RETURNED')  # Statusi 'returned' bo'lgan lendinglar
-            total_return_count += returned_lendings.count()
-
-            for returned_lending in returned_lendings:
-                # Percentage qiymatini to'g'ri formatlash
-                percentage_value = int(returned_lending.percentage.rstrip('%'))  # '%' ni olib tashlaymiz va int ga aylantiramiz
-                returned_percentage = 100 - percentage_value  # 100 - Percentage
-                returned_percentage_str = f"{returned_percentage}%"  # Natijani formatlash
-
-                if returned_percentage_str in yearly_returned_statistic:
-                    yearly_returned_statistic[returned_percentage_str] += 1
-                else:
-                   yearly_returned_statistic[returned_percentage_str] = 1
-        
-        created_users = user.created_users.all()
-
-        for created_user in created_users:
-            sales_count = Sale.objects.filter(
-                seller=created_user,
-                    sale_date__range=(start_of_year, end_of_year),
-                    product__admin=user
-                ).count()
-            lending_count = Lending.objects.filter(
-                    borrow_date__range=(start_of_year, end_of_year),
-                    product__admin=user,
-                    seller=created_user
-                ).count()
-            count = lending_count + sales_count
-            users_product_count[created_user.username] = count
-        
         top_products = Sale.objects.filter(
+            in_range('sale_date', start_of_year, next_year),
             product__admin=user,
-            sale_date__range=(start_of_year, end_of_year)
         ).exclude(
             status='CANCELLED'
         ).values(
@@ -1648,8 +1280,8 @@ class YearlyDetailStatisticsView(APIView):
         # Get bottom 10 least sold products (excluding products from top 10)
         excluded_ids = [p['product__id'] for p in top_products]
         bottom_products = Sale.objects.filter(
+            in_range('sale_date', start_of_year, next_year),
             product__admin=user,
-            sale_date__range=(start_of_year, end_of_year)
         ).exclude(
             product__id__in=excluded_ids
         ).values(
@@ -1671,11 +1303,8 @@ class YearlyDetailStatisticsView(APIView):
 
 
         return {
-            "statistic":dict(yearly_revenue),
-            'lend_statistic': dict(yearly_lend_statistic),
-            'return_statistic':dict(yearly_returned_statistic),
-            'total_count': total_count,
-            'total_return_count': total_return_count,
+            "statistic": yearly_revenue,
+            **histogram,
             "users_product_count":dict(users_product_count),
             'top_products': [
                 {
@@ -1726,134 +1355,52 @@ class UserStatisticsView(APIView):
                 return Response({
                     'error': 'You do not have permission to view this user'
                 }, status=status.HTTP_403_FORBIDDEN)
-        # Statistika hisoblash
-        statistics = {
-            'daily': self.get_daily_statistics(user),
-            'weekly': self.get_weekly_statistics(user),
-            'monthly': self.get_monthly_statistics(user),
-            'yearly': self.get_yearly_statistics(user),
-        }
+        # Statistika hisoblash: to'rtta davr bir-biriga bog'liq emas, parallel hisoblaymiz
+        statistics = run_concurrently({
+            'daily': lambda: self.get_daily_statistics(user),
+            'weekly': lambda: self.get_weekly_statistics(user),
+            'monthly': lambda: self.get_monthly_statistics(user),
+            'yearly': lambda: self.get_yearly_statistics(user),
+        })
 
         return Response(statistics)
 
-    def get_daily_statistics(self, user):
-        uzbekistan_tz = pytz.timezone('Asia/Tashkent')
-        now = timezone.now().astimezone(uzbekistan_tz)
-        daily_revenue = defaultdict(int)
-        work_start = user.work_start_time.hour
-        work_end = user.work_end_time.hour
-        start = now.replace(hour=work_start, minute=0, second=0, microsecond=0)  # 00:00
-        end = now.replace(hour=work_end, minute=59, second=59, microsecond=999999)  # 23:59:59
-        for hour in range(work_start, work_end+1,1):  # Har 2 soatda
-            start_time = now.replace(hour=hour, minute=0, second=0, microsecond=0)
-            end_time = start_time + timezone.timedelta(hours=1)
-
-            # Sale daromadini hisoblash
-            sale_revenue = Sale.objects.filter(
-                sale_date__range=(start_time, end_time),
-                seller=user
-            ).aggregate(total_quantity=Sum('quantity'))['total_quantity'] or 0
-
-            # Lending daromadini hisoblash
-            lending_revenue = Lending.objects.filter(
-                borrow_date__range=(start_time, end_time),
-                # product__admin__in=[user] + list(user.created_users.all())
-                seller=user
-            ).count()
+    def activity_series(self, user, start, end, kind):
+        # Sotilgan dona + berilgan ijaralar soni, har bir manba uchun bitta GROUP BY, [start, end)
+        return revenue_series([
+            (Sale.objects.filter(seller=user), 'sale_date', F('quantity')),
+            (Lending.objects.filter(seller=user), 'borrow_date', Value(1)),
+        ], start, end, kind)
 
-            daily_revenue[start_time.strftime("%H:%M")] = sale_revenue + lending_revenue
-
-        return dict(daily_revenue)
+    def get_daily_statistics(self, user):
+        day_start, _ = period_range('day')
+        start = day_start + timedelta(hours=user.work_start_time.hour)
+        end = day_start + timedelta(hours=user.work_end_time.hour + 1)
+        return {
+            bucket.strftime("%H:%M"): total
+            for bucket, total in self.activity_series(user, start, end, 'hour')
+        }
 
     def get_weekly_statistics(self, user):
-        uzbekistan_tz = pytz.timezone('Asia/Tashkent')
-        now = timezone.now().astimezone(uzbekistan_tz)
-        start_of_week = now - timezone.timedelta(days=now.weekday())  # Dushanbadan boshlanadi
-        weekly_revenue = defaultdict(float)
-
-        for i in range(7):  # Haftada 7 kun
-            day = start_of_week + timezone.timedelta(days=i)
-            day_name = day.strftime("%A")
-
-            # Sale daromadini hisoblash
-            sale_revenue = Sale.objects.filter(
-                sale_date__date=day,
-                # product__created_by=user
-                seller=user
-            ).aggregate(total_quantity=Sum('quantity'))['total_quantity'] or 0
-
-            # Lending daromadini hisoblash
-            lending_revenue = Lending.objects.filter(
-                borrow_date__date=day,
-                # product__admin=user,
-                seller=user
-            ).count()
-
-            weekly_revenue[day_name] = sale_revenue + lending_revenue
-
-        return dict(weekly_revenue)
+        week_start, week_end = period_range('week')  # Dushanbadan boshlanadi
+        return {
+            bucket.strftime("%A"): total
+            for bucket, total in self.activity_series(user, week_start, week_end, 'day')
+        }
 
     def get_monthly_statistics(self, user):
-        uzbekistan_tz = pytz.timezone('Asia/Tashkent')
-        now = timezone.now().astimezone(uzbekistan_tz)
-        month = now.month
-        year = now.year
-        monthly_revenue = defaultdict(float)
-
-        start_of_month = now.replace(day=1)
-        last_day_of_month = calendar.monthrange(year, month)[1]
-        end_of_month = now.replace(day=last_day_of_month)
-
-        for day in range(1, 32):  # 1 dan 31 gacha
-            try:
-                date = timezone.datetime(year, month, day)
-            except ValueError:
-                # Agar bu oyda bunday kun bo'lmasa, davom etamiz
-                continue
-
-            sale_revenue = Sale.objects.filter(
-                sale_date__date=date,
-                # product__created_by=user,
-                seller=user
-            ).aggregate(total_quantity=Sum('quantity'))['total_quantity'] or 0
-
-            # Lending daromadini hisoblash
-            lending_revenue = Lending.objects.filter(
-                borrow_date__date=date,
-                # product__admin=user,
-                seller=user
-            ).count()
-
-            monthly_revenue[date.strftime("%d")] = sale_revenue + lending_revenue  # Kun raqami
-
-        return dict(monthly_revenue)
+        month_start, month_end = period_range('month')
+        return {
+            bucket.strftime("%d"): total  # Kun raqami
+            for bucket, total in self.activity_series(user, month_start, month_end, 'day')
+        }
 
     def get_yearly_statistics(self, user):
-        uzbekistan_tz = pytz.timezone('Asia/Tashkent')
-        now = timezone.now().astimezone(uzbekistan_tz)
-        yearly_revenue = defaultdict(float)
-        start_of_year = now.replace(month=1, day=1)
-
-        for month in range(1, 13):  # 1 dan 12 gacha
-            month_date = start_of_year.replace(month=month)  # 2 yil oldin va hozirgi yil
-            # Sale daromadini hisoblash
-            sale_revenue = Sale.objects.filter(
-                sale_date__year=now.year,
-                sale_date__month=month,
-                seller=user
-            ).aggregate(total_quantity=Sum('quantity'))['total_quantity'] or 0
-
-            # Lending daromadini hisoblash
-            lending_revenue = Lending.objects.filter(
-                borrow_date__year=now.year,
-                borrow_date__month=month,
-                seller=user
-            ).count()
-
-            total_revenue = sale_revenue + lending_revenue
-            yearly_revenue[month_date.strftime("%B")] = total_revenue
-
-        return dict(yearly_revenue)
+        year_start, year_end = period_range('year')
+        return {
+            bucket.strftime("%B"): total
+            for bucket, total in self.activity_series(user, year_start, year_end, 'month')
+        }
 
 
 class UserMonthlyIncomeView(APIView):
@@ -1879,10 +1426,8 @@ class UserMonthlyIncomeView(APIView):
         if start_date.year != end_date.year or start_date.month != end_date.month:
             return Response({"error": "start_date and end_date must be within the same month."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Make dates timezone aware
-        uzbekistan_tz = pytz.timezone('Asia/Tashkent')
-        start_date = timezone.make_aware(start_date, uzbekistan_tz)
-        end_date = timezone.make_aware(end_date, uzbekistan_tz)
+        # Asia/Tashkent bo'yicha [start_date, end_date + 1 kun) - end_date kuni ham kiradi
+        start, end = date_range(start_date.date(), end_date.date())
 
         # Get the user
         try:
@@ -1893,38 +1438,50 @@ class UserMonthlyIncomeView(APIView):
         if request.user != user and request.user != user.created_by:
             return Response({"error": "Siz bu user emassiz"})
 
+        # Yopilgan oy to'liq so'ralganda payroll snapshot bo'lsa, qayta hisoblamaymiz
+        last_day_of_month = calendar.monthrange(start_date.year, start_date.month)[1]
+        full_month = start_date.day == 1 and end_date.day == last_day_of_month
+        snapshot = None
+        if full_month and start_date.date() < timezone.localdate().replace(day=1):
+            snapshot = PayrollSnapshot.objects.filter(employee=user, month=start_date.date()).first()
+        if snapshot is not None:
+            return Response({
+                "username": user.username,
+                "sales_count": snapshot.sales_count,
+                "lending_count": snapshot.lending_count,
+                "KPI": snapshot.kpi,
+                "sales_kpi_total": snapshot.sales_kpi_total,
+                "lending_kpi_total": snapshot.lending_kpi_total,
+                "common_kpi_total": snapshot.common_kpi_total,
+                "salary": snapshot.salary,
+                "salary_kpi": snapshot.salary_kpi,
+            }, status=status.HTTP_200_OK)
+
         # Calculate the number of sales
         sales_count = Sale.objects.filter(
+            in_range('sale_date', start, end),
             seller=user,
-            sale_date__range=(start_date, end_date)
         ).count()
 
         sales_kpi_total = Sale.objects.filter(
+            Q(quantity__isnull=False) | Q(product_weight__isnull=False),  # Agar ikkalasi ham bo'lmasa, hisobga olinmaydi
+            in_range('sale_date', start, end),
             seller=user,
-            sale_date__range=(start_date, end_date)
         ).annotate(
-            kpi_value=ExpressionWrapper(
-                Case(
-                    When(quantity__isnull=False, then=F('sale_price') * F('quantity') * user.KPI / 100),  # Agar quantity mavjud bo'lsa
-                    When(product_weight__isnull=False, then=F('sale_price') * F('product_weight') * user.KPI / 100),  # Agar quantity mavjud bo'lmasa, product_weight ni olish
-                    default=0,  # Agar ikkalasi ham bo'lmasa, 0
-                    output_field=DecimalField()
-                ),
-                output_field=DecimalField()
-            )
+            kpi_value=ExpressionWrapper(SALE_REVENUE * user.KPI / 100, output_field=DecimalField())
         ).aggregate(total_kpi=Sum('kpi_value'))['total_kpi'] or Decimal(0)
 
         # Calculate the number of lendings
         lending_count = Lending.objects.filter(
+            in_range('borrow_date', start, end),
             seller=user,
-            borrow_date__range=(start_date, end_date),
             status="RETURNED"
         ).count()
         kpi = user.KPI
 
         lending_kpi_total = Lending.objects.filter(
+            in_range('borrow_date', start, end),
             seller=user,
-            borrow_date__range=(start_date, end_date),
             status='RETURNED'
         ).annotate(
             kpi_value=ExpressionWrapper(
@@ -1942,8 +1499,7 @@ class UserMonthlyIncomeView(APIView):
             "lending_kpi_total": lending_kpi_total,
             "common_kpi_total": sales_kpi_total + lending_kpi_total
         }
-        last_day_of_month = calendar.monthrange(start_date.year, start_date.month)[1]
-        if start_date.day == 1 and end_date.day == last_day_of_month:
+        if full_month:
             response_data["salary"] = user.salary
             response_data["salary_kpi"] = user.salary + sales_kpi_total + lending_kpi_total
         # Return the results
@@ -1953,6 +1509,52 @@ class UserMonthlyIncomeView(APIView):
 
 
 
+def parse_payroll_month(value):
+    # 'YYYY-MM' -> oyning birinchi kuni; faqat yopilgan (o'tgan) oylar uchun hisob bor
+    try:
+        month = datetime.strptime(value or '', '%Y-%m').date()
+    except ValueError:
+        raise serializers.ValidationError({"error": "month formati noto'g'ri (YYYY-MM)"})
+    if month >= timezone.localdate().replace(day=1):
+        raise serializers.ValidationError({"error": "Payroll faqat yopilgan oylar uchun hisoblanadi"})
+    return month
+
+
+class PayrollView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def check_role(self, user):
+        if user.role not in [User.DIRECTOR, User.ADMIN]:
+            raise PermissionDenied("Payroll faqat direktor va admin uchun")
+
+    def get(self, request):
+        # Saqlangan oylik snapshotlar: ?month=YYYY-MM
+        self.check_role(request.user)
+        month = parse_payroll_month(request.GET.get('month'))
+        snapshots = PayrollSnapshot.objects.filter(
+            director=director_id_of(request.user), month=month
+        ).select_related('employee')
+        return Response(PayrollSnapshotSerializer(snapshots, many=True).data)
+
+    def post(self, request):
+        # Oy uchun payroll: yo'q snapshotlar bitta batch da hisoblanadi, mavjudlari o'zgarmaydi
+        self.check_role(request.user)
+        month = parse_payroll_month(request.data.get('month'))
+        snapshots = run_payroll(director_id_of(request.user), month)
+        return Response(PayrollSnapshotSerializer(snapshots, many=True).data, status=status.HTTP_201_CREATED)
+
+
+class PayrollRecomputeView(PayrollView):
+    http_method_names = ['post', 'options']
+
+    def post(self, request):
+        # Oyning barcha snapshotlarini qayta hisoblash (kechikkan yozuvlar, KPI o'zgarishi)
+        self.check_role(request.user)
+        month = parse_payroll_month(request.data.get('month'))
+        snapshots = run_payroll(director_id_of(request.user), month, recompute=True)
+        return Response(PayrollSnapshotSerializer(snapshots, many=True).data)
+
+
 class UserManagementView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -2121,24 +1723,30 @@ class CartCheckoutView(APIView):
 
 class SoldProductsHistoryView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    UNKNOWN_BUYER = "Noma'lum"
 
     def get(self, request):
-        sales = Sale.objects.filter(seller=request.user, status='COMPLETED').order_by('-sale_date')
-        buyer_map = {}
-        for sale in sales:
-            buyer = sale.buyer or "Noma'lum"
-            # To'g'ri total_price hisoblash: quantity yoki product_weight bo'yicha
-            if sale.quantity is not None:
-                total_price = sale.sale_price * sale.quantity
-                product_quantity = sale.quantity
-            elif sale.product_weight is not None:
-                total_price = sale.sale_price * sale.product_weight
-                product_quantity = None
-            else:
-                total_price = sale.sale_price
-                product_quantity = None
-
-            item = {
+        sales = Sale.objects.filter(seller=request.user, status='COMPLETED')
+
+        # Xaridor (chek) bo'yicha guruhlash, summa va tartiblash SQL da; sahifa ham SQL LIMIT/OFFSET
+        groups = sales.annotate(
+            group=Case(When(buyer='', then=Value(self.UNKNOWN_BUYER)), default=F('buyer'), output_field=CharField())
+        ).values('group').annotate(
+            last_sale=Max('sale_date'),
+            last_id=Max('id'),
+            total=Sum(SALE_REVENUE),
+        ).order_by('-last_sale', '-last_id')
+        paginator = DefaultPagination()
+        page = paginator.paginate_queryset(groups, request, view=self)
+
+        # Faqat shu sahifadagi xaridorlarning qatorlari, mahsulot va kategoriya bitta JOIN bilan
+        buyers = [group['group'] for group in page]
+        if self.UNKNOWN_BUYER in buyers:
+            buyers.append('')
+        items = defaultdict(list)
+        lines = sales.filter(buyer__in=buyers).select_related('product__category').order_by('-sale_date', '-id')
+        for sale in lines:
+            items[sale.buyer or self.UNKNOWN_BUYER].append((sale, {
                 "id": sale.id,
                 "date": sale.sale_date.date(),
                 "product_id": sale.product.id,
@@ -2146,33 +1754,27 @@ class SoldProductsHistoryView(APIView):
                 "product_name": sale.product.name,
                 "product_category": sale.product.category.name if sale.product.category else None,
                 "product_price": str(sale.sale_price),
-                "product_quantity": product_quantity,
-                "total_price": str(total_price),
-            }
-            if buyer not in buyer_map:
-                buyer_map[buyer] = {
-                    "buyer": buyer,
-                    "item": [item],
-                    "total_price": str(total_price),
-                    "payment_type": sale.payment_type if hasattr(sale, "payment_type") else None
-                }
-            else:
-                buyer_map[buyer]["item"].append(item)
-                prev_total = Decimal(buyer_map[buyer]["total_price"])
-                buyer_map[buyer]["total_price"] = str(prev_total + total_price)
-        result = list(buyer_map.values())
+                "product_quantity": sale.quantity,
+                "total_price": str(sale.sale_price),  # sale_price - qator summasi
+            }))
 
-        # Pagination
-        paginator = DefaultPagination()
-        page = paginator.paginate_queryset(result, request)
-        return paginator.get_paginated_response(page)
+        result = []
+        for group in page:
+            lines = items[group['group']]
+            result.append({
+                "buyer": group['group'],
+                "item": [item for _, item in lines],
+                "total_price": str(Decimal(group['total'] or 0).quantize(Decimal('0.01'))),
+                "payment_type": lines[0][0].payment_type if lines else None,  # oxirgi sotuvniki
+            })
+        return paginator.get_paginated_response(result)
 
 
 class CashWithdrawalView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        serializer = CashWithdrawalSerializer(data=request.data)
+        serializer = CashWithdrawalSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             serializer.save(seller=request.user)
             return Response(serializer.data, status=201)
@@ -2195,91 +1797,32 @@ def calculate_growth(current, previous):
 class StatisticsReportView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_statistics('report')
     def get(self, request):
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-        period = request.GET.get('period')  # 'day', 'week', 'month', 'year'
-
-        sales = Sale.objects.all()
-        lendings = Lending.objects.all()
-        withdrawals = CashWithdrawal.objects.all()
-
-        now = timezone.now()
-
-        # Sana bo‘yicha filter
-        if start_date and end_date:
-            try:
-                start = datetime.strptime(start_date, "%Y-%m-%d")
-                end = datetime.strptime(end_date, "%Y-%m-%d")
-                sales = sales.filter(sale_date__date__gte=start, sale_date__date__lte=end)
-                lendings = lendings.filter(borrow_date__date__gte=start, borrow_date__date__lte=end)
-                withdrawals = withdrawals.filter(created_at__date__gte=start, created_at__date__lte=end)
-            except Exception:
-                pass
-
-        # Period bo‘yicha filter va oldingi davrni aniqlash
-        if period == "year":
-            current_year = now.year
-            prev_year = current_year - 1
-            sales_current = sales.filter(sale_date__year=current_year)
-            sales_prev = sales.filter(sale_date__year=prev_year)
-            lendings_current = lendings.filter(borrow_date__year=current_year)
-            lendings_prev = lendings.filter(borrow_date__year=prev_year)
-            withdrawals_current = withdrawals.filter(created_at__year=current_year)
-            withdrawals_prev = withdrawals.filter(created_at__year=prev_year)
-        elif period == "month":
-            current_year = now.year
-            current_month = now.month
-            if current_month == 1:
-                prev_month = 12
-                prev_year = current_year - 1
-            else:
-                prev_month = current_month - 1
-                prev_year = current_year
-            sales_current = sales.filter(sale_date__year=current_year, sale_date__month=current_month)
-            sales_prev = sales.filter(sale_date__year=prev_year, sale_date__month=prev_month)
-            lendings_current = lendings.filter(borrow_date__year=current_year, borrow_date__month=current_month)
-            lendings_prev = lendings.filter(borrow_date__year=prev_year, borrow_date__month=prev_month)
-            withdrawals_current = withdrawals.filter(created_at__year=current_year, created_at__month=current_month)
-            withdrawals_prev = withdrawals.filter(created_at__year=prev_year, created_at__month=prev_month)
-        elif period == "week":
-            current_week = now.isocalendar()[1]
-            current_year = now.year
-            prev_week = current_week - 1 if current_week > 1 else 52
-            prev_year = current_year if current_week > 1 else current_year - 1
-            sales_current = sales.filter(sale_date__week=current_week, sale_date__year=current_year)
-            sales_prev = sales.filter(sale_date__week=prev_week, sale_date__year=prev_year)
-            lendings_current = lendings.filter(borrow_date__week=current_week, borrow_date__year=current_year)
-            lendings_prev = lendings.filter(borrow_date__week=prev_week, borrow_date__year=prev_year)
-            withdrawals_current = withdrawals.filter(created_at__week=current_week, created_at__year=current_year)
-            withdrawals_prev = withdrawals.filter(created_at__week=prev_week, created_at__year=prev_year)
-        elif period == "day":
-            today = now.date()
-            yesterday = today - timezone.timedelta(days=1)
-            sales_current = sales.filter(sale_date__date=today)
-            sales_prev = sales.filter(sale_date__date=yesterday)
-            lendings_current = lendings.filter(borrow_date__date=today)
-            lendings_prev = lendings.filter(borrow_date__date=yesterday)
-            withdrawals_current = withdrawals.filter(created_at__date=today)
-            withdrawals_prev = withdrawals.filter(created_at__date=yesterday)
-        else:
-            # Default: umumiy
-            sales_current = sales
-            sales_prev = sales.none()
-            lendings_current = lendings
-            lendings_prev = lendings.none()
-            withdrawals_current = withdrawals
-            withdrawals_prev = withdrawals.none()
+        # ?period=day|week|month|year yoki ?start_date=&end_date=
+        # solishtirish: ?compare=previous|last_year yoki ?compare_start=&compare_end=
+        try:
+            current, previous = resolve_comparison(request.GET)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+        metrics = ['sales_revenue', 'lending_revenue', 'expense']
+        ranges = {'current': current}
+        if previous is not None:
+            ranges['previous'] = previous
+        totals = compare_totals(metrics, ranges, director_querysets(director_id_of(request.user)))
+        current_totals = totals['current']
+        previous_totals = totals.get('previous', {metric: 0 for metric in metrics})
 
         # Statistika hisoblash
-        total_revenue = sales_current.aggregate(total=Sum('sale_price'))['total'] or 0
-        total_revenue_prev = sales_prev.aggregate(total=Sum('sale_price'))['total'] or 0
+        total_revenue = current_totals['sales_revenue']
+        total_revenue_prev = previous_totals['sales_revenue']
 
-        lending_revenue = lendings_current.aggregate(total=Sum('product__rental_price'))['total'] or 0
-        lending_revenue_prev = lendings_prev.aggregate(total=Sum('product__rental_price'))['total'] or 0
+        lending_revenue = current_totals['lending_revenue']
+        lending_revenue_prev = previous_totals['lending_revenue']
 
-        total_expense = withdrawals_current.aggregate(total=Sum('amount'))['total'] or 0
-        total_expense_prev = withdrawals_prev.aggregate(total=Sum('amount'))['total'] or 0
+        total_expense = current_totals['expense']
+        total_expense_prev = previous_totals['expense']
 
         net_profit = total_revenue + lending_revenue - total_expense
         net_profit_prev = (total_revenue_prev + lending_revenue_prev) - total_expense_prev
@@ -2308,49 +1851,91 @@ class StatisticsReportView(APIView):
         return Response(data)
 
 
+class GrowthComparisonView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @cache_statistics('growth')
+    def get(self, request):
+        # ?metrics=sales_revenue,net_profit&period=day|week|month|year&periods=6&yoy=1
+        period = request.GET.get('period', 'month')
+        if period not in GROWTH_PERIODS:
+            return Response({"error": f"period quyidagilardan biri bo'lishi kerak: {', '.join(GROWTH_PERIODS)}"}, status=400)
+        allowed = list(SERIES_METRICS) + list(DERIVED_METRICS)
+        metrics = [metric for metric in request.GET.get('metrics', ','.join(allowed)).split(',') if metric]
+        unknown = [metric for metric in metrics if metric not in allowed]
+        if not metrics or unknown:
+            return Response({"error": f"metrics quyidagilardan bo'lishi kerak: {', '.join(allowed)}"}, status=400)
+        try:
+            count = int(request.GET.get('periods', 6))
+        except ValueError:
+            return Response({"error": "periods butun son bo'lishi kerak"}, status=400)
+        if not 1 <= count <= MAX_GROWTH_PERIODS:
+            return Response({"error": f"periods 1 dan {MAX_GROWTH_PERIODS} gacha bo'lishi kerak"}, status=400)
+        year_over_year = request.GET.get('yoy', '1') not in ('0', 'false')
+
+        rows, previous = growth_totals(
+            metrics, period, count, director_querysets(director_id_of(request.user)), year_over_year
+        )
+        label_format = SERIES_LABELS[period]
+        result = []
+        for start, end, values, year_ago in rows:
+            item = {
+                "label": timezone.localtime(start).strftime(label_format),
+                "start_date": timezone.localtime(start).date(),
+                "end_date": timezone.localtime(end).date() - timedelta(days=1),
+                "values": values,
+                "growth": {metric: calculate_growth(values[metric], previous[metric]) for metric in metrics},
+            }
+            if year_ago is not None:
+                item["year_ago"] = year_ago
+                item["yoy_growth"] = {metric: calculate_growth(values[metric], year_ago[metric]) for metric in metrics}
+            result.append(item)
+            previous = values
+
+        return Response({"period": period, "metrics": metrics, "periods": result})
+
+
 class IncomeExpenseDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_statistics('income-expense')
     def get(self, request):
         # Filterlar
         start_date = request.GET.get('start_date')
         end_date = request.GET.get('end_date')
 
-        sales = Sale.objects.all()
-        lendings = Lending.objects.all()
-        withdrawals = CashWithdrawal.objects.all()
+        director = director_id_of(request.user)
+        querysets = director_querysets(director)
+        sales = querysets['sales_revenue']
+        lendings = querysets['lending_revenue']
+        withdrawals = querysets['expense']
 
         if start_date and end_date:
             try:
-                start = datetime.strptime(start_date, "%Y-%m-%d")
-                end = datetime.strptime(end_date, "%Y-%m-%d")
-                sales = sales.filter(sale_date__date__gte=start, sale_date__date__lte=end)
-                lendings = lendings.filter(borrow_date__date__gte=start, borrow_date__date__lte=end)
-                withdrawals = withdrawals.filter(created_at__date__gte=start, created_at__date__lte=end)
-            except Exception:
-                pass
+                start = parse_local_date(start_date)
+                end = parse_local_date(end_date) + timedelta(days=1)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=400)
+            sales = sales.filter(sale_date__gte=start, sale_date__lt=end)
+            lendings = lendings.filter(borrow_date__gte=start, borrow_date__lt=end)
+            withdrawals = withdrawals.filter(created_at__gte=start, created_at__lt=end)
 
         # Kirim tafsilotlari
         sales_income = sales.aggregate(total=Sum('sale_price'))['total'] or 0
         lending_income = lendings.aggregate(total=Sum('product__rental_price'))['total'] or 0
         other_income = 0  # Agar boshqa daromadlar bo'lsa, shu yerda hisoblang
 
-        # Chiqim tafsilotlari
-        def get_expense_sum(comment):
-            return withdrawals.filter(comment__iexact=comment).aggregate(total=Sum('amount'))['total'] or 0
-
-        expense_details = {
-            "Xodimlar maoshi": get_expense_sum("Xodimlar maoshi"),
-            "Ijara haqi": get_expense_sum("Ijara haqi"),
-            "Kommunal xizmatlar": get_expense_sum("Kommunal xizmatlar"),
-            "Marketing": get_expense_sum("Marketing"),
-            "Ta'mirlash": get_expense_sum("Ta'mirlash"),
-            "Boshqa xarajatlar": withdrawals.exclude(
-                comment__in=[
-                    "Xodimlar maoshi", "Ijara haqi", "Kommunal xizmatlar", "Marketing", "Ta'mirlash"
-                ]
-            ).aggregate(total=Sum('amount'))['total'] or 0
+        # Chiqim tafsilotlari: kategoriya bo'yicha bitta GROUP BY so'rovi
+        category_totals = {
+            row['category_id']: row['total']
+            for row in withdrawals.values('category_id').annotate(total=Sum('amount')).order_by()
         }
+        categories = ExpenseCategory.for_director(director).order_by(F('created_by').asc(nulls_first=True), 'id')
+        expense_details = {}
+        for category in categories:
+            expense_details[category.name] = category_totals.pop(category.pk, 0)
+        # Kategoriyasiz (yoki boshqa direktorning kategoriyasi bilan) chiqimlar
+        expense_details[ExpenseCategory.OTHER_NAME] = sum(category_totals.values()) or 0
 
         data = {
             "income_detail": {
@@ -2363,83 +1948,44 @@ class IncomeExpenseDetailView(APIView):
         return Response(data)
 
 
+class ExpenseCategoryListCreateView(generics.ListCreateAPIView):
+    serializer_class = ExpenseCategorySerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = None
+
+    def get_queryset(self):
+        # Umumiy kategoriyalar va direktorning o'z kategoriyalari
+        return ExpenseCategory.for_director(director_id_of(self.request.user))
+
+    def perform_create(self, serializer):
+        user = self.request.user
+        if user.role not in [User.DIRECTOR, User.ADMIN]:
+            raise exceptions.PermissionDenied("Xarajat kategoriyasini faqat direktor yoki admin yaratadi.")
+        serializer.save(created_by_id=director_id_of(user))
+
 
 class IncomeExpenseDynamicsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_statistics('dynamics')
     def get(self, request):
-        period = request.GET.get('period', 'month')  # 'year', 'month', 'week', 'day'
-        year = int(request.GET.get('year', timezone.now().year))
-
-        sales = Sale.objects.all()
-        lendings = Lending.objects.all()
-        withdrawals = CashWithdrawal.objects.all()
+        # ?period=year|month|week|day (&year=) yoki ?start_date=&end_date=|?days= (&granularity=)
+        try:
+            start, end, granularity, label_format = resolve_series_range(request.GET)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
 
+        # Faqat so'rovchi direktorning (yoki uning xodimlari direktorining) ma'lumotlari,
+        # sotuv va ijara FACT_STORE_DIR sozlangan bo'lsa ustunli nusxadan
         result = []
-
-        if period == 'year':
-            # Har bir yil uchun
-            start_year = year - 4  # oxirgi 5 yil
-            for y in range(start_year, year + 1):
-                sales_sum = sales.filter(sale_date__year=y).aggregate(total=Sum('sale_price'))['total'] or 0
-                lending_sum = lendings.filter(borrow_date__year=y).aggregate(total=Sum('product__rental_price'))['total'] or 0
-                expense_sum = withdrawals.filter(created_at__year=y).aggregate(total=Sum('amount'))['total'] or 0
-                net_profit = sales_sum + lending_sum - expense_sum
-                result.append({
-                    "label": str(y),
-                    "income": sales_sum + lending_sum,
-                    "expense": expense_sum,
-                    "net_profit": net_profit
-                })
-        elif period == 'month':
-            # 12 oy uchun
-            for m in range(1, 13):
-                sales_sum = sales.filter(sale_date__year=year, sale_date__month=m).aggregate(total=Sum('sale_price'))['total'] or 0
-                lending_sum = lendings.filter(borrow_date__year=year, borrow_date__month=m).aggregate(total=Sum('product__rental_price'))['total'] or 0
-                expense_sum = withdrawals.filter(created_at__year=year, created_at__month=m).aggregate(total=Sum('amount'))['total'] or 0
-                net_profit = sales_sum + lending_sum - expense_sum
-                result.append({
-                    "label": datetime(year, m, 1).strftime('%b'),  # 'Yan', 'Fev', ...
-                    "income": sales_sum + lending_sum,
-                    "expense": expense_sum,
-                    "net_profit": net_profit
-                })
-        elif period == 'week':
-            # Joriy haftaning boshidan oxirigacha kunlar bo‘yicha
-            now = timezone.now()
-            start_of_week = now - timezone.timedelta(days=now.weekday())  # Dushanba
-            result = []
-            for i in range(7):  # 0 - 6 (Dushanba - Yakshanba)
-                day = start_of_week + timezone.timedelta(days=i)
-                sales_sum = sales.filter(sale_date__date=day.date()).aggregate(total=Sum('sale_price'))['total'] or 0
-                lending_sum = lendings.filter(borrow_date__date=day.date()).aggregate(total=Sum('product__rental_price'))['total'] or 0
-                expense_sum = withdrawals.filter(created_at__date=day.date()).aggregate(total=Sum('amount'))['total'] or 0
-                net_profit = sales_sum + lending_sum - expense_sum
-                result.append({
-                    "label": day.strftime('%A'),  # Kun nomi: Monday, Tuesday, ...
-                    "income": sales_sum + lending_sum,
-                    "expense": expense_sum,
-                    "net_profit": net_profit
-                })
-        elif period == 'day':
-            # Bugungi kunning har bir soati uchun (00:00 dan 23:00 gacha)
-            today = timezone.now().date()
-            result = []
-            for hour in range(0, 24):
-                start_time = datetime.combine(today, datetime.min.time()) + timedelta(hours=hour)
-                end_time = start_time + timedelta(hours=1)
-                sales_sum = sales.filter(sale_date__range=(start_time, end_time)).aggregate(total=Sum('sale_price'))['total'] or 0
-                lending_sum = lendings.filter(borrow_date__range=(start_time, end_time)).aggregate(total=Sum('product__rental_price'))['total'] or 0
-                expense_sum = withdrawals.filter(created_at__range=(start_time, end_time)).aggregate(total=Sum('amount'))['total'] or 0
-                net_profit = sales_sum + lending_sum - expense_sum
-                result.append({
-                    "label": f"{start_time.strftime('%H:%M')}-{end_time.strftime('%H:%M')}",
-                    "income": sales_sum + lending_sum,
-                    "expense": expense_sum,
-                    "net_profit": net_profit
-                })
-        else:
-            return Response({"error": "period noto'g'ri"}, status=400)
+        for bucket, totals in director_time_series(director_id_of(request.user), ['sales_revenue', 'lending_revenue', 'expense'], start, end, granularity):
+            income = totals['sales_revenue'] + totals['lending_revenue']
+            result.append({
+                "label": series_label(bucket, label_format),
+                "income": income,
+                "expense": totals['expense'],
+                "net_profit": income - totals['expense']
+            })
 
         return Response(result)
 
@@ -2447,67 +1993,22 @@ class IncomeExpenseDynamicsView(APIView):
 class RevenueDynamicsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_statistics('revenue-dynamics')
     def get(self, request):
-        period = request.GET.get('period', 'month')  # 'year', 'month', 'week', 'day'
-        year = int(request.GET.get('year', timezone.now().year))
+        # ?period=year|month|week|day (&year=) yoki ?start_date=&end_date=|?days= (&granularity=)
+        try:
+            start, end, granularity, label_format = resolve_series_range(request.GET)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
 
-        sales = Sale.objects.all()
-        lendings = Lending.objects.all()
         result = []
-
-        if period == 'year':
-            start_year = year - 4
-            for y in range(start_year, year + 1):
-                sales_sum = sales.filter(sale_date__year=y).aggregate(total=Sum('sale_price'))['total'] or 0
-                lending_sum = lendings.filter(borrow_date__year=y).aggregate(total=Sum('product__rental_price'))['total'] or 0
-                result.append({
-                    "label": str(y),
-                    "total_revenue": sales_sum + lending_sum,
-                    "sales_revenue": sales_sum,
-                    "lending_revenue": lending_sum
-                })
-        elif period == 'month':
-            for m in range(1, 13):
-                sales_sum = sales.filter(sale_date__year=year, sale_date__month=m).aggregate(total=Sum('sale_price'))['total'] or 0
-                lending_sum = lendings.filter(borrow_date__year=year, borrow_date__month=m).aggregate(total=Sum('product__rental_price'))['total'] or 0
-                result.append({
-                    "label": datetime(year, m, 1).strftime('%b'),
-                    "total_revenue": sales_sum + lending_sum,
-                    "sales_revenue": sales_sum,
-                    "lending_revenue": lending_sum
-                })
-        elif period == 'week':
-            # Joriy haftaning boshidan oxirigacha kunlar bo‘yicha
-            now = timezone.now()
-            start_of_week = now - timezone.timedelta(days=now.weekday())  # Dushanba
-            result = []
-            for i in range(7):  # 0 - 6 (Dushanba - Yakshanba)
-                day = start_of_week + timezone.timedelta(days=i)
-                sales_sum = sales.filter(sale_date__date=day.date()).aggregate(total=Sum('sale_price'))['total'] or 0
-                lending_sum = lendings.filter(borrow_date__date=day.date()).aggregate(total=Sum('product__rental_price'))['total'] or 0
-                result.append({
-                    "label": day.strftime('%A'),  # Kun nomi: Monday, Tuesday, ...
-                    "total_revenue": sales_sum + lending_sum,
-                    "sales_revenue": sales_sum,
-                    "lending_revenue": lending_sum
-                })
-        elif period == 'day':
-            # Bugungi kunning har bir soati uchun (00:00 dan 23:00 gacha)
-            today = timezone.now().date()
-            result = []
-            for hour in range(0, 24):
-                start_time = datetime.combine(today, datetime.min.time()) + timedelta(hours=hour)
-                end_time = start_time + timedelta(hours=1)
-                sales_sum = sales.filter(sale_date__range=(start_time, end_time)).aggregate(total=Sum('sale_price'))['total'] or 0
-                lending_sum = lendings.filter(borrow_date__range=(start_time, end_time)).aggregate(total=Sum('product__rental_price'))['total'] or 0
-                result.append({
-                    "label": f"{start_time.strftime('%H:%M')}-{end_time.strftime('%H:%M')}",
-                    "total_revenue": sales_sum + lending_sum,
-                    "sales_revenue": sales_sum,
-                    "lending_revenue": lending_sum
-                })
-        else:
-            return Response({"error": "period noto'g'ri"}, status=400)
+        for bucket, totals in director_time_series(director_id_of(request.user), ['sales_revenue', 'lending_revenue'], start, end, granularity):
+            result.append({
+                "label": series_label(bucket, label_format),
+                "total_revenue": totals['sales_revenue'] + totals['lending_revenue'],
+                "sales_revenue": totals['sales_revenue'],
+                "lending_revenue": totals['lending_revenue']
+            })
 
         return Response(result)
 
@@ -2515,32 +2016,29 @@ class RevenueDynamicsView(APIView):
 class CategorySalesShareView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_statistics('category-sales-share')
     def get(self, request):
-        year = int(request.GET.get('year', timezone.now().year))
-        month = request.GET.get('month', None)
-
-        # Faqat yil va oy bo‘yicha filter
-        products = Product.objects.all()
-        if month:
-            products = products.filter(created_at__year=year, created_at__month=int(month))
-        else:
-            products = products.filter(created_at__year=year)
+        try:
+            year, month = year_month_params(request.GET)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
+        # mode: products - yaratilgan mahsulotlar, count - sotuvlar soni, revenue - sotuv summasi
+        mode = request.GET.get('mode', 'products')
+        if mode not in CATEGORY_SHARE_MODES:
+            return Response({"error": f"mode quyidagilardan biri bo'lishi kerak: {', '.join(CATEGORY_SHARE_MODES)}"}, status=400)
 
-        total_products = products.count() or 1  # 0 bo‘lsa, 1 qilib olamiz, bo‘linishda xatolik bo‘lmasin
-
-        category_data = (
-            products.values('category__name')
-            .annotate(product_count=Count('id'))
-            .order_by('-product_count')
-        )
+        category_data = category_share(director_id_of(request.user), year, month, mode)
 
         result = []
         for item in category_data:
-            percent = round(item['product_count'] * 100 / total_products, 2)
             result.append({
                 "category": item['category__name'] or "Boshqalar",
-                "product_count": item['product_count'],
-                "percent": percent
+                "product_count": item['total_products'],
+                "sold_count": item['total_sales'],
+                "quantity": item['total_quantity'],
+                "weight": item['total_weight'],
+                "revenue": item['total_revenue'],
+                "percent": item['percent']
             })
 
         return Response(result)
@@ -2550,45 +2048,28 @@ class CategorySalesShareView(APIView):
 class TopSoldProductsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_statistics('top-sold-products')
     def get(self, request):
-        year = int(request.GET.get('year', timezone.now().year))
-        month = request.GET.get('month', None)
+        try:
+            year, month = year_month_params(request.GET)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
 
-        sales = Sale.objects.all()
-        if month:
-            sales = sales.filter(sale_date__year=year, sale_date__month=int(month))
-        else:
-            sales = sales.filter(sale_date__year=year)
-
-        # Har bir product uchun sotilgan soni va jami summa
-        product_data = (
-            sales.values('product', 'product__name', 'product__category__name')
-            .annotate(
-                sold_count=Count('id'),
-                total_income=Sum('sale_price')
-            )
-            .order_by('-sold_count', '-total_income')[:10]
-        )
-
-        # Har bir product uchun arenda sonini ham hisoblash
-        product_ids = [item['product'] for item in product_data]
-        lending_counts = dict(
-            Lending.objects.filter(product_id__in=product_ids)
-            .values('product')
-            .annotate(lend_count=Count('id'))
-            .values_list('product', 'lend_count')
-        )
+        # Direktorning oylik hisoblagichlaridan top 10 (sotilgan soni, keyin daromad bo'yicha)
+        product_data = top_products(director_id_of(request.user), year, month, by='sold')
 
         result = []
         for item in product_data:
             result.append({
-                "product_id": item['product'],
+                "product_id": item['product_id'],
                 "name": item['product__name'],
                 "category": item['product__category__name'],
-                "sold_count": item['sold_count'],
-                "lend_count": lending_counts.get(item['product'], 0),
-                "total_income": item['total_income'],
-                "profit": item['total_income'],  # Agar foyda alohida bo‘lsa, shu yerda hisoblang
+                "sold_count": item['total_sold'],
+                "lend_count": item['total_lent'],
+                "quantity": item['total_quantity'],
+                "weight": item['total_weight'],
+                "total_income": item['sale_income'],
+                "profit": item['sale_income'],  # Agar foyda alohida bo‘lsa, shu yerda hisoblang
             })
         return Response(result)
 
@@ -2596,48 +2077,27 @@ class TopSoldProductsView(APIView):
 class TopLendedProductsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cache_statistics('top-lended-products')
     def get(self, request):
-        year = int(request.GET.get('year', timezone.now().year))
-        month = request.GET.get('month', None)
-
-        lendings = Lending.objects.all()
-        if month:
-            lendings = lendings.filter(borrow_date__year=year, borrow_date__month=int(month))
-        else:
-            lendings = lendings.filter(borrow_date__year=year)
-
-        # Har bir product uchun arenda soni va jami summa
-
-        product_data = (
-            lendings.values('product', 'product__name', 'product__category__name')
-            .annotate(
-                lend_count=Count('id'),
-                total_income=Sum('product__rental_price'),
-                # avg_days=Avg('days')  # Agar days maydoni bo‘lsa
-            )
-            .order_by('-lend_count', '-total_income')[:10]
-        )
+        try:
+            year, month = year_month_params(request.GET)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
 
-        # Har bir product uchun sotilgan sonini ham hisoblash
-        product_ids = [item['product'] for item in product_data]
-        sales_counts = dict(
-            Sale.objects.filter(product_id__in=product_ids)
-            .values('product')
-            .annotate(sold_count=Count('id'))
-            .values_list('product', 'sold_count')
-        )
+        # Ijara daromadi = ijaralar soni * mahsulotning rental_price
+        product_data = top_products(director_id_of(request.user), year, month, by='lended')
 
         result = []
         for item in product_data:
             result.append({
-                "product_id": item['product'],
+                "product_id": item['product_id'],
                 "name": item['product__name'],
                 "category": item['product__category__name'],
-                "lend_count": item['lend_count'],
-                "sold_count": sales_counts.get(item['product'], 0),
-                "total_income": item['total_income'],
+                "lend_count": item['total_lent'],
+                "sold_count": item['total_sold'],
+                "total_income": item['lend_income'],
                 # "avg_days": item['avg_days'] or 0,
-                "profit": item['total_income'],  # Agar foyda alohida bo‘lsa, shu yerda hisoblang
+                "profit": item['lend_income'],  # Agar foyda alohida bo‘lsa, shu yerda hisoblang
             })
         return Response(result)
 
@@ -2645,74 +2105,151 @@ class TopLendedProductsView(APIView):
 
 class EmployeeStatisticsView(APIView):
     permission_classes = [IsAuthenticated]
+    ORDERING_FIELDS = ['username', 'sales_count', 'lending_count', 'commission', 'income']
 
+    @cache_statistics('employee')
     def get(self, request):
         # Faqat direktor va admin uchun
         user = request.user
         if user.role not in [User.DIRECTOR, User.ADMIN]:
             return Response({"error": "Ruxsat yo'q"}, status=403)
 
-        # Hodimlar ro'yxati
-        if user.role == User.DIRECTOR:
-            employees = User.objects.filter(created_by=user, role=User.SELLER)
-        else:
-            employees = User.objects.filter(created_by=user.created_by, role=User.SELLER)
+        try:
+            year = int(request.GET.get('year', timezone.localdate().year))
+            month = int(request.GET.get('month', timezone.localdate().month))
+            start, end = period_range('month', local_datetime(year, month))
+        except ValueError:
+            return Response({"error": "year yoki month noto'g'ri"}, status=400)
+
+        # ?ordering=-income kabi, faqat ruxsat etilgan maydonlar
+        ordering = request.GET.get('ordering', 'id')
+        if ordering.lstrip('-') not in self.ORDERING_FIELDS + ['id']:
+            return Response({"error": "ordering noto'g'ri"}, status=400)
+
+        # Hodimlar ro'yxati va oylik ko'rsatkichlari bitta so'rovda
+        employees = employee_metrics(
+            User.objects.filter(created_by=director_id_of(user), role=User.SELLER),
+            start, end
+        ).order_by(ordering, 'id')
+
+        # ?page= yoki ?page_size= berilsa SQL LIMIT/OFFSET bilan sahifalaymiz
+        paginator = None
+        if 'page' in request.GET or 'page_size' in request.GET:
+            paginator = DefaultPagination()
+            employees = paginator.paginate_queryset(employees, request, view=self)
+
+        result = [
+            {
+                "username": emp.username,
+                "full_name": emp.get_full_name() if hasattr(emp, 'get_full_name') else emp.first_name + " " + emp.last_name,
+                "sales_count": emp.sales_count,
+                "lending_count": emp.lending_count,
+                "commission": emp.commission,
+                "income": emp.income
+            }
+            for emp in employees
+        ]
 
-        year = int(request.GET.get('year', timezone.now().year))
-        month = int(request.GET.get('month', timezone.now().month))
+        if paginator is not None:
+            return paginator.get_paginated_response(result)
+        return Response(result)
 
-        start_date = datetime(year, month, 1)
-        last_day = calendar.monthrange(year, month)[1]
-        end_date = datetime(year, month, last_day, 23, 59, 59)
 
-        result = []
-        for emp in employees:
-            # Sotish soni va daromadi
-            sales = Sale.objects.filter(
-                seller=emp,
-                sale_date__range=(start_date, end_date)
-            )
-            sales_count = sales.count()
-            sales_income = sales.aggregate(total=Sum('sale_price'))['total'] or 0
+class StatisticsCacheView(APIView):
+    permission_classes = [IsAuthenticated]
 
-            # Arenda soni va daromadi
-            lendings = Lending.objects.filter(
-                seller=emp,
-                borrow_date__range=(start_date, end_date)
-            )
-            lending_count = lendings.count()
-            lending_income = lendings.aggregate(total=Sum('product__rental_price'))['total'] or 0
-
-            # Komissiya (KPI)
-            kpi = emp.KPI or 0
-            sales_kpi = sales.aggregate(
-                total=Sum(
-                    ExpressionWrapper(
-                        F('sale_price') * F('quantity') * kpi / 100,
-                        output_field=DecimalField()
-                    )
-                )
-            )['total'] or 0
+    def get(self, request):
+        # Statistika keshi hit/miss hisoblagichlari (shu jarayon uchun)
+        if request.user.role != User.DIRECTOR:
+            return Response({"error": "Ruxsat yo'q"}, status=403)
+        return Response(cache_info())
 
-            lending_kpi = lendings.aggregate(
-                total=Sum(
-                    ExpressionWrapper(
-                        F('product__rental_price') * kpi / 100,
-                        output_field=DecimalField()
+
+class SalesHeatmapView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @cache_statistics('heatmap')
+    def get(self, request):
+        # 7x24 (hafta kuni x soat) sotuv summasi va soni; oraliq dynamics endpointlari kabi
+        # ?start_date=&end_date= | ?days= | ?period=, ixtiyoriy &seller=<id> yoki &by_seller=1
+        if request.user.role not in [User.DIRECTOR, User.ADMIN]:
+            return Response({"error": "Ruxsat yo'q"}, status=403)
+        try:
+            start, end, _, _ = resolve_series_range(request.GET)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        seller = request.GET.get('seller')
+        if seller and not seller.isdigit():
+            return Response({"error": "seller butun son bo'lishi kerak"}, status=400)
+        seller = int(seller) if seller else None
+        by_seller = request.GET.get('by_seller') in ('1', 'true')
+
+        data = sales_heatmap(director_id_of(request.user), start, end, seller=seller, by_seller=by_seller)
+        data['start_date'] = timezone.localtime(start).date()
+        data['end_date'] = timezone.localtime(end).date() - timedelta(days=1)
+        return Response(data)
+
+
+class AnalyticsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @cache_statistics('analytics')
+    def get(self, request):
+        # ?metrics=revenue,expense&dimensions=month,seller&start_date=&end_date=&seller=&category=&product=&payment_type=
+        if request.user.role not in [User.DIRECTOR, User.ADMIN]:
+            return Response({"error": "Ruxsat yo'q"}, status=403)
+        try:
+            query = parse_analytics_query(request.GET)
+            return Response(run_analytics_query(director_id_of(request.user), query))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+
+
+class ExportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, ledger):
+        # /export/<sales|lendings|withdrawals|report>/?type=csv|xlsx&start_date=&end_date=&status=
+        # report uchun oraliq dynamics endpointlari kabi (?period= yoki ?start_date=&end_date=&granularity=)
+        user = request.user
+        if user.role not in [User.DIRECTOR, User.ADMIN]:
+            return Response({"error": "Ruxsat yo'q"}, status=403)
+        if ledger not in LEDGERS and ledger != 'report':
+            return Response({"error": "Bunday eksport mavjud emas"}, status=404)
+        file_type = request.GET.get('type', 'csv')
+        if file_type not in EXPORT_TYPES:
+            return Response({"error": f"type quyidagilardan biri bo'lishi kerak: {', '.join(EXPORT_TYPES)}"}, status=400)
+
+        director = director_id_of(user)
+        try:
+            if ledger == 'report':
+                start, end, granularity, label_format = resolve_series_range(request.GET)
+                series = time_series(list(SERIES_METRICS), start, end, granularity, director_querysets(director))
+                header = ['Davr', 'Sotuv', 'Ijara', 'Chiqim', 'Foyda']
+                rows = (
+                    (
+                        series_label(bucket, label_format),
+                        totals['sales_revenue'],
+                        totals['lending_revenue'],
+                        totals['expense'],
+                        totals['sales_revenue'] + totals['lending_revenue'] - totals['expense'],
                     )
+                    for bucket, totals in series
                 )
-            )['total'] or 0
+            else:
+                start_date = request.GET.get('start_date')
+                end_date = request.GET.get('end_date')
+                start = parse_local_date(start_date) if start_date else None
+                end = parse_local_date(end_date) + timedelta(days=1) if end_date else None
+                header = ledger_header(ledger)
+                rows = iter_ledger(ledger, director, start, end, request.GET.get('status'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
 
-            result.append({
-                "username": emp.username,
-                "full_name": emp.get_full_name() if hasattr(emp, 'get_full_name') else emp.first_name + " " + emp.last_name,
-                "sales_count": sales_count,
-                "lending_count": lending_count,
-                "commission": sales_kpi + lending_kpi,
-                "income": sales_income + lending_income
-            })
-
-        return Response(result)
+        content_type, extension = EXPORT_TYPES[file_type]
+        response = StreamingHttpResponse(stream_table(file_type, header, rows, sheet=ledger), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{ledger}_{timezone.localdate():%Y%m%d}.{extension}"'
+        return response
 
 
 class CartItemDeleteView(APIView):
@@ -2736,119 +2273,55 @@ class CartBulkCheckoutView(APIView):
         buyer = request.data.get('buyer', '')
         payment_type = request.data.get('payment_type', 'CASH')
         items = request.data.get('items', [])
-        if not items or not isinstance(items, list):
+        if not items or not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
             return Response({"error": "Mahsulotlar ro'yxati noto'g'ri"}, status=400)
 
-        # Faqat shu user va shu buyer uchun oldingi tartib raqamlarni topamiz
-        pattern = re.compile(rf"^{re.escape(buyer)}-(\d+)$")
-        all_buyers = Sale.objects.filter(seller=request.user, buyer__startswith=buyer + "-").values_list('buyer', flat=True)
-        max_number = 0
-        for b in all_buyers:
-            match = pattern.match(b)
-            if match:
-                num = int(match.group(1))
-                if num > max_number:
-                    max_number = num
-        tartib_raqam = max_number + 1
-        unique_buyer = f"{buyer}-{tartib_raqam}"
+        # Butun savat bitta tranzaksiyada: xatolik bo'lsa hech bir mahsulot sotilmaydi
+        try:
+            receipt, sales = checkout(request.user, buyer, payment_type, items)
+        except CheckoutError as e:
+            return Response({"error": e.message}, status=e.status)
 
-        sales = []
-        total_price = Decimal('0')
-        for item in items:
-            product_id = item.get('product_id')
-            quantity = item.get('quantity')
-            weight = item.get('weight')
-            try:
-                product = Product.objects.get(id=product_id)
-            except Product.DoesNotExist:
-                return Response({"error": f"Mahsulot topilmadi: {product_id}"}, status=404)
-
-            # Narx va quantity/weight None emasligini tekshirish
-            if product.price is None:
-                return Response({"error": f"{product.name} mahsulotining narxi kiritilmagan."}, status=400)
-
-            if quantity is not None:
-                try:
-                    quantity = int(quantity)
-                except Exception:
-                    return Response({"error": f"{product.name} uchun quantity noto'g'ri."}, status=400)
-                if not product.quantity or product.quantity < quantity:
-                    return Response({"error": f"{product.name} mahsulotining yetarli soni yo'q."}, status=400)
-                sale_price = product.price * quantity
-                sale = Sale.objects.create(
-                    product=product,
-                    seller=request.user,
-                    buyer=unique_buyer,
-                    sale_price=sale_price,
-                    quantity=quantity,
-                    status='COMPLETED',
-                    payment_type=payment_type
-                )
-                sales.append({
-                    "product_id": product.id,
-                    "product_name": product.name,
-                    "quantity": quantity,
-                    "sale_price": str(sale.sale_price),
-                    "payment_type": sale.payment_type
-                })
-                total_price += sale_price
-            elif weight is not None:
-                try:
-                    weight_decimal = Decimal(str(weight))
-                except Exception:
-                    return Response({"error": f"{product.name} uchun weight noto'g'ri."}, status=400)
-                if not product.weight or product.weight < weight_decimal:
-                    return Response({"error": f"{product.name} mahsulotining yetarli og'irligi yo'q."}, status=400)
-                sale_price = product.price * weight_decimal
-                sale = Sale.objects.create(
-                    product=product,
-                    seller=request.user,
-                    buyer=unique_buyer,
-                    sale_price=sale_price,
-                    quantity=None,
-                    product_weight=weight_decimal,
-                    status='COMPLETED',
-                    payment_type=payment_type
-                )
-                sales.append({
-                    "product_id": product.id,
-                    "product_name": product.name,
-                    "weight": float(weight_decimal),
-                    "sale_price": str(sale.sale_price),
-                    "payment_type": sale.payment_type
-                })
-                total_price += sale_price
+        result = []
+        for sale in sales:
+            row = {"product_id": sale.product_id, "product_name": sale.product.name}
+            if sale.quantity is not None:
+                row["quantity"] = sale.quantity
             else:
-                return Response({"error": f"{product.name} uchun quantity yoki weight kiritilishi shart."}, status=400)
+                row["weight"] = float(sale.product_weight)
+            row.update({"sale_price": str(sale.sale_price), "payment_type": sale.payment_type})
+            result.append(row)
 
         return Response({
             "success": True,
             "message": "Barcha mahsulotlar sotildi",
-            "sales": sales,
-            "total_price": str(total_price)
+            "receipt_id": receipt.id,
+            "receipt_number": receipt.number,
+            "sales": result,
+            "total_price": str(receipt.total_price)
         })
 
 
 
+def is_sale_id(value):
+    # JSON dagi true/false ham int (bool) bo'lib keladi, ular id emas
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, int) or str(value).isdigit()
+
+
 class SaleCancelBulkView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
         sale_ids = request.data.get('ids', [])
         reason_cancelled = request.data.get('reason_cancelled', '')
-        if not sale_ids or not isinstance(sale_ids, list):
+        if (not sale_ids or not isinstance(sale_ids, list)
+                or not all(is_sale_id(sale_id) for sale_id in sale_ids)):
             return Response({"error": "ids ro'yxati yuboring"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        updated = 0
-        for sale_id in sale_ids:
-            try:
-                sale = Sale.objects.get(id=sale_id, seller=request.user)
-                sale.status = 'CANCELLED'
-                sale.reason_cancelled = reason_cancelled
-                sale.save()
-                updated += 1
-            except Sale.DoesNotExist:
-                continue  # Topilmasa, o'tkazib yuboriladi
+
+        # Topilmagan yoki boshqa sotuvchiga tegishli id lar o'tkazib yuboriladi
+        updated = cancel_sales(request.user, sale_ids, reason_cancelled)
 
         return Response({
             "success": True,
@@ -109,6 +109,31 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Statistika endpointlari javoblari (app/cache.py). Versiya hisoblagichi ham shu yerda,
+    # shuning uchun barcha worker jarayonlar uchun umumiy bo'lishi kerak (LocMem emas)
+    'statistics': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('STATISTICS_CACHE_DIR') or BASE_DIR / 'cache' / 'statistics',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+STATISTICS_CACHE_TIMEOUT = 300  # soniya
+# Statistika bloklarini parallel hisoblash uchun thread lar soni (1 - ketma-ket).
+# SQLite bitta faylni qulflaydi va har bir thread alohida ulanish ochadi: u yerda pool faqat sekinlashtiradi
+STATISTICS_MAX_WORKERS = 1 if DATABASES['default']['ENGINE'].endswith('sqlite3') else 4
+
+# Ixtiyoriy ustunli fakt nusxasi (app/factstore.py). numpy kerak: pip install -r requirements-factstore.txt
+# numpy o'rnatilmagan yoki None bo'lsa o'chirilgan, statistika rollup jadvallaridan hisoblanadi
+FACT_STORE_DIR = os.environ.get('FACT_STORE_DIR') or None
+FACT_STORE_MAX_AGE = 60  # soniya, shundan eski bo'lsa o'qishdan oldin yangilanadi
+FACT_STORE_OVERLAP = 300  # soniya, inkremental yangilanish oldingisidan shuncha oldindan boshlanadi
+FACT_STORE_MIN_INTERVAL = 5  # soniya, yangilanishlar orasidagi eng kichik vaqt (oraliqda SQL yo'li)
+FACT_STORE_MAX_SEGMENTS = 32  # shundan ko'p bo'lsa segmentlar bittaga siqiladi
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators